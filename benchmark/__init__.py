@@ -0,0 +1,9 @@
+"""
+This module is responsible for measuring export performance. It
+- Generates deterministic synthetic C/REF recordings with known tones at the frequency regions
+- Times every stage of the export pipeline separately (reading, combinations, fft, sheets, audio and graphs)
+- Sweeps over time fractions, region count and microphone count
+- Writes the results as json, so that runs can be compared over time
+
+Run it with `python -m benchmark --help`.
+"""
@@ -0,0 +1,32 @@
+"""
+Command line entry point of the benchmark. Example:
+
+```sh
+python -m benchmark --mics 2 6 --fractions 14 --regions 7 --duration 30
+```
+"""
+import argparse
+import os
+from datetime import datetime
+
+from benchmark.stages import stage_names
+from benchmark.sweep import run_sweep, write_results
+
+parser = argparse.ArgumentParser(prog='python -m benchmark', description='Benchmark export stages.')
+parser.add_argument('--mics', type=int, nargs='+', default=[1, 2, 4, 6], help='microphone counts')
+parser.add_argument('--fractions', type=int, nargs='+', default=[4, 14], help='time fraction counts')
+parser.add_argument('--regions', type=int, nargs='+', default=[4, 7], help='frequency region counts')
+parser.add_argument('--duration', type=float, default=10, help='length of recordings in seconds')
+parser.add_argument('--samplerate', type=int, default=48000, help='sample rate of recordings')
+parser.add_argument('--repeat', type=int, default=1, help='repetitions of each measurement')
+parser.add_argument('--stages', nargs='+', default=list(stage_names), choices=stage_names, help='stages to measure')
+parser.add_argument('--output', default=os.path.join(
+    'benchmark', 'results', f"{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"), help='json file to write')
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    results = run_sweep(args.mics, args.fractions, args.regions, args.duration, args.samplerate, args.repeat,
+                        args.stages)
+    write_results(args.output, results)
+    print(f'Results written to {args.output}')
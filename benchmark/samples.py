@@ -0,0 +1,94 @@
+"""
+Deterministic generator of synthetic multi-microphone recordings. Every generated file contains one sine tone in the
+middle of each frequency region, with amplitude and phase that depend on the microphone, plus a little white noise.
+The same arguments always produce exactly the same files.
+"""
+import os
+
+import numpy as np
+
+from signal_processing.signals import Signal, write_signal
+
+# Regions from the default selected_files.json, used when no regions are passed.
+default_regions = [(72, 74), (219, 221), (442, 444), (878, 880), (1384, 1386), (1772, 1774), (2196, 2198)]
+
+
+def get_regions(count: int) -> [(int, int)]:
+    """
+    :return: List of frequency regions with the given length. The default regions are used first, and if more are
+    needed, extra 2Hz wide regions are placed on a logarithmic scale above them.
+    :param count: Number of regions to return.
+    """
+    regions = default_regions[:count]
+    extra = count - len(regions)
+    if extra > 0:
+        starts = np.geomspace(2500, 8000, extra).astype(int)
+        regions += [(int(s), int(s) + 2) for s in starts]
+    return regions
+
+
+def create_tones(mic_count: int, regions: [(int, int)], duration: float, samplerate: int, seed: int,
+                 noise_level: float = 0.001) -> [Signal]:
+    """
+    :return: One float32 signal per microphone.
+    :param mic_count: Number of microphones to generate.
+    :param regions: Frequency regions, a tone is placed at the center of each of them.
+    :param duration: Length of the signals in seconds.
+    :param samplerate: Sample rate of the signals.
+    :param seed: Seed for amplitudes, phases and noise.
+    :param noise_level: Amplitude of the white noise added to each signal.
+    """
+    rng = np.random.default_rng(seed)
+    length = int(duration * samplerate)
+    t = np.arange(length) / samplerate
+    frequencies = get_tone_frequencies(regions)
+    amplitude_scale = 0.5 / max(len(frequencies), 1)
+
+    mic_signals = []
+    for _ in range(mic_count):
+        data = np.zeros(length)
+        amplitudes = rng.uniform(0.2, 1.0, len(frequencies)) * amplitude_scale
+        phases = rng.uniform(0, 2 * np.pi, len(frequencies))
+        for frequency, amplitude, phase in zip(frequencies, amplitudes, phases):
+            data += amplitude * np.sin(2 * np.pi * frequency * t + phase)
+        data += rng.normal(0, noise_level, length)
+        mic_signals.append(Signal(samplerate, data.astype(np.float32)))
+
+    return mic_signals
+
+
+def get_tone_frequencies(regions: [(int, int)]) -> [float]:
+    """
+    :return: Frequencies of the generated tones, one for each region.
+    """
+    return [(start + end) / 2 for start, end in regions]
+
+
+def create_recordings(folder: str, mic_count: int, regions: [(int, int)] = None, duration: float = 10,
+                      samplerate: int = 48000, seed: int = 0) -> ([str], [str]):
+    """
+    Writes C and REF recordings to the given folder. Files are named the same way as the real recordings,
+    e.g. "C MIC1.wav" and "REF MIC1.wav". C and REF use different seeds, so their amplitudes and phases differ.
+
+    :return: Tuple of C file paths and REF file paths.
+    :param folder: Folder to write the files to. Created if it doesn't exist.
+    :param mic_count: Number of microphones, usually 1, 2, 4 or 6.
+    :param regions: Frequency regions to place the tones in. Defaults to the first four default regions.
+    :param duration: Length of the recordings in seconds.
+    :param samplerate: Sample rate of the recordings.
+    :param seed: Base seed of the generator.
+    """
+    if regions is None:
+        regions = get_regions(4)
+    os.makedirs(folder, exist_ok=True)
+
+    files = {}
+    for offset, name in enumerate(['C', 'REF']):
+        mic_signals = create_tones(mic_count, regions, duration, samplerate, seed * 2 + offset)
+        files[name] = []
+        for i, signal in enumerate(mic_signals):
+            file_name = os.path.join(folder, f'{name} MIC{i + 1}.wav')
+            write_signal(file_name, signal)
+            files[name].append(file_name)
+
+    return files['C'], files['REF']
@@ -0,0 +1,99 @@
+"""
+Times every stage of the export pipeline separately. The stages are run the same way export.export.create_export
+runs them, but each one is wrapped with a timer.
+"""
+import importlib.util
+import time
+from contextlib import contextmanager
+
+from openpyxl.reader.excel import load_workbook
+
+from config import ExportConfig
+from export import wav_export, fft_export, fft_report
+from export.sheet_export import sheet_export
+from export.sheet_export.utils import save_workbook
+from signal_processing import fft, signals
+from signal_processing.signals import SignalRecording
+
+stage_names = ('read', 'combinations', 'fft', 'peaks', 'sheet', 'save', 'wav', 'png')
+
+
+@contextmanager
+def timed(timings: dict, name: str):
+    """
+    Context manager that adds the elapsed wall time (in seconds) to timings[name].
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0) + time.perf_counter() - start
+
+
+def can_export_png() -> bool:
+    """
+    :return: Whether plotly can write images, which needs the kaleido package.
+    """
+    return importlib.util.find_spec('kaleido') is not None
+
+
+def run_stages(export_config: ExportConfig, stages=stage_names, log=lambda x: None) -> dict[str, float]:
+    """
+    Runs the export pipeline stage by stage and measures each of them.
+
+    :return: Dictionary of stage name to elapsed seconds. Stages that were skipped are not included.
+    :param export_config: Configuration of the export. Destination folder should point to a temporary folder.
+    :param stages: Names of the stages to run. Reading and combinations are always run, because all others need them.
+    Saving is only measured together with the sheet stage.
+    :param log: function that takes a string and prints it somewhere.
+    """
+    timings = {}
+    fractions = export_config.time_fractions
+    regions = export_config.frequency_regions
+
+    with timed(timings, 'read'):
+        c_signal = SignalRecording(export_config.c_files)
+        c_signal.read_files()
+        ref_signal = SignalRecording(export_config.ref_files)
+        ref_signal.read_files()
+
+    with timed(timings, 'combinations'):
+        s1_sums, s2_sums, sd1, sd2 = signals.create_signal_combinations(c_signal, ref_signal)
+
+    # FFT and peak extraction are interleaved, so that only one spectrum is alive at a time
+    if 'fft' in stages or 'peaks' in stages:
+        for sums in [s1_sums, s2_sums, sd1, sd2]:
+            for t in range(fractions):
+                for signal_sum in sums:
+                    with timed(timings, 'fft'):
+                        full_fft = fft.create_fft(signal_sum.get_interval_fraction(fractions, t))
+                    with timed(timings, 'peaks'):
+                        for start, end in regions:
+                            s, e = full_fft.get_frequency_region(start, end)
+                            full_fft.get_region(s, e).get_max_amplitude()
+
+    if 'sheet' in stages:
+        with timed(timings, 'sheet'):
+            sheet_export.create_export(s1_sums, s2_sums, sd1, sd2, export_config, log)
+
+    if 'save' in stages and 'sheet' in stages:
+        # Sheet export saves several times while building, so a single save of the final workbook is measured
+        out_wb = load_workbook(export_config.sheet_path())
+        with timed(timings, 'save'):
+            save_workbook(out_wb, export_config.sheet_path())
+
+    if 'wav' in stages:
+        with timed(timings, 'wav'):
+            wav_export.create_export(s1_sums, s2_sums, sd1, export_config, log)
+
+    if 'png' in stages and export_config.plot_backend == 'html':
+        with timed(timings, 'png'):
+            fft_report.create_export(s1_sums, s2_sums, sd1, export_config, log)
+    elif 'png' in stages:
+        if export_config.plot_backend != 'plotly' or can_export_png():
+            with timed(timings, 'png'):
+                fft_export.create_export(s1_sums, s2_sums, sd1, export_config, log)
+        else:
+            log('kaleido is not installed, skipping png stage')
+
+    return timings
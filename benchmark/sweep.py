@@ -0,0 +1,105 @@
+"""
+Runs the stage benchmark over a grid of microphone counts, time fractions and region counts and saves the results
+as json. Every result file contains information about the machine, so that results from different runs can be
+compared over time.
+"""
+import itertools
+import json
+import os
+import platform
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import scipy
+
+from benchmark.samples import create_recordings, get_regions
+from benchmark.stages import run_stages, stage_names
+from config import ExportConfig
+
+
+def run_sweep(mic_counts=(1, 2, 4, 6), time_fractions=(4, 14), region_counts=(4, 7), duration: float = 10,
+              samplerate: int = 48000, repeat: int = 1, stages=stage_names, seed: int = 0, log=print) -> [dict]:
+    """
+    Runs the benchmark for every combination of the given parameters.
+
+    :return: List of results. Each result holds the parameters and the timings of each repetition.
+    :param mic_counts: Microphone counts to benchmark.
+    :param time_fractions: Time fraction counts to benchmark.
+    :param region_counts: Frequency region counts to benchmark.
+    :param duration: Length of the generated recordings in seconds.
+    :param samplerate: Sample rate of the generated recordings.
+    :param repeat: How many times to repeat each measurement.
+    :param stages: Stages to measure, see benchmark.stages.stage_names.
+    :param seed: Seed of the recording generator.
+    :param log: function that takes a string and prints it somewhere.
+    """
+    results = []
+    work_dir = tempfile.mkdtemp(prefix='holoscopy_benchmark_')
+    try:
+        for mic_count, region_count in itertools.product(mic_counts, region_counts):
+            regions = get_regions(region_count)
+            c_files, ref_files = create_recordings(os.path.join(work_dir, 'input'), mic_count, regions,
+                                                   duration, samplerate, seed)
+            for fractions in time_fractions:
+                log(f'benchmarking {mic_count} mics, {fractions} fractions, {region_count} regions')
+                runs = []
+                for r in range(repeat):
+                    export_config = ExportConfig(c_files=c_files, ref_files=ref_files,
+                                                 time_fractions=fractions, frequency_regions=regions,
+                                                 json_load_path=None,
+                                                 _destination_folder=os.path.join(work_dir, f'export_{r}'))
+                    runs.append(run_stages(export_config, stages))
+                    shutil.rmtree(export_config._destination_folder, ignore_errors=True)
+
+                results.append({
+                    'mic_count': mic_count,
+                    'time_fractions': fractions,
+                    'region_count': region_count,
+                    'duration': duration,
+                    'samplerate': samplerate,
+                    'runs': runs,
+                    'best': {name: min(run[name] for run in runs) for name in runs[0]},
+                })
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def get_machine_info() -> dict:
+    """
+    :return: Information about the machine and library versions that influence the results.
+    """
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+    }
+
+
+def write_results(path: str, results: [dict]):
+    """
+    Writes the results along with machine info and a timestamp into a json file.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'machine': get_machine_info(),
+            'results': results,
+        }, file, indent=2)
+
+
+def read_results(path: str) -> [dict]:
+    """
+    :return: Results from a json file written by write_results.
+    """
+    with open(path, 'r') as file:
+        return json.load(file)['results']
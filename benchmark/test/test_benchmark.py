@@ -0,0 +1,60 @@
+"""
+This module tests the synthetic recording generator and the stage benchmark. It verifies that recordings are
+deterministic, contain the tones at the configured regions, and that a small sweep produces timings for each stage.
+"""
+import json
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings, get_regions, get_tone_frequencies
+from benchmark.sweep import run_sweep, write_results, read_results
+from signal_processing import fft, signals
+
+
+def test_get_regions():
+    assert get_regions(4) == [(72, 74), (219, 221), (442, 444), (878, 880)]
+    regions = get_regions(10)
+    assert len(regions) == 10
+    assert len(set(regions)) == 10
+
+
+@pytest.mark.parametrize('mic_count', [1, 2, 4, 6])
+def test_create_recordings(tmp_path, mic_count):
+    c_files, ref_files = create_recordings(str(tmp_path), mic_count, duration=0.5)
+    assert len(c_files) == mic_count
+    assert len(ref_files) == mic_count
+
+    signal = signals.read_signal(c_files[0])
+    assert signal.samplerate == 48000
+    assert signal.length == 24000
+    assert signal.data.dtype == np.float32
+
+
+def test_create_recordings_deterministic(tmp_path):
+    c_files_1, _ = create_recordings(str(tmp_path / 'first'), 2, duration=0.5, seed=3)
+    c_files_2, _ = create_recordings(str(tmp_path / 'second'), 2, duration=0.5, seed=3)
+    for file_1, file_2 in zip(c_files_1, c_files_2):
+        np.testing.assert_array_equal(signals.read_signal(file_1).data, signals.read_signal(file_2).data)
+
+
+def test_create_recordings_tones(tmp_path):
+    regions = get_regions(4)
+    c_files, ref_files = create_recordings(str(tmp_path), 1, regions, duration=2)
+    full_fft = fft.create_fft(signals.read_signal(c_files[0]))
+    for (start, end), frequency in zip(regions, get_tone_frequencies(regions)):
+        s, e = full_fft.get_frequency_region(start - 1, end + 1)
+        peak_frequency, _ = full_fft.get_region(s, e).get_max_amplitude()
+        assert abs(peak_frequency - frequency) <= 0.5
+
+
+@pytest.mark.slow
+def test_run_sweep(tmp_path):
+    results = run_sweep(mic_counts=[2], time_fractions=[2], region_counts=[2], duration=0.5,
+                        stages=['fft', 'peaks', 'sheet', 'save', 'wav'], log=lambda x: None)
+    assert len(results) == 1
+    assert set(results[0]['best'].keys()) == {'read', 'combinations', 'fft', 'peaks', 'sheet', 'save', 'wav'}
+
+    path = str(tmp_path / 'results.json')
+    write_results(path, results)
+    assert read_results(path) == json.loads(json.dumps(results))
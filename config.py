@@ -31,6 +31,18 @@ class ExportConfig:
     time_fractions: int = 10
     export_audio: bool = False
     export_fft: bool = False
+    # files writes a .wav for every fraction and signal set, multichannel a .wav for every fraction with a channel
+    # for each signal set, continuous a .wav for every signal set with the fractions marked by cue points
+    wav_layout: Literal['files', 'multichannel', 'continuous'] = 'files'
+    export_spectrogram: bool = False
+    spectrogram_window: int = 16384  # Samples per frame, 2.9 Hz resolution at 48 kHz
+    spectrogram_hop: int = 4096  # Samples between the starts of frames
+    export_spectra: bool = False  # Write the dB spectra of every fraction into memory mappable .npy files
+    export_peaks: bool = False  # Write the measurements of the fraction sheets as a table
+    peaks_format: Literal['csv', 'npy'] = 'csv'  # npy writes a folder with a binary file for each column
+    bundle_artifacts: bool = False  # Write audio, fft graphs, spectrograms and spectra into a single zip file
+    bundle_compression: Literal['stored', 'deflated'] = 'stored'
+    results_database: Optional[str] = None  # SQLite database that collects the results of many runs
     frequency_regions: list[(int, int)] = field(default_factory=lambda: [
         [72, 74],
         [219, 221],
@@ -39,6 +51,15 @@ class ExportConfig:
     ])
     c_name: str = 'C1'
     ref_name: str = 'REF'
+    collect_metrics: bool = False  # Write a json report with stage timings and counters next to the sheet
+    trace: bool = False  # Write a Chrome trace-event timeline of the run next to the sheet
+    profile_memory: bool = False  # Add per-stage memory usage to the run report, implies collect_metrics
+    memory_budget_mb: Optional[float] = None  # Fail the run early if it would use more memory than this
+    deadline_seconds: Optional[float] = None  # Cancel the run if it takes longer than this
+    resume: bool = False  # Continue an interrupted export from the checkpoint in the destination folder
+    png_workers: Optional[int] = None  # Processes that render fft graphs, None picks one from the cpu count
+    # svg and png draw fft graphs without a browser, html writes all of them into a single interactive report
+    plot_backend: Literal['plotly', 'svg', 'png', 'html'] = 'plotly'
 
     def __post_init__(self, json_load_path):
         # Do not load anything if json_load_path is None
@@ -103,6 +124,34 @@ class ExportConfig:
     def sheet_path(self) -> str:
         return os.path.join(self._destination_folder, f'{self._sheet_name()}.xlsx')
 
+    def report_path(self) -> str:
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_report.json')
+
+    def trace_path(self) -> str:
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_trace.json')
+
+    def fft_report_path(self) -> str:
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_fft.html')
+
+    def incomplete_path(self) -> str:
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_incomplete.json')
+
+    def bundle_path(self) -> str:
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_fractions.zip')
+
+    def peaks_path(self) -> str:
+        extension = '.csv' if self.peaks_format == 'csv' else ''
+        return os.path.join(self._destination_folder, f'{self._sheet_name()}_peaks{extension}')
+
+    def spectrograms_path(self) -> str:
+        return os.path.join(self._destination_folder, 'Spectrograms')
+
+    def spectra_path(self) -> str:
+        return os.path.join(self._destination_folder, 'Spectra')
+
+    def checkpoint_path(self) -> str:
+        return os.path.join(self._destination_folder, 'Checkpoint')
+
     def fractions_path(self) -> str:
         return os.path.join(self._destination_folder, 'Fractions')
 
@@ -1,3 +1,5 @@
 from desktop_ui.interface import AudioInterface
 
-AudioInterface()
+# FFT graphs are rendered in worker processes, which import the main module again on macOS and Windows
+if __name__ == '__main__':
+    AudioInterface()
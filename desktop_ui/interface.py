@@ -3,29 +3,54 @@ This module defines the AudioInterface class for audio analysis.
 
 It provides a graphical user interface for selecting audio files and configuring analysis parameters.
 
+Exports are queued in a JobQueue, which runs a few of them at a time in worker threads. The workers never touch Tk
+objects. Their log messages, and calls that store their progress by job number, are put into a queue, which the Tk
+thread drains in batches every poll_ms milliseconds. Decoded recordings and their combinations stay in a
+RecordingCache for the session, so another export of the same files, e.g. with other regions, starts with the
+analysis.
 """
 import json
 import os.path
+import queue
 import config
-from tkinter import Tk, filedialog, messagebox, Text, END, IntVar, StringVar, BooleanVar
+from tkinter import Tk, filedialog, messagebox, Text, END, IntVar, StringVar, BooleanVar, TclError
 from tkinter import ttk
 from threading import Thread
 
 from signal_processing.signals import get_signal_sets
-from export import export
+from export import planner
+from export.jobs import ExportJob, JobQueue
+from export.preview import Preview, create_preview
+from export.recordings import RecordingCache
+from signal_processing.headers import check_wav_files
+from export.progress import ProgressAggregator, ProgressStatus, format_status
+
+poll_ms = 100  # How often the messages of the workers are shown
+poll_batch = 1000  # Most messages shown per poll, so the window stays responsive
+log_lines = 5000  # Lines kept in the logbox, older lines are removed
+recording_cache_mb = 2048  # Decoded recordings kept between exports, the least recently used are dropped
+close_timeout = 5  # Seconds the window waits on close for cancelled exports to write their incomplete markers
 
 
 class AudioInterface:
-    tasks = []
     ref_files_list_label = None
     c_files_list_label = None
     logbox = None
+    progress_bar = None
+    progress_label = None
+    preview_table = None
+    jobs_table = None
 
     def __init__(self):
         """
         Initialize the AudioInterface class.
         """
         self.root = Tk()
+        # Log strings and functions for the Tk thread from the workers, see poll_messages
+        self.messages = queue.SimpleQueue()
+        # Last status of each stage of the exports that didn't finish, by job number
+        self.job_progress: dict[int, dict[str, ProgressStatus]] = {}
+        self.job_queue = JobQueue(log=self.log, recordings=RecordingCache(recording_cache_mb * 2 ** 20))
 
         # Load default data
         export_config = config.ExportConfig()
@@ -35,6 +60,13 @@ class AudioInterface:
         self.ref_name: StringVar = StringVar(value=export_config.ref_name)
         self.export_audio_checkbox = BooleanVar(value=export_config.export_audio)
         self.export_fft_checkbox = BooleanVar(value=export_config.export_fft)
+        self.export_spectrogram_checkbox = BooleanVar(value=export_config.export_spectrogram)
+        self.export_spectra_checkbox = BooleanVar(value=export_config.export_spectra)
+        self.export_peaks_checkbox = BooleanVar(value=export_config.export_peaks)
+        self.bundle_checkbox = BooleanVar(value=export_config.bundle_artifacts)
+        self.plot_backend: StringVar = StringVar(value=export_config.plot_backend)
+        self.wav_layout: StringVar = StringVar(value=export_config.wav_layout)
+        self.concurrency: IntVar = IntVar(value=self.job_queue.concurrency)
         self.regions = export_config.frequency_regions
         self.c_files = export_config.c_files
         self.ref_files = export_config.ref_files
@@ -70,6 +102,26 @@ class AudioInterface:
         self.update_files('ref', self.ref_files)
 
         ttk.Button(frm, text="Run analysis", command=self.run_analysis).grid(column=2, row=0, sticky='nsew')
+        ttk.Button(frm, text="Cancel export", command=self.cancel_exports).grid(column=2, row=3, sticky='nsew')
+        self.progress_bar = ttk.Progressbar(frm, maximum=1.0)
+        self.progress_bar.grid(column=0, columnspan=2, row=3, sticky='nsew')
+        self.progress_label = ttk.Label(frm, text='')
+        self.progress_label.grid(column=0, columnspan=2, row=4, sticky='w')
+        ttk.Button(frm, text="Preview", command=self.run_preview).grid(column=2, row=4, sticky='nsew')
+
+        # Peaks of the preview, one row per region
+        columns = ('region', 'c', 'ref', 'ad')
+        self.preview_table = ttk.Treeview(frm, columns=columns, show='headings', height=4)
+        for column, heading in zip(columns, ('Region', 'C peak', 'REF peak', 'AD')):
+            self.preview_table.heading(column, text=heading)
+        self.preview_table.grid(column=0, columnspan=3, row=5, sticky='nsew')
+
+        # Queued and finished exports, with their status and timings
+        columns = ('job', 'status', 'waited', 'ran', 'progress')
+        self.jobs_table = ttk.Treeview(frm, columns=columns, show='headings', height=4)
+        for column, heading in zip(columns, ('Export', 'Status', 'Queued', 'Running', 'Progress')):
+            self.jobs_table.heading(column, text=heading)
+        self.jobs_table.grid(column=0, columnspan=3, row=6, sticky='nsew')
 
         self.logbox = Text(frm)
         self.logbox.insert(END, "Logs will show up here\n")
@@ -82,6 +134,7 @@ class AudioInterface:
         self.logbox['yscrollcommand'] = scrollbar.set
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(poll_ms, self.poll_messages)
         self.root.mainloop()
 
     def get_input_frame(self, parent) -> ttk.Frame:
@@ -160,16 +213,35 @@ class AudioInterface:
         show_input_frame(main_frame, 'Time Fractions: ', self.time_fractions)
         show_input_frame(main_frame, 'C Column Name: ', self.c_name)
         show_input_frame(main_frame, 'Ref Column Name: ', self.ref_name)
+        show_input_frame(main_frame, 'Parallel Exports: ', self.concurrency)
         ttk.Checkbutton(main_frame, text='Export .wav Fractions', variable=self.export_audio_checkbox) \
             .pack(side='top')
         ttk.Checkbutton(main_frame, text='Export FFT Graphs', variable=self.export_fft_checkbox) \
             .pack(side='top')
+        ttk.Checkbutton(main_frame, text='Export Spectrograms', variable=self.export_spectrogram_checkbox) \
+            .pack(side='top')
+        ttk.Checkbutton(main_frame, text='Export Raw Spectra', variable=self.export_spectra_checkbox) \
+            .pack(side='top')
+        ttk.Checkbutton(main_frame, text='Export Peak Table (.csv)', variable=self.export_peaks_checkbox) \
+            .pack(side='top')
+        ttk.Checkbutton(main_frame, text='Bundle Files Into .zip', variable=self.bundle_checkbox) \
+            .pack(side='top')
+        frame = ttk.Frame(main_frame)
+        frame.pack(side='top')
+        ttk.Label(frame, text='FFT Graphs As: ', width=14).pack(side='left')
+        ttk.Combobox(frame, width=6, textvariable=self.plot_backend, values=['plotly', 'svg', 'png', 'html'],
+                     state='readonly').pack(side='left')
+        frame = ttk.Frame(main_frame)
+        frame.pack(side='top')
+        ttk.Label(frame, text='WAV Files As: ', width=14).pack(side='left')
+        ttk.Combobox(frame, width=12, textvariable=self.wav_layout, values=['files', 'multichannel', 'continuous'],
+                     state='readonly').pack(side='left')
 
         return main_frame
 
     def on_close(self):
         """
-        Save current data to a json file and close the window.
+        Save current data to a json file, cancel every export and close the window.
         """
         try:
             export_config = config.ExportConfig(c_files=self.c_files, ref_files=self.ref_files,
@@ -184,10 +256,21 @@ class AudioInterface:
         except Exception as e:
             messagebox.showerror(title='could not save data', message=str(e))
 
-        for task in self.tasks:
-            task.cancel()
+        # Running exports stop at the next block and mark their folders as incomplete
+        self.job_queue.cancel_all()
+        self.job_queue.wait(close_timeout)
         self.root.destroy()
 
+    def cancel_exports(self):
+        """
+        Cancel the selected exports, or all of them if none is selected. Running exports stop at the next time
+        fraction.
+        """
+        selected = {int(row) for row in self.jobs_table.selection()} if self.jobs_table else set()
+        for job in list(self.job_queue.jobs):
+            if not selected or job.number in selected:
+                self.job_queue.cancel(job)
+
     def open_files(self, files_category):
         """
         Open a file dialog for selecting files.
@@ -217,33 +300,153 @@ class AudioInterface:
         files_list += '\n  '.join([os.path.basename(x) for x in selected_files])
         self.__getattribute__(attr_name).config(text=files_list)
 
-    def run_analysis(self):
+    def check_files(self) -> bool:
         """
-        Run the analysis based on the current data.
+        Show an error if the selected files can't be analyzed.
         """
         if len(self.c_files) == 0 or len(self.ref_files) == 0:
             messagebox.showerror(title='cannot export', message='files not selected')
-            return
+            return False
         if len(self.c_files) != len(self.ref_files):
             messagebox.showerror(title='cannot export', message='number of files must be equal')
-            return
+            return False
         try:
             get_signal_sets(len(self.c_files))
         except Exception as e:
             messagebox.showerror(title='cannot export', message=str(e))
+            return False
+        return True
+
+    def get_export_config(self) -> config.ExportConfig:
+        """
+        Create export config using current data.
+        """
+        return config.ExportConfig(c_files=self.c_files, ref_files=self.ref_files,
+                                   c_name=self.c_name.get(), ref_name=self.ref_name.get(),
+                                   time_fractions=self.time_fractions.get(),
+                                   export_audio=self.export_audio_checkbox.get(),
+                                   export_fft=self.export_fft_checkbox.get(),
+                                   wav_layout=self.wav_layout.get(),
+                                   export_spectrogram=self.export_spectrogram_checkbox.get(),
+                                   export_spectra=self.export_spectra_checkbox.get(),
+                                   export_peaks=self.export_peaks_checkbox.get(),
+                                   bundle_artifacts=self.bundle_checkbox.get(),
+                                   plot_backend=self.plot_backend.get(),
+                                   frequency_regions=self.regions, json_load_path=None)
+
+    def run_preview(self):
+        """
+        Analyze the start of the selected files in the background and show the peaks of every region.
+        """
+        if not self.check_files():
             return
+        export_config = self.get_export_config()
+        self.preview_table.delete(*self.preview_table.get_children())
+        Thread(target=self.create_preview, args=(export_config,), daemon=True).start()
 
-        # Create export config using current data
-        export_config = config.ExportConfig(c_files=self.c_files, ref_files=self.ref_files,
-                                            c_name=self.c_name.get(), ref_name=self.ref_name.get(),
-                                            time_fractions=self.time_fractions.get(),
-                                            export_audio=self.export_audio_checkbox.get(),
-                                            export_fft=self.export_fft_checkbox.get(),
-                                            frequency_regions=self.regions, json_load_path=None)
+    def create_preview(self, export_config):
+        """
+        Create the preview in the calling thread, and queue showing it on the Tk thread.
+        """
+        try:
+            preview = create_preview(export_config)
+        except Exception as e:
+            # Any error is shown, the thread would end without a trace otherwise
+            error = str(e) if isinstance(e, (OSError, ValueError)) else f'{type(e).__name__}: {e}'
+            self.messages.put(lambda: messagebox.showerror(title='cannot preview', message=error))
+            return
+        self.log(preview.format())
+        self.messages.put(lambda: self.show_preview(preview))
 
-        thread = Thread(target=export.create_export, args=(export_config, self.log), daemon=True)
+    def show_preview(self, preview: Preview):
+        for r, (start, end) in enumerate(preview.regions):
+            self.preview_table.insert('', END, values=(
+                f'{start}-{end}Hz',
+                f'{preview.frequencies[0, r]:.2f}Hz {preview.amplitudes[0, r]:.1f}dB',
+                f'{preview.frequencies[1, r]:.2f}Hz {preview.amplitudes[1, r]:.1f}dB',
+                f'{preview.ad[r]:.1f}dB'))
 
-        thread.start()
+    def run_analysis(self):
+        """
+        Run the analysis based on the current data.
+        """
+        if not self.check_files():
+            return
+        export_config = self.get_export_config()
+
+        # Mismatched files are found from their headers, before any recording is read
+        check = check_wav_files(export_config.c_files, export_config.ref_files)
+        if not check.ok:
+            messagebox.showerror(title='cannot export', message=check.format())
+            return
+        if check.warnings:
+            self.log(check.format())
+
+        # Show the estimated resources before starting, a large export can take hours
+        try:
+            plan = planner.plan_export(export_config)
+        except (OSError, ValueError) as e:
+            messagebox.showerror(title='cannot export', message=str(e))
+            return
+        self.log(plan.format())
+        if not messagebox.askokcancel(title='start export', message=plan.format()):
+            return
+
+        try:
+            self.job_queue.set_concurrency(max(1, self.concurrency.get()))
+        except TclError:
+            pass
+        # Statuses are handled by the Tk thread after this method returned, so job is always set by then
+        progress = ProgressAggregator(lambda status: self.messages.put(lambda: self.update_progress(job, status)))
+        job = self.job_queue.submit(export_config, progress)
+        self.log(f'Queued export {job.name} into {os.path.dirname(export_config.sheet_path())}')
+
+    def show_jobs(self):
+        """
+        Show the status and timings of every export of the job queue.
+        """
+        jobs = list(self.job_queue.jobs)
+        # Progress of finished and cancelled jobs is dropped
+        for number in set(self.job_progress) - {job.number for job in jobs if not job.done}:
+            del self.job_progress[number]
+
+        for job in jobs:
+            ran = f'{job.seconds:.0f}s' if job.seconds is not None else ''
+            status = f'{job.status}: {job.error}' if job.error else job.status
+            stages = self.job_progress.get(job.number)
+            progress = format_status(list(stages.values())[-1]) if stages else ''
+            values = (job.name, status, f'{job.waited:.0f}s', ran, progress)
+            if self.jobs_table.exists(str(job.number)):
+                self.jobs_table.item(str(job.number), values=values)
+            else:
+                self.jobs_table.insert('', END, iid=str(job.number), values=values)
+
+    def update_progress(self, job: ExportJob, status: ProgressStatus):
+        """
+        Keeps the last status of each stage of a job, the stage that advanced last at the end.
+        """
+        if job.done:
+            return
+        stages = self.job_progress.setdefault(job.number, {})
+        stages.pop(status.event.stage, None)
+        stages[status.event.stage] = status
+
+    def show_progress(self):
+        """
+        Show the progress of the selected export, or of the first running one, in the progress bar and label.
+        """
+        jobs = list(self.job_queue.jobs)
+        selected = {int(row) for row in self.jobs_table.selection()}
+        job = next((job for job in jobs if job.number in selected), None) or \
+            next((job for job in jobs if job.status == 'running'), None)
+        stages = self.job_progress.get(job.number) if job is not None else None
+        if not stages:
+            return
+        # The bar follows the pass over the fractions, the label shows whichever stage advanced last
+        if 'analysis' in stages:
+            event = stages['analysis'].event
+            self.progress_bar['value'] = event.done / event.total
+        self.progress_label.config(text=f'{job.name} {format_status(list(stages.values())[-1])}')
 
     # Modified version of https://stackoverflow.com/a/60034559
     @staticmethod
@@ -257,8 +460,34 @@ class AudioInterface:
 
     def log(self, text, end='\n'):
         """
-        Log a message to the logbox.
+        Log a message to the logbox. Can be called from any thread, the message is shown by poll_messages.
         """
         print(text, end=end)
-        self.logbox.insert(END, text + end)
-        self.logbox.yview(END)
+        self.messages.put(text + end)
+
+    def poll_messages(self):
+        """
+        Shows the queued log messages and the progress of the exports, calls the queued functions, and polls again
+        after poll_ms.
+        """
+        lines = []
+        for _ in range(poll_batch):
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if callable(message):
+                message()
+            else:
+                lines.append(message)
+
+        if lines:
+            self.logbox.insert(END, ''.join(lines))
+            line_count = int(self.logbox.index('end-1c').split('.')[0])
+            if line_count > log_lines:
+                self.logbox.delete('1.0', f'{line_count - log_lines + 1}.0')
+            self.logbox.yview(END)
+        self.show_jobs()
+        self.show_progress()
+
+        self.root.after(poll_ms, self.poll_messages)
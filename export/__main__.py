@@ -0,0 +1,90 @@
+"""
+Command line entry point of the export. Files and parameters are loaded from selected_files.json, the same file the
+desktop UI saves on close. The headers of the recordings are checked, and the estimated resources are printed, before
+the export starts. Example:
+
+```sh
+python -m export --audio --destination ~/Downloads/Export --dry-run
+```
+"""
+import argparse
+import os
+import sys
+
+from config import ExportConfig
+from export.cancellation import ExportCancelled
+from export.export import create_export
+from export.planner import load_calibration, plan_export
+from export.progress import ProgressAggregator, format_status
+from signal_processing.headers import check_wav_files
+
+parser = argparse.ArgumentParser(prog='python -m export', description='Export analysis of selected recordings.')
+parser.add_argument('--files', default='selected_files.json', help='json file with selected files and parameters')
+parser.add_argument('--destination', help='folder to export to, defaults to a new folder in ~/Downloads')
+parser.add_argument('--fractions', type=int, help='time fractions, overrides the json file')
+parser.add_argument('--audio', action='store_true', help='export .wav files of each fraction')
+parser.add_argument('--wav-layout', default='files', choices=['files', 'multichannel', 'continuous'],
+                    help='one .wav per fraction and set, per fraction with sets as channels, or per set')
+parser.add_argument('--fft', action='store_true', help='export fft graphs of each fraction')
+parser.add_argument('--metrics', action='store_true', help='write a json run report next to the sheet')
+parser.add_argument('--trace', action='store_true', help='write a trace-event timeline next to the sheet')
+parser.add_argument('--profile-memory', action='store_true', help='add per-stage memory usage to the run report')
+parser.add_argument('--memory-budget', type=float, help='fail early if the run would use more megabytes than this')
+parser.add_argument('--deadline', type=float, help='cancel the run if it takes longer than this many seconds')
+parser.add_argument('--resume', action='store_true',
+                    help='continue an interrupted export into --destination without analyzing its finished fractions')
+parser.add_argument('--spectrogram', action='store_true', help='export a spectrogram of the whole recording')
+parser.add_argument('--spectra', action='store_true', help='export the dB spectra of each fraction as .npy files')
+parser.add_argument('--peaks', choices=['csv', 'npy'], help='export the measurements of the sheets as a table')
+parser.add_argument('--bundle', choices=['stored', 'deflated'],
+                    help='write audio, fft graphs, spectrograms and spectra into a single zip file')
+parser.add_argument('--database', help='SQLite database to add the results of this run to')
+parser.add_argument('--plot-backend', default='plotly', choices=['plotly', 'svg', 'png', 'html'],
+                    help='how fft graphs are drawn, svg and png do not need a browser, html writes one report')
+parser.add_argument('--png-workers', type=int, help='processes that render fft graphs')
+parser.add_argument('--calibration', help='benchmark results used to estimate runtime, defaults to the newest')
+parser.add_argument('--progress', action='store_true', help='print throughput and remaining time of each stage')
+parser.add_argument('--dry-run', action='store_true', help='only print the estimated resources')
+
+# FFT graphs are rendered in worker processes, which import the main module again on macOS and Windows
+if __name__ == '__main__':
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.files):
+        parser.error(f'{args.files} does not exist, select files in the desktop UI first')
+    if args.resume and not args.destination:
+        parser.error('--resume needs the --destination of the interrupted export')
+
+    export_config = ExportConfig(json_load_path=args.files, export_audio=args.audio, export_fft=args.fft,
+                                 wav_layout=args.wav_layout,
+                                 export_spectrogram=args.spectrogram, export_spectra=args.spectra,
+                                 export_peaks=args.peaks is not None, peaks_format=args.peaks or 'csv',
+                                 bundle_artifacts=args.bundle is not None, bundle_compression=args.bundle or 'stored',
+                                 results_database=args.database and os.path.expanduser(args.database),
+                                 collect_metrics=args.metrics, trace=args.trace, profile_memory=args.profile_memory,
+                                 memory_budget_mb=args.memory_budget, deadline_seconds=args.deadline,
+                                 resume=args.resume,
+                                 png_workers=args.png_workers,
+                                 plot_backend=args.plot_backend)
+    if args.destination:
+        export_config._destination_folder = os.path.expanduser(args.destination)
+    if args.fractions:
+        export_config.time_fractions = args.fractions
+
+    # Only the headers are read, so files that can't be analyzed together fail before the long reads
+    check = check_wav_files(export_config.c_files, export_config.ref_files)
+    if check.errors or check.warnings:
+        print(check.format())
+    if not check.ok:
+        sys.exit('Cannot export the selected files')
+
+    plan = plan_export(export_config, *load_calibration(args.calibration))
+    print(plan.format())
+
+    if not args.dry_run:
+        try:
+            progress = ProgressAggregator(lambda status: print(format_status(status)), interval=2) \
+                if args.progress else None
+            create_export(export_config, progress=progress)
+        except ExportCancelled as e:
+            sys.exit(f'Export cancelled: {e}')
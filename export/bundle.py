@@ -0,0 +1,197 @@
+"""
+Streams the audio, fft graphs, spectrograms and spectra of an export into a single zip file, instead of thousands of
+files in the Fractions, Spectrograms and Spectra folders. Creating many small files on a network share costs much
+more than writing their data.
+
+Exporters write through `open_output`, which writes a file as usual, or collects the file in memory and queues it
+for the bundle of the run when it has one. Every run passes its own bundle to its writers, so exports that run at the
+same time write into their own zip files. A background thread writes the queued files into the zip, so exporters
+never wait for the file system. The last entry is manifest.json with the name, size and crc of every entry.
+
+```python
+with bundle_export(data, log) as bundle:
+    with open_output(path, bundle) as file:
+        file.write(content)
+```
+"""
+from __future__ import annotations
+
+import io
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Literal, Optional
+
+from config import ExportConfig
+from profiling import metrics
+
+manifest_name = 'manifest.json'
+compressions = {'stored': zipfile.ZIP_STORED, 'deflated': zipfile.ZIP_DEFLATED}
+
+
+class Bundle:
+    """
+    Zip file that is written by a background thread. Entries are named by their path relative to the root folder.
+    """
+
+    def __init__(self, path: str, root: str, compression: Literal['stored', 'deflated'] = 'stored',
+                 queue_size: int = 64):
+        """
+        :param path: Path of the zip file.
+        :param root: Folder the entry names are relative to.
+        :param compression: Whether entries are stored as they are or deflated.
+        :param queue_size: Maximum number of files that wait for the writer. Exporters block while it is full.
+        """
+        self.path = path
+        self.root = root
+        self.compress_type = compressions[compression]
+        self.entries: [dict] = []
+        self.started = time.perf_counter()
+        self._error: Optional[BaseException] = None
+        self._queue = queue.Queue(queue_size)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._zip = zipfile.ZipFile(path, 'w', self.compress_type, allowZip64=True)
+        self._thread = threading.Thread(target=self._write_entries, name='bundle', daemon=True)
+        self._thread.start()
+
+    def get_name(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def add(self, path: str, data):
+        """
+        Queues the data of a file. Raises the error of the writer if it failed.
+
+        :param path: Path the file would have outside of the bundle.
+        :param data: Bytes or a buffer, it must not change until it is written.
+        """
+        self._put((self.get_name(path), data, None))
+
+    def add_file(self, path: str, source: str):
+        """
+        Queues a file that already exists, e.g. a memory mapped array. The writer copies it into the bundle and
+        deletes it, and its folder if the folder is then empty.
+
+        :param path: Path the file would have outside of the bundle.
+        :param source: Path of the file to move into the bundle.
+        """
+        self._put((self.get_name(path), None, source))
+
+    def _put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def _write_entries(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # After an error the rest of the queue is dropped, so exporters are not blocked on a full queue
+            if self._error is not None:
+                continue
+            name, data, source = item
+            try:
+                if source is None:
+                    info = zipfile.ZipInfo(name, time.localtime()[:6])
+                    info.compress_type = self.compress_type
+                    self._zip.writestr(info, data)
+                else:
+                    self._zip.write(source, name)
+                    os.remove(source)
+                    try:
+                        os.rmdir(os.path.dirname(source))
+                    except OSError:
+                        pass
+                info = self._zip.getinfo(name)
+                self.entries.append({'name': name, 'size': info.file_size, 'compressed_size': info.compress_size,
+                                     'crc': info.CRC})
+            except BaseException as e:
+                self._error = e
+
+    def close(self, complete: bool = True):
+        """
+        Waits for the queued files, writes the manifest and closes the zip file. Raises the error of the writer if
+        it failed.
+
+        :param complete: Whether the export finished, written into the manifest.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        try:
+            if self._error is None:
+                manifest = {'complete': complete, 'entries': self.entries}
+                self._zip.writestr(manifest_name, json.dumps(manifest, indent=2))
+        finally:
+            self._zip.close()
+        if self._error is not None:
+            raise self._error
+
+    def stats(self) -> dict:
+        """
+        :return: Number of entries, their size, their size in the zip file and elapsed seconds.
+        """
+        return {
+            'entries': len(self.entries),
+            'bytes': sum(entry['size'] for entry in self.entries),
+            'compressed_bytes': sum(entry['compressed_size'] for entry in self.entries),
+            'seconds': time.perf_counter() - self.started,
+        }
+
+
+@contextmanager
+def open_output(path: str, bundle: Optional[Bundle] = None):
+    """
+    Opens a file for binary writing. Creates the directory if it doesn't exist. With a bundle, the file is collected
+    in memory and added to the bundle instead, no directory is created.
+    """
+    if bundle is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            yield file
+    else:
+        buffer = io.BytesIO()
+        yield buffer
+        # The view keeps the buffer alive until the writer is done with it
+        bundle.add(path, buffer.getbuffer())
+
+
+def make_output_dirs(path: str, bundle: Optional[Bundle] = None):
+    """
+    Creates a directory that open_output writes into, unless there is a bundle.
+    """
+    if bundle is None:
+        os.makedirs(path, exist_ok=True)
+
+
+@contextmanager
+def bundle_export(data: ExportConfig, log=print):
+    """
+    Yields a bundle at data.bundle_path() if data.bundle_artifacts is set, otherwise None, and closes it when the
+    code inside finishes, even if the export fails.
+    """
+    if not data.bundle_artifacts:
+        yield None
+        return
+
+    bundle = Bundle(data.bundle_path(), os.path.dirname(data.bundle_path()), data.bundle_compression)
+    try:
+        try:
+            yield bundle
+        except BaseException:
+            # The error of the export is raised, not the one of closing the bundle it left behind
+            try:
+                bundle.close(complete=False)
+            except Exception:
+                pass
+            raise
+        bundle.close(complete=True)
+    finally:
+        stats = bundle.stats()
+        if metrics.get_registry() is not None:
+            metrics.get_registry().sections['bundle'] = stats
+        log(f"Bundled {stats['entries']} files into {data.bundle_path()}")
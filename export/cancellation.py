@@ -0,0 +1,63 @@
+"""
+Cooperative cancellation of export runs. The thread that starts an export keeps a CancellationToken and can cancel it
+from any thread, e.g. when the window is closed. The export checks the token at every time fraction, and stops with
+ExportCancelled at the next check. A token can also have a deadline, after which it counts as cancelled.
+
+```python
+token = CancellationToken(timeout=3600)
+Thread(target=create_export, args=(data, log, token)).start()
+...
+token.cancel()
+```
+"""
+import threading
+import time
+from typing import Optional
+
+
+class ExportCancelled(Exception):
+    """
+    Raised by CancellationToken.check when the export was cancelled or passed its deadline.
+    """
+
+
+class CancellationToken:
+    """
+    Cancellation state shared by the thread that cancels an export and the threads that run it.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        :param timeout: Seconds from now after which the token is cancelled, None for no deadline.
+        """
+        self.reason: Optional[str] = None
+        self.deadline: Optional[float] = None
+        self._event = threading.Event()
+        if timeout is not None:
+            self.set_deadline(timeout)
+
+    def set_deadline(self, timeout: float):
+        """
+        :param timeout: Seconds from now after which the token is cancelled. An earlier deadline is kept.
+        """
+        deadline = time.monotonic() + timeout
+        if self.deadline is None or deadline < self.deadline:
+            self.deadline = deadline
+
+    def cancel(self, reason: str = 'cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel('deadline exceeded')
+        return self._event.is_set()
+
+    def check(self):
+        """
+        Raises ExportCancelled if the token was cancelled or its deadline has passed.
+        """
+        if self.cancelled:
+            raise ExportCancelled(self.reason)
@@ -0,0 +1,148 @@
+"""
+Checkpoints of long exports. While an export runs, CheckpointSink saves the peaks of every finished time fraction
+into the Checkpoint folder of the destination, and appends the fraction to journal.jsonl. If the export is
+interrupted, running it again into the same folder with data.resume loads the peaks of the journaled fractions
+instead of analyzing them again:
+
+```python
+data.resume = True
+create_export(data)
+```
+
+The peaks are all the fraction sheets need, so the resumed workbook is byte for byte the same as the one of an
+uninterrupted run, see export.sheet_export.utils.save_workbook. Outputs that need the signals or the full spectra
+(audio, fft graphs, raw spectra) are written again for every fraction. The first line of the journal identifies the
+input files and parameters, and a checkpoint of other inputs is refused. The folder is removed by remove_checkpoint
+when the export completes.
+"""
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from config import ExportConfig
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+
+journal_name = 'journal.jsonl'
+
+
+@dataclass
+class Checkpoint:
+    """
+    Journal of an interrupted export.
+    """
+    folder: str
+    started: datetime  # Start of the first run, used as the modification time of the workbook
+    fractions: dict[int, str]  # File with the peaks of each finished fraction, by index
+
+    def load_peaks(self, t: int) -> (np.ndarray, np.ndarray):
+        """
+        :return: Peak frequencies and amplitudes of fraction t, see SpectraBlock.get_peaks.
+        """
+        peaks = np.load(os.path.join(self.folder, self.fractions[t]))
+        return peaks[0], peaks[1]
+
+
+def get_fingerprint(data: ExportConfig) -> dict:
+    """
+    :return: Input files and the parameters that change the analysis. A checkpoint can only be resumed with the same
+    fingerprint.
+    """
+    files = [[path, os.path.getsize(path), os.stat(path).st_mtime_ns] for path in data.c_files + data.ref_files]
+    return {
+        'files': files,
+        'time_fractions': data.time_fractions,
+        'frequency_regions': [list(region) for region in data.frequency_regions],
+        'signal_sets': [list(signal_set) for signal_set in data.get_signal_sets()],
+    }
+
+
+def load_checkpoint(data: ExportConfig) -> Optional[Checkpoint]:
+    """
+    :return: Checkpoint in the destination folder, or None if there is no journal.
+    :raises ValueError: The checkpoint was written for other input files or parameters.
+    """
+    folder = data.checkpoint_path()
+    path = os.path.join(folder, journal_name)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, 'r') as file:
+        lines = file.read().splitlines()
+    header = json.loads(lines[0])
+    if header['fingerprint'] != json.loads(json.dumps(get_fingerprint(data))):
+        raise ValueError(f'{folder} was written for other files or parameters, it can not be resumed')
+
+    fractions = {}
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            # The last line is incomplete if the export stopped while writing it
+            break
+        if os.path.isfile(os.path.join(folder, entry['file'])):
+            fractions[entry['fraction'] - 1] = entry['file']
+    return Checkpoint(folder, datetime.fromisoformat(header['started']), fractions)
+
+
+def restore(pipeline: ExportPipeline, checkpoint: Checkpoint, log=print):
+    """
+    Gives the pipeline the peaks of the fractions in the checkpoint, and the start time of the first run.
+    """
+    pipeline.started = checkpoint.started
+    for t in checkpoint.fractions:
+        pipeline.restore(t, *checkpoint.load_peaks(t))
+    log(f'Resuming export, {len(checkpoint.fractions)} of {pipeline.fractions} fractions restored')
+
+
+class CheckpointSink(Sink):
+    """
+    Saves the peaks of every fraction that was analyzed and journals it. Restored fractions are already journaled.
+    """
+    stage = 'checkpoint'
+    uses_spectra = False
+
+    def start(self, pipeline: ExportPipeline):
+        self.folder = pipeline.data.checkpoint_path()
+        self.restored = pipeline.restored
+        self.journal_path = os.path.join(self.folder, journal_name)
+        os.makedirs(self.folder, exist_ok=True)
+        if not self.restored or not os.path.isfile(self.journal_path):
+            header = {'started': pipeline.started.isoformat(), 'fingerprint': get_fingerprint(pipeline.data)}
+            with open(self.journal_path, 'w') as file:
+                file.write(json.dumps(header) + '\n')
+        self.set_count = len(pipeline.signal_sets)
+
+    def start_fraction(self, t: int):
+        self.peaks = None
+
+    def write(self, block: SpectraBlock):
+        if block.fraction in self.restored:
+            return
+        frequencies, amplitudes = block.get_peaks()
+        if self.peaks is None:
+            self.peaks = np.empty((2, frequencies.shape[0], self.set_count, frequencies.shape[2]))
+        self.peaks[0, :, block.sets.start:block.sets.stop] = frequencies
+        self.peaks[1, :, block.sets.start:block.sets.stop] = amplitudes
+
+    def end_fraction(self, t: int):
+        if t in self.restored:
+            return
+        file_name = f'fraction_{t + 1}.npy'
+        # The journal only points to complete files
+        temporary = os.path.join(self.folder, f'{file_name}.tmp')
+        with open(temporary, 'wb') as file:
+            np.save(file, self.peaks)
+        os.replace(temporary, os.path.join(self.folder, file_name))
+        with open(self.journal_path, 'a') as file:
+            file.write(json.dumps({'fraction': t + 1, 'file': file_name}) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def remove_checkpoint(data: ExportConfig):
+    shutil.rmtree(data.checkpoint_path(), ignore_errors=True)
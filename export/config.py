@@ -6,6 +6,7 @@ resources_dir = path.join(ROOT_DIR, 'resources')
 sheets_dir = path.join(resources_dir, 'sheets')
 sounds_dir = path.join(resources_dir, 'sounds')
 template_path = path.join(sheets_dir, 'template.xlsx')
+fft_report_template_path = path.join(resources_dir, 'reports', 'fft_report.html')
 
 
 class SheetNamesFraction(Enum):
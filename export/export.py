@@ -1,39 +1,203 @@
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
 from config import ExportConfig
-from export import wav_export, fft_export
-from export.sheet_export import sheet_export
-from signal_processing import signals
+from export import bundle, spectrogram_export
+from export.cancellation import CancellationToken, ExportCancelled
+from export.checkpoint import CheckpointSink, load_checkpoint, remove_checkpoint, restore
+from export.fft_export import FftGraphSink
+from export.fft_report import FftReportSink
+from export.peak_export import PeakTableSink
+from export.pipeline import ExportPipeline
+from export.progress import Listener, LogProgress, Progress
+from export.recordings import RecordingCache
+from export.results_store import ResultsSink
+from export.sheet_export.sheet_export import SheetSink
+from export.spectra_export import SpectraSink
+from export.wav_export import WavSink
+from profiling import memory, metrics, tracing
 from signal_processing.signals import SignalRecording
 
 
-def create_export(data: ExportConfig, log=print):
+def create_export(data: ExportConfig, log=print, token: Optional[CancellationToken] = None,
+                  progress: Optional[Listener] = None, recordings: Optional[RecordingCache] = None):
     """Main function that does exporting. You can pass custom log function, for example
     write the message to a text widget along with printing. It strings together all the other functions
     that export the sheets, audio and fft graphs.
 
+    If data.collect_metrics is set, a json report with stage timings and counters is written next to the sheet.
+    If data.trace is set, a Chrome trace-event timeline of the run is written next to the sheet.
+    If data.profile_memory is set, memory usage of each stage is added to the report. If data.memory_budget_mb is set,
+    the run fails with MemoryBudgetExceeded as soon as it uses, or is about to use, more memory than that.
+
+    The run stops with ExportCancelled at the next time fraction once the token is cancelled, or after
+    data.deadline_seconds. If the run doesn't complete, the outputs it wrote are marked by data.incomplete_path().
+    The peaks of finished fractions are kept in data.checkpoint_path() until the run completes. If data.resume is
+    set, the fractions of an earlier run into the same folder are not analyzed again, see export.checkpoint.
+
+    Every stage reports its progress as events, see export.progress. The events are logged as progress strings, and
+    passed to the progress listener, e.g. a ProgressAggregator.
+
     :param data: ExportConfig object that contains all the necessary data for exporting.
     :param log: function that takes a string and prints it somewhere.
+    :param token: Token that another thread can cancel the export with.
+    :param progress: Function that is called with every ProgressEvent of the run, from the thread of the stage.
+    :param recordings: Cache of the decoded recordings and their combinations, which are shared with other exports
+    this way, they are not changed. By default they are read for this export only.
+    """
+    token = token or CancellationToken()
+    if data.deadline_seconds is not None:
+        token.set_deadline(data.deadline_seconds)
+    with profile_export(data, log):
+        with mark_incomplete(data, log):
+            _create_export(data, log, token, Progress(LogProgress(log), progress),
+                           recordings or RecordingCache())
+
+
+@contextmanager
+def profile_export(data: ExportConfig, log):
+    """
+    Enables the profiling tools requested in the config for the code inside it, and writes their output when it
+    finishes, even if the export fails.
     """
+    budget = int(data.memory_budget_mb * 2 ** 20) if data.memory_budget_mb is not None else None
+    # Memory is checked at stage boundaries, which are only seen when metrics are enabled
+    write_report = data.collect_metrics or data.profile_memory
+    registry = metrics.enable() if write_report or budget is not None else None
+    tracer = tracing.enable() if data.trace else None
+    profiler = memory.enable(budget, trace_allocations=data.profile_memory) \
+        if data.profile_memory or budget is not None else None
+    status = 'failed'
+    try:
+        with metrics.stage('export'):
+            yield
+        status = 'complete'
+    except ExportCancelled as e:
+        status = 'cancelled'
+        if registry is not None:
+            registry.sections['error'] = f'{type(e).__name__}: {e}'
+        raise
+    except Exception as e:
+        if registry is not None:
+            registry.sections['error'] = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        if profiler is not None:
+            memory.disable()
+            registry.sections['memory'] = profiler.report()
+        if tracer is not None:
+            tracing.disable()
+            tracer.write(data.trace_path())
+            log(f'Trace saved to {data.trace_path()}')
+        if registry is not None:
+            metrics.disable()
+        if write_report:
+            registry.sections['status'] = status
+            registry.sections['config'] = get_report_config(data)
+            registry.write_report(data.report_path())
+            log(f'Run report saved to {data.report_path()}')
 
+
+@contextmanager
+def mark_incomplete(data: ExportConfig, log):
+    """
+    Writes data.incomplete_path() if the code inside it fails or is cancelled, with the reason, so the partial outputs
+    of the run can't be mistaken for a complete export. The marker of an earlier run into the same folder is removed.
+    """
+    if os.path.exists(data.incomplete_path()):
+        os.remove(data.incomplete_path())
+    try:
+        yield
+    except BaseException as e:
+        if os.path.isdir(os.path.dirname(data.incomplete_path())):
+            marker = {
+                'status': 'cancelled' if isinstance(e, ExportCancelled) else 'failed',
+                'reason': str(e) or type(e).__name__,
+                'time': datetime.now().isoformat(timespec='seconds'),
+            }
+            with open(data.incomplete_path(), 'w') as file:
+                json.dump(marker, file, indent=2)
+            log(f"Export {marker['status']} ({marker['reason']}), outputs in the folder are incomplete")
+        raise
+
+
+def _create_export(data: ExportConfig, log, token: CancellationToken, progress: Progress,
+                   recordings: RecordingCache):
     log("Export initiated!")
+    # Checked before reading, so a checkpoint of other files fails early
+    checkpoint = load_checkpoint(data) if data.resume else None
+
     log("Reading signals...")
-    # Read first signal and set fractions
-    c1_signal: SignalRecording = signals.SignalRecording(data.c_files)
-    c1_signal.read_files()
+    reading = progress.stage('read', 'file', len(data.c_files) + len(data.ref_files))
+    with metrics.stage('read'):
+        # Read first signal and set fractions
+        c1_signal: SignalRecording = recordings.read(data.c_files)
+        reading.advance(len(data.c_files), sum(s.data.nbytes for s in c1_signal.mic_signals), data.c_name)
 
-    # Read second signal and set fractions
-    c2_signal: SignalRecording = signals.SignalRecording(data.ref_files)
-    c2_signal.read_files()
+        # Read second signal and set fractions
+        c2_signal: SignalRecording = recordings.read(data.ref_files)
+        reading.advance(len(data.ref_files), sum(s.data.nbytes for s in c2_signal.mic_signals), data.ref_name)
+    token.check()
 
-    # Create sums and differences
+    # Create sums and differences, cached recordings already have them
     log("Creating sums and differences...")
-    s1_sums, s2_sums, sd1, sd2 = signals.create_signal_combinations(c1_signal, c2_signal)
-
-    sheet_export.create_export(s1_sums, s2_sums, sd1, sd2, data, log)
+    s1_sums, s2_sums, sd1, sd2 = recordings.combine(c1_signal, c2_signal)
+    token.check()
 
-    if data.export_audio:
-        wav_export.create_export(s1_sums, s2_sums, sd1, data, log)
+    # Audio, fft graphs, spectrograms and spectra go into a single zip file if data.bundle_artifacts is set
+    with bundle.bundle_export(data, log) as output:
+        # Every export is a sink of a single pass over the fractions, so each spectrum is computed once
+        pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log, token, progress, output)
+        if checkpoint is not None:
+            restore(pipeline, checkpoint, log)
+        pipeline.add_sink(CheckpointSink())
+        pipeline.add_sink(SheetSink())
+        if data.export_peaks:
+            pipeline.add_sink(PeakTableSink())
+        if data.results_database is not None:
+            pipeline.add_sink(ResultsSink())
+        if data.export_audio:
+            pipeline.add_sink(WavSink())
+        if data.export_fft and data.plot_backend == 'html':
+            pipeline.add_sink(FftReportSink())
+        elif data.export_fft:
+            pipeline.add_sink(FftGraphSink())
+        if data.export_spectra:
+            pipeline.add_sink(SpectraSink())
+        pipeline.run()
 
-    if data.export_fft:
-        fft_export.create_export(s1_sums, s2_sums, sd1, data, log)
+        if data.export_spectrogram:
+            with metrics.stage('spectrogram'):
+                spectrogram_export.create_export(s1_sums, s2_sums, sd1, data, log, token, progress, output)
 
+    remove_checkpoint(data)
     log("Export complete!")
+
+
+def get_report_config(data: ExportConfig) -> dict:
+    """
+    :return: Part of the configuration that is written into the run report.
+    """
+    return {
+        **data.get_json(),
+        'mic_count': data.get_mic_count(),
+        'export_audio': data.export_audio,
+        'export_fft': data.export_fft,
+        'wav_layout': data.wav_layout,
+        'export_spectrogram': data.export_spectrogram,
+        'export_spectra': data.export_spectra,
+        'export_peaks': data.export_peaks,
+        'peaks_format': data.peaks_format,
+        'results_database': data.results_database,
+        'bundle_artifacts': data.bundle_artifacts,
+        'bundle_compression': data.bundle_compression,
+        'memory_budget_mb': data.memory_budget_mb,
+        'deadline_seconds': data.deadline_seconds,
+        'resume': data.resume,
+        'png_workers': data.png_workers,
+        'plot_backend': data.plot_backend,
+        'sheet_path': data.sheet_path(),
+    }
@@ -1,42 +1,153 @@
-import numpy as np
-import plotly.graph_objects as go
 import os
+from typing import Optional
+
+import numpy as np
 
 from config import ExportConfig
+from export.bundle import Bundle, make_output_dirs
+from export.fft_render import FftFigure, PngRenderer
+from export.native_plot import NativeRenderer
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics
 from signal_processing import fft
+from signal_processing.decimate import get_decimator
 from signal_processing.signals import Signal
 
+# Logarithmic frequency bins of a graph, more than the 640 pixels wide plot area, so every bin is at most a pixel
+graph_bins = 1000
+
+
+def create_export(s1_sums, s2_sums, sd1, data: ExportConfig, log=print) -> dict:
+    """
+    Exports fft graphs of every signal set and time fraction. Plotly graphs are rendered in parallel by
+    PngRenderer, svg and png backends draw them directly with NativeRenderer. The html backend is exported by
+    export.fft_report instead.
+
+    :return: Render statistics, see PngRenderer.stats.
+    """
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, None, data, log)
+    sink = pipeline.add_sink(FftGraphSink())
+    pipeline.run()
+    return sink.stats
+
+
+class FftGraphSink(Sink):
+    """
+    Submits a graph of C, REF and DIFF for every signal set of the blocks of the pipeline to the renderer of the
+    plot backend. The graphs are decimated from the spectra of the block.
+    """
+    stage = 'png'
+    unit = 'graph'
+    uses_peaks = False
+
+    def start(self, pipeline: ExportPipeline):
+        self.data = data = pipeline.data
+        self.log = pipeline.log
+        self.names = pipeline.names[:3]
+        self.signal_sets = pipeline.signal_sets
+        self.x_lims = get_x_lims(data.frequency_regions)
+        self.extension = get_extension(data.plot_backend)
+        self.stats = None
+        self.log('Exporting FFT graphs...')
+        self.progress.total = len(self.names) * len(self.signal_sets) * data.time_fractions
+
+        for folder_name in self.names:
+            make_output_dirs(f'{data.fractions_path()}/FFT/{folder_name}', pipeline.bundle)
+        self.renderer = get_renderer(data, self.x_lims, self.written, pipeline.bundle)
+
+    def write(self, block: SpectraBlock):
+        frequency, spectra = block.get_spectra()
+        decimator = get_decimator(frequency, self.x_lims, graph_bins)
+        envelopes = [decimator.envelope(plot) for plot in spectra[:3]]
+        time_str = f'fraction_{block.fraction + 1}_of_{self.data.time_fractions}'
+        for j, i in enumerate(block.sets):
+            mics_str = 'mics_' + ''.join([str(m) for m in self.signal_sets[i]])
+            for folder_name, (x, graphs) in zip(self.names, envelopes):
+                file_name = f'{folder_name}_{mics_str}_{time_str}{self.extension}'
+                self.renderer.submit(f'{self.data.fractions_path()}/FFT/{folder_name}/{file_name}', x, graphs[j])
+
+    def finish(self):
+        self.renderer.close()
+        self.stats = stats = self.renderer.stats()
+        self.log(f"Rendered {stats['renders']} FFT graphs in {stats['seconds']:.1f}s "
+                 f"({stats['renders_per_second']:.1f}/s, {stats['workers']} workers)")
+        registry = metrics.get_registry()
+        if registry is not None:
+            registry.sections['png'] = stats
+
+    def abort(self):
+        self.renderer.close(cancel=True)
+
+    def written(self, path: str, size: int):
+        _count_written(path, size)
+        self.progress.advance(bytes=size, item=os.path.basename(path))
+
+
+def _count_written(path: str, size: int):
+    if metrics.get_registry() is not None:
+        metrics.count('files_written')
+        metrics.count('bytes_saved', size)
+
+
+def get_renderer(data: ExportConfig, x_lims, on_written=_count_written, bundle: Optional[Bundle] = None):
+    """
+    :param on_written: Function called with the path and size of every rendered image.
+    :param bundle: Bundle of the run the images are added to, instead of writing files.
+    :return: Renderer of the configured plot backend.
+    """
+    if data.plot_backend == 'plotly':
+        return PngRenderer(x_lims, data.png_workers, on_written=on_written, bundle=bundle)
+    if data.plot_backend in ('svg', 'png'):
+        return NativeRenderer(x_lims, on_written=on_written, bundle=bundle)
+    raise ValueError(f'plot backend {data.plot_backend} does not render single graphs')
 
-def create_export(s1_sums, s2_sums, sd1, data: ExportConfig, log=print):
-    log('Exporting FFT graphs...')
 
-    signal_sets = data.get_signal_sets()
-    fractions = data.time_fractions
-    regions = data.frequency_regions
+def get_extension(plot_backend: str) -> str:
+    """
+    :return: File extension of graphs written by the plot backend.
+    """
+    return '.svg' if plot_backend == 'svg' else '.png'
+
+
+def get_x_lims(regions) -> (float, float):
+    """
+    :return: Frequency axis limits that contain all the regions, expanded by 20% on each side.
+    """
     x_lims = (min(regions, key=lambda x: x[0])[0], max(regions, key=lambda x: x[1])[1])
-    x_lims = (x_lims[0] * 0.8, x_lims[1] * 1.2)  # Expand x_lims by 20% on each side
+    return x_lims[0] * 0.8, x_lims[1] * 1.2
 
-    for t in range(fractions):
-        log(f'fraction {t + 1}/{fractions}')
-        for i in range(len(signal_sets)):
-            c1_signal: Signal = s1_sums[i].get_interval_fraction(fractions, t)
-            c2_signal: Signal = s2_sums[i].get_interval_fraction(fractions, t)
-            diffs_signal: Signal = sd1[i].get_interval_fraction(fractions, t)
 
-            mics_str = 'mics_' + ''.join([str(m) for m in signal_sets[i]])
-            time_str = f'fraction_{t + 1}_of_{fractions}'
+def get_graph_data(signal: Signal, x_lims, bins: int = graph_bins) -> (np.ndarray, np.ndarray):
+    """
+    Creates the fft of the signal and decimates it to a min/max envelope of logarithmic frequency bins.
 
-            export_fft_fraction(data.fractions_path(), data.c_name,
-                                f'{data.c_name}_{mics_str}_{time_str}.png', c1_signal, x_lims, log=log)
-            export_fft_fraction(data.fractions_path(), data.ref_name,
-                                f'{data.ref_name}_{mics_str}_{time_str}.png', c2_signal, x_lims, log=log)
-            export_fft_fraction(data.fractions_path(), 'DIFF',
-                                f'DIFF_{mics_str}_{time_str}.png', diffs_signal, x_lims, log=log)
+    :return: Frequencies and magnitudes in dB, two points per bin.
+    :param signal: signal to export.
+    :param x_lims: tuple of the x-axis limits.
+    :param bins: number of logarithmic frequency bins.
+    """
+    x, y = get_graph_stack([signal], x_lims, bins)
+    return x, y[0]
+
+
+def get_graph_stack(signals: [Signal], x_lims, bins: int = graph_bins) -> (np.ndarray, np.ndarray):
+    """
+    Creates the ffts of signals with the same length and decimates all of them in one call, see
+    signal_processing.decimate.
+
+    :return: Frequencies shared by all graphs, and magnitudes in dB of shape (len(signals), 2 * non-empty bins).
+    :param signals: signals to export.
+    :param x_lims: tuple of the x-axis limits.
+    :param bins: number of logarithmic frequency bins.
+    """
+    fft_data = fft.create_fft_stack(signals)
+    return get_decimator(fft_data.frequency, x_lims, bins).envelope(fft_data.plot)
 
 
 def export_fft_fraction(audio_path, folder_name, file_name, signal: Signal, x_lims, log=print):
     """
-    Exports the fft graph to the given path. Creates the directory if it doesn't exist.
+    Exports a single fft graph to the given path, rendered in the calling process. Creates the directory if it
+    doesn't exist. Use create_export to export many graphs, it renders them in parallel.
 
     :param audio_path: path to the audio folder.
     :param folder_name: name of the folder to export to.
@@ -45,41 +156,12 @@ def export_fft_fraction(audio_path, folder_name, file_name, signal: Signal, x_li
     :param x_lims: tuple of the x-axis limits.
     :param log: function that takes a string and prints it somewhere.
     """
-    try:
-        os.makedirs(f'{audio_path}/FFT/{folder_name}')
-    except FileExistsError:
-        pass
+    make_output_dirs(f'{audio_path}/FFT/{folder_name}')
 
     log(f'exporting fft {file_name}')
-    fft_data = fft.create_fft(signal)
-
-    # Define logarithmic frequency range
-    log_min_freq = np.log10(x_lims[0])
-    log_max_freq = np.log10(x_lims[1])
-    num_points = fft_data.frequency.shape[0] // 10  # Down-sample to every 10th point
-    log_freq_range = np.logspace(log_min_freq, log_max_freq, num_points)
-
-    # Find the nearest data points in the original frequency data efficiently
-    nearest_indices = np.searchsorted(fft_data.frequency, log_freq_range)
-
-    # Ensure the indices are within bounds
-    nearest_indices = np.clip(nearest_indices, 0, len(fft_data.frequency) - 1)
-
-    x = fft_data.frequency[nearest_indices]
-    y = fft_data.plot[nearest_indices]
-    min_y, max_y = np.min(y), np.max(y)
-
-    # Create a Plotly figure with a logarithmic x-axis
-    fig = go.Figure(data=go.Scatter(x=x, y=y, mode='lines', line=dict(width=1.5)),
-                    layout_yaxis_range=[min_y - 6, max_y + 6])
-    fig.update_xaxes(type='log')
-
-    # Set labels and title
-    fig.update_layout(
-        title='FFT Data',
-        xaxis_title='Frequency (Hz)',
-        yaxis_title='Magnitude (dB)'
-    )
-
-    # Save the figure as a PNG file
-    fig.write_image(f'{audio_path}/FFT/{folder_name}/{file_name}', width=800, height=600)
+    path = f'{audio_path}/FFT/{folder_name}/{file_name}'
+    figure = FftFigure(x_lims)
+    figure.update(*get_graph_data(signal, x_lims))
+    figure.write(path)
+    _count_written(path, os.path.getsize(path))
+
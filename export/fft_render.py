@@ -0,0 +1,246 @@
+"""
+Renders fft graphs to png files in a pool of worker processes.
+
+Creating a plotly figure and starting the image renderer costs much more than drawing a single graph, so every
+worker builds one figure when it starts, keeps one renderer session alive, and only swaps the trace data and y-axis
+range for each image. Jobs go through a bounded queue, so the exporter never holds more than a few graphs in memory
+while the workers are busy.
+
+When a bundle is enabled (see export.bundle), workers send the images back instead of writing them, and the calling
+process adds them to the bundle.
+
+With kaleido 1.x the session is a persistent browser started with `kaleido.start_sync_server`. Older kaleido keeps
+its renderer process alive between calls on its own. Workers are spawned rather than forked: a forked worker would
+inherit the locks of the other threads of the exporter, e.g. the sink writers, in whatever state they were.
+"""
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED, Future
+from multiprocessing import util
+from typing import Optional
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from export.bundle import Bundle
+from export.native_plot import get_y_range, image_width, image_height
+from profiling import tracing
+
+start_method = 'spawn'  # How worker processes are started, see multiprocessing.get_context
+
+# State of a worker process
+_figure: Optional['FftFigure'] = None
+
+
+class FftFigure:
+    """
+    Plotly figure of an fft graph with a logarithmic frequency axis, reused for every image.
+    """
+
+    def __init__(self, x_lims: (float, float)):
+        """
+        :param x_lims: Limits of the frequency axis.
+        """
+        self.figure = go.Figure(data=go.Scatter(x=[], y=[], mode='lines', line=dict(width=1.5)))
+        self.figure.update_xaxes(type='log', range=[np.log10(x_lims[0]), np.log10(x_lims[1])])
+        self.figure.update_layout(
+            title='FFT Data',
+            xaxis_title='Frequency (Hz)',
+            yaxis_title='Magnitude (dB)'
+        )
+
+    def update(self, x: np.ndarray, y: np.ndarray):
+        """
+        Replaces the data of the graph. The y-axis is padded by 6 dB on both sides.
+        """
+        with self.figure.batch_update():
+            self.figure.data[0].x = x
+            self.figure.data[0].y = y
+            self.figure.layout.yaxis.range = get_y_range(y)
+
+    def write(self, file):
+        """
+        :param file: Path of the png file, or a file object opened for binary writing.
+        """
+        pio.write_image(self.figure, file, format='png', width=image_width, height=image_height)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        self.write(buffer)
+        return buffer.getvalue()
+
+
+def start_session():
+    """
+    Starts a persistent renderer session if the installed kaleido supports it.
+    """
+    try:
+        import kaleido
+    except ImportError:
+        return
+    if hasattr(kaleido, 'start_sync_server'):
+        kaleido.start_sync_server(silence_warnings=True)
+
+
+def stop_session():
+    try:
+        import kaleido
+    except ImportError:
+        return
+    if hasattr(kaleido, 'stop_sync_server'):
+        kaleido.stop_sync_server(silence_warnings=True)
+
+
+def _start_worker(x_lims: (float, float), trace: bool):
+    global _figure
+    start_session()
+    # Pool workers exit without running atexit handlers, only multiprocessing finalizers
+    util.Finalize(None, stop_session, exitpriority=10)
+    _figure = FftFigure(x_lims)
+    if trace:
+        tracing.enable()
+
+
+def _render(path: str, x: np.ndarray, y: np.ndarray, in_memory: bool = False) \
+        -> (str, int, Optional[bytes], [dict]):
+    """
+    Renders one image in a worker process.
+
+    :return: Path and size of the image, the image if in_memory is set, otherwise it is written to the path, and
+    trace events recorded since the last job.
+    """
+    with tracing.span('render', file=os.path.basename(path)):
+        _figure.update(x, y)
+        if in_memory:
+            data = _figure.to_bytes()
+        else:
+            data = None
+            _figure.write(path)
+
+    tracer = tracing.get_tracer()
+    events = []
+    if tracer is not None:
+        events, tracer.events = tracer.events, []
+    return path, len(data) if in_memory else os.path.getsize(path), data, events
+
+
+class PngRenderer:
+    """
+    Renders fft graphs in parallel. Use as a context manager, or call close() when all the images are submitted:
+
+    ```python
+    with PngRenderer(x_lims) as renderer:
+        renderer.submit('fft.png', x, y)
+    print(renderer.stats())
+    ```
+
+    With a single worker everything is rendered in the calling process.
+    """
+
+    def __init__(self, x_lims: (float, float), workers: Optional[int] = None, queue_size: Optional[int] = None,
+                 on_written=None, bundle: Optional[Bundle] = None):
+        """
+        :param x_lims: Limits of the frequency axis, the same for every graph.
+        :param workers: Number of worker processes. Defaults to the number of cpus minus one, at most 4, because
+        each worker keeps a renderer session that uses a lot of memory.
+        :param queue_size: Maximum number of submitted images that are not rendered yet. Defaults to twice the
+        number of workers.
+        :param on_written: Function called with the path and size of every rendered image.
+        :param bundle: Bundle of the run the images are added to, instead of writing files.
+        """
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 1) - 1))
+        self.queue_size = queue_size or 2 * self.workers
+        self.on_written = on_written
+        self.renders = 0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._pending: set[Future] = set()
+        self._bundle = bundle
+        trace = tracing.get_tracer() is not None
+
+        if self.workers == 1:
+            self._pool = None
+            start_session()
+            self._figure = FftFigure(x_lims)
+        else:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(start_method),
+                                             initializer=_start_worker, initargs=(x_lims, trace))
+
+    def submit(self, path: str, x: np.ndarray, y: np.ndarray):
+        """
+        Queues an image for rendering. Blocks while the queue is full, and raises errors of finished renders.
+
+        :param path: Path of the png file.
+        :param x: Frequencies of the graph.
+        :param y: Magnitudes of the graph in dB.
+        """
+        if self._pool is None:
+            with tracing.span('render', file=os.path.basename(path)):
+                self._figure.update(x, y)
+                if self._bundle is not None:
+                    data = self._figure.to_bytes()
+                    self._bundle.add(path, data)
+                    self._written(path, len(data))
+                    return
+                self._figure.write(path)
+            self._written(path, os.path.getsize(path))
+            return
+
+        while len(self._pending) >= self.queue_size:
+            done, self._pending = wait(self._pending, return_when=FIRST_COMPLETED)
+            self._collect(done)
+        self._pending.add(self._pool.submit(_render, path, x, y, self._bundle is not None))
+
+    def _collect(self, futures):
+        for future in futures:
+            path, size, data, events = future.result()
+            tracer = tracing.get_tracer()
+            if tracer is not None and events:
+                tracer.extend(events)
+            if data is not None:
+                self._bundle.add(path, data)
+            self._written(path, size)
+
+    def _written(self, path: str, size: int):
+        self.renders += 1
+        if self.on_written is not None:
+            self.on_written(path, size)
+
+    def close(self, cancel: bool = False):
+        """
+        Waits for all the queued images and stops the workers.
+
+        :param cancel: Drop the queued images instead of waiting for them.
+        """
+        try:
+            if self._pending and not cancel:
+                done, self._pending = wait(self._pending)
+                self._collect(done)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+            else:
+                stop_session()
+            self.finished = time.perf_counter()
+
+    def stats(self) -> dict:
+        """
+        :return: Number of rendered images, elapsed seconds and renders per second.
+        """
+        seconds = (self.finished or time.perf_counter()) - self.started
+        return {
+            'workers': self.workers,
+            'renders': self.renders,
+            'seconds': seconds,
+            'renders_per_second': self.renders / seconds if seconds > 0 else 0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(cancel=exc_type is not None)
+        return False
@@ -0,0 +1,148 @@
+"""
+Writes the fft graphs of a whole run into a single self-contained html report, instead of one image per graph.
+
+Graphs are min/max envelopes of logarithmic frequency bins (see signal_processing.decimate). The frequency axis is
+shared by every graph, so it is stored once. Magnitudes are stored as int16 tenths of a dB, base64 encoded. The
+report draws the selected graphs on a canvas and has selectors for combination, time fraction and signal type, so
+C, REF and DIFF can be compared in one view. It needs no server and no internet connection.
+"""
+import base64
+import json
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from config import ExportConfig
+from export import config
+from export.fft_export import get_x_lims
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics
+from signal_processing.decimate import get_decimator
+
+report_bins = 800  # Logarithmic frequency bins of each graph, about the width of a screen
+db_scale = 10  # Magnitudes are stored with 0.1 dB precision
+
+
+def encode_float32(values: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(values, dtype='<f4').tobytes()).decode('ascii')
+
+
+def encode_db(values: np.ndarray) -> str:
+    """
+    :return: Magnitudes in dB as base64 encoded little-endian int16, multiplied by db_scale. Values that are not
+    finite (silence) are replaced by the lowest finite value.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.all():
+        values = np.where(finite, values, values[finite].min() if finite.any() else 0)
+    scaled = np.clip(np.rint(values * db_scale), np.iinfo(np.int16).min, np.iinfo(np.int16).max)
+    return base64.b64encode(scaled.astype('<i2').tobytes()).decode('ascii')
+
+
+def create_report(s1_sums, s2_sums, sd1, data: ExportConfig, log=print) -> dict:
+    """
+    :return: Json serializable report data. traces[fraction][set][signal] is an encoded graph.
+    """
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, None, data, log)
+    sink = pipeline.add_sink(FftReportSink(write=False))
+    pipeline.run()
+    return sink.report
+
+
+class FftReportSink(Sink):
+    """
+    Decimates and encodes the graphs of C, REF and DIFF for every signal set of the blocks of the pipeline, and writes
+    the report when the pipeline finishes.
+    """
+    stage = 'html'
+    uses_peaks = False
+
+    def __init__(self, write: bool = True):
+        """
+        :param write: Whether the report is written into data.fft_report_path(), otherwise it is only kept in report.
+        """
+        self.write_file = write
+        self.report: Optional[dict] = None
+        self.stats: Optional[dict] = None
+
+    def start(self, pipeline: ExportPipeline):
+        self.data = pipeline.data
+        self.log = pipeline.log
+        self.names = pipeline.names[:3]
+        self.signal_sets = pipeline.signal_sets
+        self.x_lims = get_x_lims(self.data.frequency_regions)
+        self.started = time.perf_counter()
+        if self.write_file:
+            self.log('Exporting FFT report...')
+        self.x = None
+        self.traces = []
+
+    def start_fraction(self, t: int):
+        self.traces.append([])
+
+    def write(self, block: SpectraBlock):
+        frequency, spectra = block.get_spectra()
+        decimator = get_decimator(frequency, self.x_lims, report_bins)
+        envelopes = [decimator.envelope(plot) for plot in spectra[:3]]
+        self.x = envelopes[0][0]
+        self.traces[-1] += [[encode_db(graphs[j]) for _, graphs in envelopes] for j in range(len(block.sets))]
+
+    def finish(self):
+        data = self.data
+        self.report = {
+            'title': f'FFT Data {data.c_name} / {data.ref_name}',
+            'fractions': data.time_fractions,
+            'combinations': ['mics ' + ' '.join(str(m) for m in signal_set) for signal_set in self.signal_sets],
+            'signals': self.names,
+            'x': encode_float32(self.x),
+            'scale': db_scale,
+            'traces': self.traces,
+        }
+        if not self.write_file:
+            return
+
+        size = write_report(data.fft_report_path(), self.report)
+        self.stats = stats = {
+            'graphs': sum(len(signals) for sets in self.traces for signals in sets),
+            'bytes': size,
+            'seconds': time.perf_counter() - self.started,
+        }
+        self.log(f"FFT report with {stats['graphs']} graphs saved to {data.fft_report_path()} "
+                 f"({size / 2 ** 20:.1f}MB, {stats['seconds']:.1f}s)")
+        if metrics.get_registry() is not None:
+            metrics.count('files_written')
+            metrics.count('bytes_saved', size)
+            metrics.get_registry().sections['html'] = stats
+
+
+def write_report(path: str, report: dict) -> int:
+    """
+    Inserts the report data into the html template and writes it. Creates the directory if it doesn't exist.
+
+    :return: Number of bytes written.
+    """
+    with open(config.fft_report_template_path, 'r', encoding='utf-8') as file:
+        template = file.read()
+    # Escaping "</" keeps names from closing the script tag
+    data = json.dumps(report, separators=(',', ':')).replace('</', '<\\/')
+    html = template.replace('/*REPORT_DATA*/null', data).encode('utf-8')
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(html)
+    return len(html)
+
+
+def create_export(s1_sums, s2_sums, sd1, data: ExportConfig, log=print) -> dict:
+    """
+    Exports the fft graphs of every signal set and time fraction into data.fft_report_path().
+
+    :return: Number of graphs, size of the report in bytes and elapsed seconds.
+    """
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, None, data, log)
+    sink = pipeline.add_sink(FftReportSink())
+    pipeline.run()
+    return sink.stats
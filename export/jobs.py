@@ -0,0 +1,203 @@
+"""
+Queue of configured exports, e.g. several C takes against one REF. JobQueue runs at most concurrency exports at a
+time in worker threads, in the order they were submitted, and keeps the status and timings of every job:
+
+```python
+jobs = JobQueue(concurrency=2, on_change=lambda job: print(job.name, job.status))
+for c_files in takes:
+    jobs.submit(ExportConfig(c_files=c_files, ref_files=ref_files, ...))
+jobs.wait()
+```
+
+Jobs share decoded recordings. The first job that needs a list of files reads them, and the other jobs in the queue
+use the same signals, at least until the last job that needs them finishes, see export.recordings. A job that would
+write into the folder of another job of the queue gets a folder with a suffix.
+
+Metrics, tracing and memory profiling are enabled for the whole process, so a job that uses them runs alone: it waits
+until the running jobs finish, and the jobs after it wait until it finishes.
+"""
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+from config import ExportConfig
+from export.cancellation import CancellationToken, ExportCancelled
+from export.export import create_export
+from export.recordings import RecordingCache
+
+
+class ExportJob:
+    """
+    Export in a JobQueue. status is one of queued, running, complete, cancelled and failed.
+    """
+
+    def __init__(self, number: int, data: ExportConfig, progress=None):
+        self.number = number
+        self.data = data
+        self.progress = progress
+        self.name = f'#{number} {data.c_name}/{data.ref_name}'
+        self.token = CancellationToken()
+        self.status = 'queued'
+        self.error: Optional[str] = None
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('complete', 'cancelled', 'failed')
+
+    @property
+    def waited(self) -> float:
+        """
+        :return: Seconds the job was queued before it started.
+        """
+        return (self.started or time.monotonic()) - self.submitted
+
+    @property
+    def seconds(self) -> Optional[float]:
+        """
+        :return: Seconds the job has been running, or ran, None if it didn't start.
+        """
+        if self.started is None:
+            return None
+        return (self.finished or time.monotonic()) - self.started
+
+
+def runs_alone(data: ExportConfig) -> bool:
+    """
+    :return: Whether the export enables profiling tools that can't be shared with other exports, see
+    export.profile_export.
+    """
+    return data.collect_metrics or data.trace or data.profile_memory or data.memory_budget_mb is not None
+
+
+class JobQueue:
+    """
+    Runs submitted exports in worker threads, at most concurrency at a time.
+    """
+
+    def __init__(self, concurrency: int = 1, log=print, on_change: Optional[Callable[[ExportJob], None]] = None,
+                 export=create_export, recordings: Optional[RecordingCache] = None):
+        """
+        :param concurrency: Most exports that run at the same time.
+        :param log: function that takes a string and prints it somewhere, messages are prefixed with the job name.
+        :param on_change: Called with a job when its status changes, from the thread that changed it.
+        :param export: Function that runs an export, with the arguments of export.create_export.
+        :param recordings: Recordings shared by the jobs, and kept for later jobs if it has a limit.
+        """
+        self.concurrency = concurrency
+        self.log = log
+        self.on_change = on_change
+        self.export = export
+        self.jobs: [ExportJob] = []
+        self.recordings = recordings or RecordingCache()
+        self._numbers = itertools.count(1)
+        self._condition = threading.Condition()
+
+    def submit(self, data: ExportConfig, progress=None) -> ExportJob:
+        """
+        Queues an export, it starts when fewer than concurrency jobs are running.
+
+        :param progress: Progress listener of the export, see export.progress.
+        """
+        with self._condition:
+            job = ExportJob(next(self._numbers), data, progress)
+            data._destination_folder = self._get_free_folder(data._destination_folder)
+            self.recordings.claim(data.c_files)
+            self.recordings.claim(data.ref_files)
+            self.jobs.append(job)
+        self._changed(job)
+        self._start_jobs()
+        return job
+
+    def set_concurrency(self, concurrency: int):
+        with self._condition:
+            self.concurrency = concurrency
+        self._start_jobs()
+
+    def cancel(self, job: ExportJob):
+        """
+        Cancels a running job at its next time fraction, or removes a queued job from the queue.
+        """
+        with self._condition:
+            if job.status == 'queued':
+                self._finish(job, 'cancelled')
+            else:
+                job.token.cancel()
+
+    def cancel_all(self):
+        for job in list(self.jobs):
+            self.cancel(job)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until every submitted job is done.
+
+        :return: False if the timeout passed before.
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: all(job.done for job in self.jobs), timeout)
+
+    def _get_free_folder(self, folder: str) -> str:
+        """
+        :return: The folder, or the folder with a suffix, that no other job of the queue uses.
+        """
+        used = {job.data._destination_folder for job in self.jobs}
+        candidate = folder
+        for suffix in itertools.count(2):
+            if candidate not in used:
+                return candidate
+            candidate = f'{folder}_{suffix}'
+
+    def _start_jobs(self):
+        with self._condition:
+            running = [job for job in self.jobs if job.status == 'running']
+            started = []
+            for job in self.jobs:
+                if job.status != 'queued':
+                    continue
+                # Jobs start in order, so a job that runs alone also holds back the jobs after it
+                if len(running) >= self.concurrency or \
+                        running and (runs_alone(job.data) or any(runs_alone(other.data) for other in running)):
+                    break
+                job.status = 'running'
+                job.started = time.monotonic()
+                running.append(job)
+                started.append(job)
+        for job in started:
+            self._changed(job)
+            threading.Thread(target=self._run, args=(job,), name=f'export {job.number}', daemon=True).start()
+
+    def _run(self, job: ExportJob):
+        status = 'failed'
+        try:
+            self.export(job.data, lambda text: self.log(f'{job.name}: {text}'), job.token, job.progress,
+                        self.recordings)
+            status = 'complete'
+        except ExportCancelled as e:
+            status = 'cancelled'
+            job.error = str(e)
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            self.log(f'{job.name}: export failed, {job.error}')
+        finally:
+            with self._condition:
+                self._finish(job, status)
+            self._start_jobs()
+
+    def _finish(self, job: ExportJob, status: str):
+        """
+        Sets the final status of a job and releases its recordings, while holding the condition.
+        """
+        job.status = status
+        job.finished = time.monotonic()
+        self.recordings.release(job.data.c_files)
+        self.recordings.release(job.data.ref_files)
+        self._condition.notify_all()
+        self._changed(job)
+
+    def _changed(self, job: ExportJob):
+        if self.on_change is not None:
+            self.on_change(job)
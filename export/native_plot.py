@@ -0,0 +1,304 @@
+"""
+Draws fft graphs without a browser. A graph is a single polyline on a logarithmic frequency axis, so it can be
+written directly as SVG, or rasterized with NumPy and written as PNG with zlib. Both take a few milliseconds per
+image, compared to a full browser render with plotly and kaleido.
+
+Graph data is expected to be decimated already (see signal_processing.decimate), so a graph has about two points
+per pixel column. The layout copies the plotly graphs of `export.fft_render`: same size, margins, colors, axis
+ranges and 6 dB padding of the y-axis. PNG images only have tick labels, because the built-in bitmap font only has
+digits.
+
+Relevant Urls:
+[PNG specification](https://www.w3.org/TR/png/)
+"""
+import math
+import os
+import struct
+import time
+import zlib
+from typing import Literal, Optional
+
+import numpy as np
+
+from export.bundle import Bundle, open_output
+from profiling import tracing
+
+image_width = 800
+image_height = 600
+y_padding = 6  # dB above and below the data
+
+# Plot area, the same as plotly default margins
+margin_left, margin_right, margin_top, margin_bottom = 80, 80, 100, 80
+
+# Plotly default template colors
+background_color = (255, 255, 255)
+plot_color = (229, 236, 246)
+grid_color = (255, 255, 255)
+line_color = (99, 110, 250)
+text_color = (42, 63, 95)
+
+# 5x7 bitmap font for tick labels
+_glyphs = {
+    '0': ['01110', '10001', '10011', '10101', '11001', '10001', '01110'],
+    '1': ['00100', '01100', '00100', '00100', '00100', '00100', '01110'],
+    '2': ['01110', '10001', '00001', '00010', '00100', '01000', '11111'],
+    '3': ['11110', '00001', '00001', '01110', '00001', '00001', '11110'],
+    '4': ['00010', '00110', '01010', '10010', '11111', '00010', '00010'],
+    '5': ['11111', '10000', '11110', '00001', '00001', '10001', '01110'],
+    '6': ['00110', '01000', '10000', '11110', '10001', '10001', '01110'],
+    '7': ['11111', '00001', '00010', '00100', '01000', '01000', '01000'],
+    '8': ['01110', '10001', '10001', '01110', '10001', '10001', '01110'],
+    '9': ['01110', '10001', '10001', '01111', '00001', '00010', '01100'],
+    '-': ['00000', '00000', '00000', '11111', '00000', '00000', '00000'],
+    '.': ['00000', '00000', '00000', '00000', '00000', '01100', '01100'],
+    'k': ['10000', '10000', '10010', '10100', '11000', '10100', '10010'],
+}
+_glyphs = {char: np.array([[bit == '1' for bit in row] for row in rows]) for char, rows in _glyphs.items()}
+
+
+def get_y_range(y: np.ndarray) -> (float, float):
+    """
+    :return: Range of the y-axis, the data range padded by 6 dB on both sides.
+    """
+    return float(np.min(y)) - y_padding, float(np.max(y)) + y_padding
+
+
+def get_log_ticks(x_min: float, x_max: float) -> [float]:
+    """
+    :return: Ticks of a logarithmic axis at 1, 2 and 5 times powers of ten, inside the range.
+    """
+    ticks = []
+    for exponent in range(math.floor(math.log10(x_min)), math.ceil(math.log10(x_max)) + 1):
+        for mantissa in (1, 2, 5):
+            tick = mantissa * 10 ** exponent
+            if x_min <= tick <= x_max:
+                ticks.append(tick)
+    return ticks
+
+
+def get_linear_ticks(y_min: float, y_max: float, count: int = 6) -> [float]:
+    """
+    :return: Ticks of a linear axis at round steps of 1, 2 or 5 times a power of ten, about count of them.
+    """
+    raw_step = (y_max - y_min) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 5, 10) if m * magnitude >= raw_step)
+    first = math.ceil(y_min / step) * step
+    return [first + i * step for i in range(int((y_max - first) // step) + 1)]
+
+
+def format_tick(value: float) -> str:
+    """
+    :return: Short tick label, e.g. 200, 1k, 2.5k, -40.
+    """
+    if abs(value) >= 1000:
+        return f'{value / 1000:g}k'
+    return f'{value:g}'
+
+
+class _Axes:
+    """
+    Maps data coordinates to pixels of the plot area.
+    """
+
+    def __init__(self, x_lims: (float, float), y_range: (float, float), width: int, height: int):
+        self.left, self.right = margin_left, width - margin_right
+        self.top, self.bottom = margin_top, height - margin_bottom
+        self.log_min, self.log_max = math.log10(x_lims[0]), math.log10(x_lims[1])
+        self.y_min, self.y_max = y_range
+        self.x_ticks = get_log_ticks(*x_lims)
+        self.y_ticks = get_linear_ticks(*y_range)
+
+    def to_px(self, x: np.ndarray) -> np.ndarray:
+        relative = (np.log10(x) - self.log_min) / (self.log_max - self.log_min)
+        return self.left + relative * (self.right - self.left)
+
+    def to_py(self, y: np.ndarray) -> np.ndarray:
+        relative = (np.asarray(y) - self.y_min) / (self.y_max - self.y_min)
+        return self.bottom - relative * (self.bottom - self.top)
+
+
+def create_svg(x: np.ndarray, y: np.ndarray, x_lims: (float, float), width: int = image_width,
+               height: int = image_height) -> str:
+    """
+    :return: SVG document of the fft graph.
+    :param x: Frequencies of the graph.
+    :param y: Magnitudes of the graph in dB.
+    :param x_lims: Limits of the frequency axis.
+    :param width: Width of the image in pixels.
+    :param height: Height of the image in pixels.
+    """
+    axes = _Axes(x_lims, get_y_range(y), width, height)
+    text = f'fill="rgb{text_color}" font-family="Open Sans, verdana, arial, sans-serif"'
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">',
+        f'<rect width="{width}" height="{height}" fill="rgb{background_color}"/>',
+        f'<rect x="{axes.left}" y="{axes.top}" width="{axes.right - axes.left}" height="{axes.bottom - axes.top}" '
+        f'fill="rgb{plot_color}"/>',
+        f'<clipPath id="plot"><rect x="{axes.left}" y="{axes.top}" width="{axes.right - axes.left}" '
+        f'height="{axes.bottom - axes.top}"/></clipPath>',
+    ]
+    for tick, px in zip(axes.x_ticks, axes.to_px(np.array(axes.x_ticks, dtype=float))):
+        parts.append(f'<line x1="{px:.1f}" y1="{axes.top}" x2="{px:.1f}" y2="{axes.bottom}" '
+                     f'stroke="rgb{grid_color}"/>')
+        parts.append(f'<text x="{px:.1f}" y="{axes.bottom + 18}" text-anchor="middle" {text} font-size="12">'
+                     f'{format_tick(tick)}</text>')
+    for tick, py in zip(axes.y_ticks, axes.to_py(axes.y_ticks)):
+        parts.append(f'<line x1="{axes.left}" y1="{py:.1f}" x2="{axes.right}" y2="{py:.1f}" '
+                     f'stroke="rgb{grid_color}"/>')
+        parts.append(f'<text x="{axes.left - 6}" y="{py + 4:.1f}" text-anchor="end" {text} font-size="12">'
+                     f'{format_tick(tick)}</text>')
+
+    points = ' '.join(f'{px:.1f},{py:.1f}' for px, py in zip(axes.to_px(x), axes.to_py(y)))
+    parts += [
+        f'<polyline points="{points}" fill="none" stroke="rgb{line_color}" stroke-width="1.5" '
+        f'clip-path="url(#plot)"/>',
+        f'<text x="{axes.left}" y="{axes.top // 2}" {text} font-size="17">FFT Data</text>',
+        f'<text x="{(axes.left + axes.right) / 2}" y="{height - margin_bottom / 3:.0f}" text-anchor="middle" '
+        f'{text} font-size="14">Frequency (Hz)</text>',
+        f'<text transform="translate({margin_left / 3:.0f},{(axes.top + axes.bottom) / 2}) rotate(-90)" '
+        f'text-anchor="middle" {text} font-size="14">Magnitude (dB)</text>',
+        '</svg>',
+    ]
+    return '\n'.join(parts)
+
+
+def rasterize(x: np.ndarray, y: np.ndarray, x_lims: (float, float), width: int = image_width,
+              height: int = image_height) -> np.ndarray:
+    """
+    :return: RGB pixels of the fft graph, an array of shape (height, width, 3).
+    :param x: Frequencies of the graph.
+    :param y: Magnitudes of the graph in dB.
+    :param x_lims: Limits of the frequency axis.
+    :param width: Width of the image in pixels.
+    :param height: Height of the image in pixels.
+    """
+    axes = _Axes(x_lims, get_y_range(y), width, height)
+    pixels = np.empty((height, width, 3), dtype=np.uint8)
+    pixels[:] = background_color
+    pixels[axes.top:axes.bottom, axes.left:axes.right] = plot_color
+
+    for tick, px in zip(axes.x_ticks, axes.to_px(np.array(axes.x_ticks, dtype=float))):
+        px = int(round(px))
+        pixels[axes.top:axes.bottom, px] = grid_color
+        draw_text(pixels, format_tick(tick), px, axes.bottom + 6, 'center')
+    for tick, py in zip(axes.y_ticks, axes.to_py(axes.y_ticks)):
+        py = int(round(py))
+        pixels[py, axes.left:axes.right] = grid_color
+        draw_text(pixels, format_tick(tick), axes.left - 6, py - 3, 'right')
+
+    # Interpolate every segment of the polyline with one point per pixel
+    px, py = axes.to_px(x), axes.to_py(y)
+    steps = np.ceil(np.maximum(np.abs(np.diff(px)), np.abs(np.diff(py)))).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(steps)), steps)
+    t = (np.arange(segment.size) - np.repeat(np.cumsum(steps) - steps, steps)) / np.maximum(steps - 1, 1)[segment]
+    line_x = np.rint(px[segment] + t * (px[segment + 1] - px[segment])).astype(np.int64)
+    line_y = np.rint(py[segment] + t * (py[segment + 1] - py[segment])).astype(np.int64)
+
+    # Lines are two pixels wide, clipped to the plot area
+    for dy in (0, 1):
+        inside = (line_x >= axes.left) & (line_x < axes.right) & (line_y + dy >= axes.top) & \
+                 (line_y + dy < axes.bottom)
+        pixels[line_y[inside] + dy, line_x[inside]] = line_color
+
+    return pixels
+
+
+def draw_text(pixels: np.ndarray, text: str, x: int, y: int, align: Literal['center', 'right']):
+    """
+    Draws text with the bitmap font. Characters missing from the font are skipped.
+    """
+    glyphs = [_glyphs[char] for char in text if char in _glyphs]
+    if not glyphs:
+        return
+    bitmap = np.hstack([np.pad(glyph, ((0, 0), (0, 1))) for glyph in glyphs])[:, :-1]
+    height, width = bitmap.shape
+    left = x - width // 2 if align == 'center' else x - width
+    if left < 0 or y < 0 or left + width > pixels.shape[1] or y + height > pixels.shape[0]:
+        return
+    pixels[y:y + height, left:left + width][bitmap] = text_color
+
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    """
+    :return: PNG file with the pixels, an RGB array of shape (height, width, 3).
+    """
+    height, width, _ = pixels.shape
+    # Every row starts with filter type 0 (None)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = pixels.reshape(height, width * 3)
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + chunk_type + data + \
+            struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)  # 8 bit RGB
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) + \
+        chunk(b'IEND', b'')
+
+
+def write_graph(path: str, x: np.ndarray, y: np.ndarray, x_lims: (float, float),
+                bundle: Optional[Bundle] = None) -> int:
+    """
+    Writes the fft graph as SVG or PNG, depending on the extension of the path, into the bundle if there is one.
+
+    :return: Number of bytes written.
+    """
+    if path.endswith('.svg'):
+        data = create_svg(x, y, x_lims).encode()
+    else:
+        data = encode_png(rasterize(x, y, x_lims))
+    with open_output(path, bundle) as file:
+        file.write(data)
+    return len(data)
+
+
+class NativeRenderer:
+    """
+    Renders fft graphs in the calling process. It has the same interface as export.fft_render.PngRenderer, drawing
+    is fast enough that a process pool would only add overhead.
+    """
+
+    def __init__(self, x_lims: (float, float), on_written=None, bundle: Optional[Bundle] = None):
+        """
+        :param x_lims: Limits of the frequency axis, the same for every graph.
+        :param on_written: Function called with the path and size of every rendered image.
+        :param bundle: Bundle of the run the images are written into.
+        """
+        self.x_lims = x_lims
+        self.on_written = on_written
+        self.bundle = bundle
+        self.workers = 1
+        self.renders = 0
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def submit(self, path: str, x: np.ndarray, y: np.ndarray):
+        with tracing.span('render', file=os.path.basename(path)):
+            size = write_graph(path, x, y, self.x_lims, self.bundle)
+        self.renders += 1
+        if self.on_written is not None:
+            self.on_written(path, size)
+
+    def close(self, cancel: bool = False):
+        self.finished = time.perf_counter()
+
+    def stats(self) -> dict:
+        """
+        :return: Number of rendered images, elapsed seconds and renders per second.
+        """
+        seconds = (self.finished or time.perf_counter()) - self.started
+        return {
+            'workers': self.workers,
+            'renders': self.renders,
+            'seconds': seconds,
+            'renders_per_second': self.renders / seconds if seconds > 0 else 0,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(cancel=exc_type is not None)
+        return False
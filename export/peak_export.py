@@ -0,0 +1,175 @@
+"""
+Exports the measurements of the fraction sheets as a tidy table, so pipelines don't have to read them back from the
+workbook. The table has one row per time fraction, signal set, frequency region and signal type, with the peak
+frequency and amplitude of the region, and the AD and psi of the set computed the same way as the sheet formulas.
+
+The table is written one block of signal sets at a time, from the spectra of the export pipeline, either as a csv
+file or as a folder with one .npy file per column and a json schema. Column files are created with their full length
+up front, so both formats are streamed and the table never exists as python objects.
+"""
+import csv
+import json
+import os
+
+import numpy as np
+
+from config import ExportConfig
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics
+
+columns = ['fraction', 'set', 'mics', 'region_start', 'region_end', 'signal', 'frequency', 'db', 'ad', 'psi']
+schema_name = 'peaks.json'
+
+
+def get_ad_psi(s1: np.ndarray, s2: np.ndarray, sd1: np.ndarray, sd2: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    :return: AD and psi in degrees, like the AD and psi columns of fraction sheets. psi is nan where the sheet
+    formula gives an error.
+    :param s1: Peak amplitudes of C in dB.
+    :param s2: Peak amplitudes of REF in dB.
+    :param sd1: Peak amplitudes of DIFF in dB.
+    :param sd2: Peak amplitudes of DIFF+90 in dB.
+    """
+    m, n, o, p = [10 ** (np.asarray(s) / 20) for s in (s1, s2, sd1, sd2)]
+    with np.errstate(invalid='ignore'):
+        r = np.degrees(np.arccos((m ** 2 + n ** 2 - o ** 2) / (2 * m * n)))
+        t = np.degrees(np.arccos((m ** 2 + n ** 2 - p ** 2) / (2 * m * n)))
+    return s1 - s2, np.where(np.isnan(t), np.nan, np.where(t < 90, r, -r))
+
+
+class CsvPeakWriter:
+    """
+    Appends rows to a csv file with a header.
+    """
+
+    def __init__(self, path: str, signal_names: [str], signal_sets: [[int]]):
+        self.path = path
+        self.signal_names = signal_names
+        self.mics = [' '.join(str(m) for m in signal_set) for signal_set in signal_sets]
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, chunk: dict[str, np.ndarray]):
+        names = {'mics': self.mics, 'signal': self.signal_names}
+        values = [[names[c][i] for i in chunk[c]] if c in names else chunk[c].tolist() for c in columns]
+        self.writer.writerows(zip(*values))
+
+    def close(self) -> [str]:
+        """
+        :return: Paths of the written files.
+        """
+        self.file.close()
+        return [self.path]
+
+
+class NpyPeakWriter:
+    """
+    Writes every column into a memory mapped .npy file of the final length. Signal types and signal sets are stored
+    as indices into the lists in the json schema, mics is left out because it is the same as set.
+    """
+
+    def __init__(self, folder: str, rows: int, dtypes: dict[str, np.dtype], signal_names: [str],
+                 signal_sets: [[int]]):
+        self.folder = folder
+        self.schema = {
+            'rows': rows,
+            'columns': {c: np.dtype(dtype).str for c, dtype in dtypes.items()},
+            'signal': signal_names,
+            'set': [list(signal_set) for signal_set in signal_sets],
+        }
+        os.makedirs(folder, exist_ok=True)
+        self.arrays = {c: np.lib.format.open_memmap(os.path.join(folder, f'{c}.npy'), mode='w+', dtype=dtype,
+                                                    shape=(rows,))
+                       for c, dtype in dtypes.items()}
+        self.row = 0
+
+    def write(self, chunk: dict[str, np.ndarray]):
+        end = self.row + len(chunk['fraction'])
+        for c, array in self.arrays.items():
+            array[self.row:end] = chunk[c]
+        self.row = end
+
+    def close(self) -> [str]:
+        """
+        :return: Paths of the written files.
+        """
+        for array in self.arrays.values():
+            array.flush()
+        paths = [array.filename for array in self.arrays.values()]
+        del self.arrays
+        with open(os.path.join(self.folder, schema_name), 'w') as file:
+            json.dump(self.schema, file, indent=2)
+        return paths + [os.path.join(self.folder, schema_name)]
+
+
+def create_export(s1_sums, s2_sums, sd1, sd2, data: ExportConfig, log=print):
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log)
+    pipeline.add_sink(PeakTableSink())
+    pipeline.run()
+
+
+class PeakTableSink(Sink):
+    """
+    Writes the peaks of every block of the pipeline into the table, using the same spectra as the fraction sheets.
+    """
+    stage = 'peak_table'
+    uses_spectra = False
+
+    def start(self, pipeline: ExportPipeline):
+        self.data = data = pipeline.data
+        self.log = pipeline.log
+        self.regions = pipeline.regions
+        self.signal_count = len(pipeline.signal_types)
+        self.set_count = len(pipeline.signal_sets)
+        self.log('Exporting peak table...')
+
+        rows = self.set_count * len(self.regions) * self.signal_count * pipeline.fractions
+        os.makedirs(os.path.dirname(data.peaks_path()), exist_ok=True)
+        if data.peaks_format == 'npy':
+            dtypes = {'fraction': np.int32, 'set': np.int32, 'region_start': self.regions.dtype,
+                      'region_end': self.regions.dtype, 'signal': np.int8, 'frequency': np.float64,
+                      'db': np.float64, 'ad': np.float64, 'psi': np.float64}
+            self.writer = NpyPeakWriter(data.peaks_path(), rows, dtypes, pipeline.names, pipeline.signal_sets)
+        else:
+            self.writer = CsvPeakWriter(data.peaks_path(), pipeline.names, pipeline.signal_sets)
+
+    def write(self, block: SpectraBlock):
+        # Row order is fraction, set, region, signal type
+        shape = (len(block.sets), len(self.regions), self.signal_count)
+        set_index, region_index, signal_index = [index.ravel() for index in np.indices(shape)]
+        frequencies, amplitudes = block.get_peaks()
+        ad, psi = get_ad_psi(*amplitudes)
+        self.writer.write({
+            'fraction': np.full(set_index.size, block.fraction + 1),
+            'set': set_index + block.sets.start,
+            'mics': set_index + block.sets.start,
+            'region_start': self.regions[region_index, 0],
+            'region_end': self.regions[region_index, 1],
+            'signal': signal_index,
+            'frequency': frequencies.transpose(1, 2, 0).ravel(),
+            'db': amplitudes.transpose(1, 2, 0).ravel(),
+            'ad': np.repeat(ad.ravel(), self.signal_count),
+            'psi': np.repeat(psi.ravel(), self.signal_count),
+        })
+
+    def finish(self):
+        paths = self.writer.close()
+        if metrics.get_registry() is not None:
+            metrics.count('files_written', len(paths))
+            metrics.count('bytes_saved', sum(os.path.getsize(path) for path in paths))
+        self.log(f'Peak table saved to {self.data.peaks_path()}')
+
+    def abort(self):
+        self.writer.close()
+
+
+def load_peak_columns(folder: str) -> (dict[str, np.ndarray], dict):
+    """
+    :return: Read-only memory mapped columns of a table written with the npy format, and its schema.
+    :param folder: Folder of the table.
+    """
+    with open(os.path.join(folder, schema_name), 'r') as file:
+        schema = json.load(file)
+    table = {c: np.load(os.path.join(folder, f'{c}.npy'), mmap_mode='r') for c in schema['columns']}
+    return table, schema
@@ -0,0 +1,319 @@
+"""
+Runs every exporter of a time fraction in a single pass. The pipeline walks the fractions once, slices the signals of
+a block of signal sets and computes their spectra once, and hands the block to every registered sink: fraction
+sheets, peak table, results database, wav files, fft graphs or report and raw spectra. Enabling more exports adds the
+cost of writing their output, not another analysis of the signals.
+
+```python
+pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log)
+pipeline.add_sink(SheetSink())
+pipeline.add_sink(WavSink())
+pipeline.run()
+```
+
+Analysis and output overlap. The calling thread analyzes the blocks and queues them for a writer thread of each sink,
+so the next fraction is transformed while the sheets of the previous one are saved and its audio and graphs are
+written. The queues are bounded, which bounds the number of analyzed blocks in memory. An error of any sink stops the
+analysis and is raised by run, after every started sink is aborted. A cancelled CancellationToken stops the pipeline
+the same way, with ExportCancelled, at the next block or while it waits for a full queue. Spectra are only computed
+if a sink uses them, so a pipeline of sinks that only need the audio never transforms it.
+
+The analysis and every sink report their progress as events of their stage, see export.progress.
+"""
+import queue
+import threading
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from config import ExportConfig
+from export.bundle import Bundle
+from export.cancellation import CancellationToken
+from export.progress import LogProgress, Progress, StageProgress
+from profiling import metrics, tracing
+from signal_processing import fft
+from signal_processing.fft import FourierData
+from signal_processing.signals import Signal
+
+stack_bytes = 64 * 2 ** 20  # Maximum size of the signals of a block, which are transformed together
+queue_size = 4  # Calls that wait for the writer of each sink, at most this many blocks are queued at once
+cancel_poll_seconds = 0.1  # How often the token is checked while waiting for a full queue
+
+
+class SpectraBlock:
+    """
+    Time fraction of a range of signal sets, for every signal type of the pipeline. The spectra and the peaks of the
+    frequency regions are computed on first use and shared by all sinks.
+    """
+
+    def __init__(self, fraction: int, sets: range, names: [str], signals: [[Signal]], regions: np.ndarray,
+                 peaks: Optional[tuple] = None):
+        """
+        :param fraction: Index of the time fraction.
+        :param sets: Indices of the signal sets in the block.
+        :param names: Name of each signal type.
+        :param signals: Fraction of every signal set in the block, for each signal type.
+        :param regions: Frequency regions of the export.
+        :param peaks: Peaks restored from a checkpoint, see get_peaks.
+        """
+        self.fraction = fraction
+        self.sets = sets
+        self.names = names
+        self.signals = signals
+        self.regions = regions
+        self._frequency: Optional[np.ndarray] = None
+        self._spectra: Optional[[np.ndarray]] = None
+        self._peaks: Optional[(np.ndarray, np.ndarray)] = peaks
+
+    def get_spectra(self) -> (np.ndarray, [np.ndarray]):
+        """
+        :return: Frequency of the fft bins, and the dB spectra of each signal type, of shape (sets, fft bins).
+        """
+        if self._spectra is None:
+            spectra = []
+            for name, signals in zip(self.names, self.signals):
+                with tracing.span('analyze', fraction=self.fraction + 1, signal=name):
+                    fft_data = fft.create_fft_stack(signals)
+                spectra.append(fft_data.plot)
+            self._frequency, self._spectra = fft_data.frequency, spectra
+        return self._frequency, self._spectra
+
+    def get_peaks(self) -> (np.ndarray, np.ndarray):
+        """
+        :return: Peak frequencies and amplitudes of each frequency region, of shape (signal types, sets, regions).
+        """
+        if self._peaks is None:
+            frequency, spectra = self.get_spectra()
+            peaks = [FourierData(frequency, plot).get_region_peaks(self.regions) for plot in spectra]
+            self._peaks = np.stack([p[0] for p in peaks]), np.stack([p[1] for p in peaks])
+        return self._peaks
+
+
+class Sink:
+    """
+    Output of an ExportPipeline. start is called once, then start_fraction, write for every block of signal sets and
+    end_fraction for each time fraction, and finish at the end. If the export fails, abort is called instead of
+    finish, on every sink that was started.
+
+    start and abort are called by the thread that runs the pipeline, the other methods by the writer thread of the
+    sink, one at a time. The pipeline sets progress before start, sinks that count other units than fractions set
+    its total in start and advance it themselves.
+    """
+    stage: str = None  # Name of the metrics stage the sink is timed in, and of its progress
+    unit = 'fraction'  # What the progress of the sink counts, the pipeline only advances it for fractions
+    uses_spectra = True  # Whether write uses the spectra of blocks
+    uses_peaks = True  # Whether write uses the peaks of blocks
+
+    progress: StageProgress = None
+
+    def start(self, pipeline: 'ExportPipeline'):
+        pass
+
+    def start_fraction(self, t: int):
+        pass
+
+    def write(self, block: SpectraBlock):
+        pass
+
+    def end_fraction(self, t: int):
+        pass
+
+    def finish(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class ExportPipeline:
+    """
+    Walks the time fractions of the signals once and feeds them to the registered sinks, in the order they were
+    added.
+    """
+
+    def __init__(self, s1_sums, s2_sums, sd1, sd2, data: ExportConfig, log=print,
+                 token: Optional[CancellationToken] = None, progress: Optional[Progress] = None,
+                 bundle: Optional[Bundle] = None):
+        """
+        :param sd2: DIFF+90 signals, can be None if no sink needs them.
+        :param log: function that takes a string and prints it somewhere.
+        :param token: Cancels the pipeline, checked before every block.
+        :param progress: Receives the progress of the analysis and the sinks, logged with LogProgress by default.
+        :param bundle: Bundle of the run the sinks write into, see export.bundle.
+        """
+        self.data = data
+        self.log = log
+        self.bundle = bundle
+        self.token = token or CancellationToken()
+        self.progress = progress or Progress(LogProgress(log))
+        self.names = [data.c_name, data.ref_name, 'DIFF', 'DIFF+90']
+        self.signal_types = [s1_sums, s2_sums, sd1, sd2]
+        if sd2 is None:
+            self.names, self.signal_types = self.names[:3], self.signal_types[:3]
+        self.signal_sets = data.get_signal_sets()
+        self.fractions = data.time_fractions
+        self.regions = np.asarray(data.frequency_regions)
+        # Fractions have the same length, see Signal.get_interval_fraction
+        self.fraction_length = s1_sums[0].get_interval_fraction(self.fractions, 0).length
+        self.samplerate = s1_sums[0].samplerate
+        self.started = datetime.now()
+        # Peaks of fractions that are not analyzed again, by index
+        self.restored: dict[int, (np.ndarray, np.ndarray)] = {}
+        self.sinks: [Sink] = []
+
+    def add_sink(self, sink: Sink) -> Sink:
+        self.sinks.append(sink)
+        return sink
+
+    def restore(self, t: int, frequencies: np.ndarray, amplitudes: np.ndarray):
+        """
+        Sets the peaks of time fraction t, its blocks are not analyzed unless a sink uses their spectra.
+
+        :param frequencies: Peak frequencies of shape (signal types, signal sets, regions).
+        :param amplitudes: Peak amplitudes of the same shape.
+        """
+        self.restored[t] = frequencies, amplitudes
+
+    def get_blocks(self, t: int):
+        """
+        :return: Generator of the blocks of time fraction t, so that the signals of a block fit in stack_bytes.
+        """
+        chunk = max(1, stack_bytes // (len(self.signal_types) * self.fraction_length * 8))
+        for start in range(0, len(self.signal_sets), chunk):
+            sets = range(start, min(start + chunk, len(self.signal_sets)))
+            signals = [[sums[i].get_interval_fraction(self.fractions, t) for i in sets] for sums in self.signal_types]
+            peaks = None
+            if t in self.restored:
+                peaks = tuple(values[:, start:sets.stop] for values in self.restored[t])
+            yield SpectraBlock(t, sets, self.names, signals, self.regions, peaks)
+
+    def run(self):
+        """
+        Runs the sinks over every time fraction, and waits until all of them finished.
+        """
+        uses_spectra = any(sink.uses_spectra for sink in self.sinks)
+        uses_peaks = any(sink.uses_peaks for sink in self.sinks)
+        started = []
+        writers = []
+        try:
+            for sink in self.sinks:
+                sink.progress = self.progress.stage(sink.stage, sink.unit,
+                                                    self.fractions if sink.unit == 'fraction' else None)
+                with metrics.stage(sink.stage):
+                    sink.start(self)
+                started.append(sink)
+            failed = threading.Event()
+            writers = [SinkWriter(sink, failed, self.token) for sink in self.sinks]
+
+            analysis = self.progress.stage('analysis', 'fraction', self.fractions)
+            analysis.advance(0)
+            for t in range(self.fractions):
+                self.token.check()
+                size = 0
+                with tracing.span('fraction', fraction=t + 1):
+                    self._put(writers, 'start_fraction', t)
+                    for block in self.get_blocks(t):
+                        self.token.check()
+                        # Analyzed before it is queued, so the writers never compute spectra at the same time
+                        with metrics.stage('analysis'):
+                            if uses_spectra:
+                                block.get_spectra()
+                            if uses_peaks:
+                                block.get_peaks()
+                        self._put(writers, 'write', block)
+                        size += sum(signal.data.nbytes for signals in block.signals for signal in signals)
+                    self._put(writers, 'end_fraction', t)
+                analysis.advance(bytes=size)
+            self._put(writers, 'finish')
+
+            for writer in writers:
+                writer.close()
+            self._raise(writers)
+        except BaseException:
+            for writer in writers:
+                writer.cancel()
+            for sink in started:
+                if not any(writer.sink is sink and writer.finished for writer in writers):
+                    try:
+                        sink.abort()
+                    except Exception:
+                        pass
+            raise
+
+    @staticmethod
+    def _put(writers: ['SinkWriter'], method: str, *args):
+        for writer in writers:
+            writer.put(method, *args)
+        ExportPipeline._raise(writers)
+
+    @staticmethod
+    def _raise(writers: ['SinkWriter']):
+        """
+        Raises the first error of the writers, if any of them failed.
+        """
+        for writer in writers:
+            if writer.error is not None:
+                raise writer.error
+
+
+class SinkWriter:
+    """
+    Thread that calls the queued methods of a sink in order. After an error it skips the rest of its queue, and so do
+    the writers of the other sinks, which share the failed event.
+    """
+
+    def __init__(self, sink: Sink, failed: threading.Event, token: CancellationToken):
+        self.sink = sink
+        self.failed = failed
+        self.token = token
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._run, name=f'sink {sink.stage}', daemon=True)
+        self._thread.start()
+
+    def put(self, method: str, *args):
+        """
+        Queues a call of a sink method. Blocks while the queue is full, and raises ExportCancelled if the token is
+        cancelled meanwhile.
+        """
+        while True:
+            try:
+                self._queue.put((method, args), timeout=cancel_poll_seconds)
+                return
+            except queue.Full:
+                self.token.check()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self.failed.is_set():
+                continue
+            method, args = item
+            try:
+                with metrics.stage(self.sink.stage):
+                    getattr(self.sink, method)(*args)
+                self.finished = method == 'finish'
+                if method == 'end_fraction' and self.sink.unit == 'fraction':
+                    self.sink.progress.advance()
+            except BaseException as e:
+                self.error = e
+                self.failed.set()
+
+    def close(self):
+        """
+        Waits until the queued calls are done and stops the thread.
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def cancel(self):
+        """
+        Drops the queued calls and stops the thread, after the call it is running.
+        """
+        self.failed.set()
+        if self._thread.is_alive():
+            self.close()
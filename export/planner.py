@@ -0,0 +1,302 @@
+"""
+Dry-run resource planner. It reads only the .wav headers of the selected files and combines them with the
+configuration to estimate how much memory, disk space and time an export will take, without running it.
+
+Runtime is estimated from work units of each stage (samples, ffts, cells, files) multiplied by seconds per unit.
+Seconds per unit are calibrated from the newest benchmark results in benchmark/results (see `python -m benchmark`),
+or fall back to defaults measured on a laptop.
+"""
+import glob
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+from config import ExportConfig, ROOT_DIR, microphone_combinations, microphone_combinations_spacial
+from export import pipeline
+from export.fft_export import get_x_lims
+from signal_processing.headers import read_wav_info
+from signal_processing.signals import estimate_combinations_bytes
+
+benchmark_results_dir = os.path.join(ROOT_DIR, 'benchmark', 'results')
+
+# Seconds per work unit of each stage, used when there are no benchmark results
+default_rates = {
+    'read': 1e-9,  # per sample
+    'combinations': 5e-8,  # per sample of each microphone combination
+    'fft': 3e-8,  # per sample that goes through fft
+    'peaks': 1e-9,  # per fft bin searched for each region
+    'sheet': 1.3e-5,  # per cell for each time the workbook is saved
+    'save': 2e-4,  # per cell, for a single save
+    'wav': 2e-9,  # per byte
+    'png': 0.3,  # per image
+    'native_png': 0.01,  # per image drawn with the svg or png backend
+    'html_graph': 0.002,  # per graph added to the html report
+}
+# Loading the six sheet templates takes about the same time on every run
+template_seconds = 1.6
+
+# Sizes measured on sample exports
+base_memory = 200 * 2 ** 20  # Interpreter, libraries and loaded templates
+workbook_cell_memory = 400  # openpyxl cell with style in memory
+workbook_cell_bytes = 7  # Compressed cell in the .xlsx file
+png_bytes = 50 * 2 ** 10  # 800x600 fft graph
+svg_bytes = 40 * 2 ** 10
+spectrogram_png_bytes = 300 * 2 ** 10
+peak_row_bytes = 100  # Size of a row of the peak table as csv
+database_row_seconds = 5e-6  # Insert of a row into the results database
+html_graph_bytes = 4300  # 800 bins of min/max int16 points in base64
+sheet_columns = 40  # Template rows are always copied 40 columns wide
+
+
+@dataclass
+class ExportPlan:
+    """
+    Estimated resources of an export. Sizes are in bytes and times in seconds.
+    """
+    mic_count: int
+    samplerate: int
+    frames: int
+    set_count: int
+    fractions: int
+    region_count: int
+    fft_count: int
+    fft_size: int
+    sheet_count: int
+    cell_count: int
+    wav_count: int
+    png_count: int
+    peak_memory: int
+    output_bytes: int
+    runtime: dict[str, float] = field(default_factory=dict)
+    calibration: str = 'defaults'
+    plot_backend: str = 'plotly'
+    spectrogram_count: int = 0
+    spectra_bytes: int = 0
+    peak_rows: int = 0
+
+    @property
+    def total_runtime(self) -> float:
+        return sum(self.runtime.values())
+
+    def format(self) -> str:
+        """
+        :return: Human readable summary of the plan.
+        """
+        lines = [
+            f'{self.mic_count} mics, {self.set_count} combinations, {self.frames / self.samplerate:.1f}s at '
+            f'{self.samplerate}Hz',
+            f'{self.fractions} fractions of {self.fft_size} samples, {self.region_count} regions',
+            f'FFTs: {self.fft_count} of size {self.fft_size}',
+            f'Sheets: {self.sheet_count}, about {self.cell_count} cells',
+        ]
+        if self.wav_count:
+            lines.append(f'WAV files: {self.wav_count}')
+        if self.png_count and self.plot_backend == 'html':
+            lines.append(f'FFT graphs in the html report: {self.png_count}')
+        elif self.png_count:
+            lines.append(f"{'SVG' if self.plot_backend == 'svg' else 'PNG'} files: {self.png_count}")
+        if self.spectrogram_count:
+            lines.append(f'Spectrograms: {self.spectrogram_count} (.npz and .png)')
+        if self.spectra_bytes:
+            lines.append(f'Raw spectra: 4 .npy files, {_format_bytes(self.spectra_bytes)}')
+        if self.peak_rows:
+            lines.append(f'Peak table: {self.peak_rows} rows')
+        lines += [
+            f'Peak memory: about {_format_bytes(self.peak_memory)}',
+            f'Output size: about {_format_bytes(self.output_bytes)}',
+            f'Runtime: about {_format_seconds(self.total_runtime)} ({self.calibration})',
+        ]
+        return '\n'.join(lines)
+
+
+def count_work(mic_count: int, frames: int, fractions: int, region_count: int, itemsize: int = 4,
+               export_audio: bool = True, export_fft: bool = True) -> dict[str, int]:
+    """
+    :return: Work units of each stage, matching the units of default_rates. Also contains "cells", "sheets",
+    "saves", "wav_files", "wav_bytes" and "png_files".
+    :param mic_count: Number of microphones.
+    :param frames: Number of samples in each recording.
+    :param fractions: Number of time fractions.
+    :param region_count: Number of frequency regions.
+    :param itemsize: Size of one sample in bytes.
+    :param export_audio: Whether .wav fractions are exported.
+    :param export_fft: Whether fft graphs are exported.
+    """
+    set_count = len(microphone_combinations[mic_count])
+    spatial = microphone_combinations_spacial[mic_count]
+    mono = mic_count == 1
+    extra = 1 if mic_count > 2 else 0
+    fraction_length = frames // fractions
+    fft_count = 4 * set_count * fractions
+
+    # Rows of each sheet, see the sheet exporters in export.sheet_export
+    rows = fractions * (1 + set_count * region_count)  # fraction sheets
+    rows += 1 + (set_count + extra) * fractions  # At
+    rows += 1 + (set_count + extra) * region_count  # Af
+    cells = rows * sheet_columns + (1 + region_count * fractions) * (5 if mono else sheet_columns)  # ft
+    sheets = fractions + 3
+    saves = fractions + region_count + 5
+    if not mono:
+        cells += sum((2 + n + region_count * n) * sheet_columns for n in map(len, spatial.values()))
+        sheets += 2 * len(spatial)
+        saves += 4 * len(spatial)
+
+    wav_files = 3 * set_count * fractions if export_audio else 0
+    wav_bytes = wav_files * (fraction_length * itemsize + 44)
+    png_files = 3 * set_count * fractions if export_fft else 0
+
+    return {
+        'read': 2 * mic_count * frames,
+        'combinations': set_count * frames,
+        'fft': fft_count * fraction_length,
+        'peaks': fft_count * region_count * (fraction_length // 2 + 1),
+        'sheet': cells * saves,
+        'save': cells,
+        'wav': wav_bytes,
+        'png': png_files,
+        'cells': cells,
+        'sheets': sheets,
+        'saves': saves,
+        'wav_files': wav_files,
+        'wav_bytes': wav_bytes,
+        'png_files': png_files,
+    }
+
+
+def calibrate(results: [dict]) -> dict[str, float]:
+    """
+    :return: Seconds per work unit of each stage, from benchmark results.
+    :param results: Results as written by benchmark.sweep.write_results.
+    """
+    totals = {}
+    for result in results:
+        work = count_work(result['mic_count'], int(result['duration'] * result['samplerate']),
+                          result['time_fractions'], result['region_count'])
+        best = dict(result['best'])
+        if 'sheet' in best:
+            # Sheet export runs its own ffts and loads the templates
+            best['sheet'] = max(best['sheet'] - best.get('fft', 0) - best.get('peaks', 0) - template_seconds, 0)
+        for stage, seconds in best.items():
+            if work.get(stage):
+                total = totals.setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += work[stage]
+
+    return {stage: seconds / units for stage, (seconds, units) in totals.items()}
+
+
+def load_calibration(path: Optional[str] = None) -> (dict[str, float], str):
+    """
+    :return: Seconds per work unit of each stage and a description of where they come from. Stages missing from
+    the benchmark results use default rates.
+    :param path: Benchmark results file. Defaults to the newest file in benchmark/results.
+    """
+    if path is None:
+        files = sorted(glob.glob(os.path.join(benchmark_results_dir, '*.json')))
+        if not files:
+            return dict(default_rates), 'defaults'
+        path = files[-1]
+
+    with open(path, 'r') as file:
+        results = json.load(file)['results']
+    return {**default_rates, **calibrate(results)}, f'calibrated from {os.path.basename(path)}'
+
+
+def plan_export(data: ExportConfig, rates: Optional[dict[str, float]] = None,
+                calibration: Optional[str] = None) -> ExportPlan:
+    """
+    Estimates resources of an export. Only the headers of the selected files are read.
+
+    :return: The estimated plan.
+    :param data: Configuration of the export.
+    :param rates: Seconds per work unit of each stage. Loaded with load_calibration if not given.
+    :param calibration: Description of the rates, shown in the plan.
+    """
+    if rates is None:
+        rates, calibration = load_calibration()
+
+    infos = [read_wav_info(file) for file in data.c_files + data.ref_files]
+    mic_count = data.get_mic_count()
+    frames = min(info.frames for info in infos)
+    itemsize = max(info.itemsize for info in infos)
+    fractions = data.time_fractions
+    region_count = len(data.frequency_regions)
+    set_count = len(data.get_signal_sets())
+    fraction_length = frames // fractions
+
+    work = count_work(mic_count, frames, fractions, region_count, itemsize, data.export_audio, data.export_fft)
+    if data.export_audio and data.wav_layout == 'multichannel':
+        work['wav_files'] = 3 * fractions
+    elif data.export_audio and data.wav_layout == 'continuous':
+        work['wav_files'] = 3 * set_count
+
+    recordings = 2 * mic_count * frames * itemsize
+    combinations = estimate_combinations_bytes(frames, itemsize, set_count)
+    # Analyzed blocks that wait for the sinks, plus the one being analyzed and the one being written
+    block_sets = min(set_count, max(1, pipeline.stack_bytes // (4 * fraction_length * 8)))
+    spectrum = (pipeline.queue_size + 2) * 4 * block_sets * (fraction_length // 2 + 1) * 8 + 4 * fraction_length * 16
+    workbook = work['cells'] * workbook_cell_memory
+    peak_memory = base_memory + recordings + combinations + spectrum + workbook
+
+    image_bytes = {'svg': svg_bytes, 'html': html_graph_bytes}.get(data.plot_backend, png_bytes)
+    output_bytes = work['cells'] * workbook_cell_bytes + work['wav_bytes'] + work['png_files'] * image_bytes
+
+    runtime = {stage: work[stage] * rates[stage] for stage in ['read', 'combinations', 'fft', 'peaks', 'sheet']}
+    runtime['sheet'] += template_seconds
+    if data.export_audio:
+        runtime['wav'] = work['wav'] * rates['wav']
+    if data.export_fft:
+        rate = {'plotly': 'png', 'html': 'html_graph'}.get(data.plot_backend, 'native_png')
+        runtime['png'] = work['png'] * rates[rate]
+
+    spectrogram_count = 0
+    if data.export_spectrogram:
+        spectrogram_count = 3 * set_count
+        stft_frames = max(frames - data.spectrogram_window, 0) // data.spectrogram_hop + 1
+        x_lims = get_x_lims(data.frequency_regions)
+        stft_bins = int((x_lims[1] - x_lims[0]) * data.spectrogram_window / infos[0].samplerate) + 1
+        output_bytes += spectrogram_count * (stft_frames * stft_bins * 4 + spectrogram_png_bytes)
+        runtime['spectrogram'] = spectrogram_count * stft_frames * data.spectrogram_window * rates['fft']
+
+    spectra_bytes = 0
+    if data.export_spectra:
+        # Every signal type and fraction, float32 values of each fft bin
+        spectra_bytes = 4 * fractions * set_count * (fraction_length // 2 + 1) * 4
+        output_bytes += spectra_bytes
+        # The spectra are computed once for every export, see export.pipeline, so only writing them adds time
+        runtime['spectra'] = spectra_bytes * rates['wav']
+
+    peak_rows = 0
+    if data.export_peaks:
+        # Every signal type of every region, fraction and set
+        peak_rows = 4 * region_count * set_count * fractions
+        output_bytes += peak_rows * peak_row_bytes
+        runtime['peak_table'] = peak_rows * peak_row_bytes * rates['wav']
+    if data.results_database is not None:
+        # Uses the peaks of the fraction sheets, a row for every region, fraction and set
+        runtime['database'] = region_count * set_count * fractions * database_row_seconds
+
+    return ExportPlan(mic_count=mic_count, samplerate=infos[0].samplerate, frames=frames, set_count=set_count,
+                      fractions=fractions, region_count=region_count, fft_count=4 * set_count * fractions,
+                      fft_size=fraction_length, sheet_count=work['sheets'], cell_count=work['cells'],
+                      wav_count=work['wav_files'], png_count=work['png_files'], peak_memory=peak_memory,
+                      output_bytes=output_bytes, runtime=runtime, calibration=calibration,
+                      plot_backend=data.plot_backend, spectrogram_count=spectrogram_count,
+                      spectra_bytes=spectra_bytes, peak_rows=peak_rows)
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if value < 1024:
+            return f'{value:.0f}{unit}'
+        value /= 1024
+    return f'{value:.1f}TB'
+
+
+def _format_seconds(value: float) -> str:
+    if value < 60:
+        return f'{value:.0f}s'
+    if value < 3600:
+        return f'{value / 60:.0f}min'
+    return f'{value / 3600:.1f}h'
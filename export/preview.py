@@ -0,0 +1,99 @@
+"""
+Quick look at an export before it runs. create_preview reads a short excerpt from the start of the selected files,
+decimates it to a sample rate just above the frequency regions and analyzes only the signal set with every
+microphone. It finds the peak and AD of each region like a fraction sheet does, in well under a second, so wrong
+files, regions or fraction counts show up before a long export starts.
+
+```python
+print(create_preview(data).format())
+```
+"""
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy.signal import decimate
+
+from config import ExportConfig
+from export.peak_export import get_ad_psi
+from signal_processing import fft
+from signal_processing.headers import read_wav_info
+from signal_processing.signals import Signal, combine_signal_set, read_signal_excerpt
+
+preview_seconds = 4.0  # Longest excerpt that is analyzed, also limited to the first time fraction
+oversampling = 4  # The decimated sample rate is at least this many times the end of the highest region
+
+
+@dataclass
+class Preview:
+    """
+    Peaks of the frequency regions in the excerpt. Arrays of peaks have the shape (signal types, regions).
+    """
+    samplerate: int  # Sample rate of the decimated excerpt
+    seconds: float  # Length of the excerpt
+    signal_set: [int]
+    names: [str]  # C, REF, DIFF and DIFF+90
+    regions: [(int, int)]
+    frequencies: np.ndarray
+    amplitudes: np.ndarray
+    ad: np.ndarray  # AD of each region, in dB
+    psi: np.ndarray  # psi of each region in degrees, nan where the sheet gives an error
+    warnings: [str] = field(default_factory=list)
+
+    def format(self) -> str:
+        """
+        :return: Human readable peaks of every region.
+        """
+        mics = ' '.join(str(m) for m in self.signal_set)
+        lines = [f'Preview of {self.seconds:.1f}s at {self.samplerate}Hz, mics {mics}']
+        for r, (start, end) in enumerate(self.regions):
+            peaks = ', '.join(f'{name} {self.frequencies[k, r]:.2f}Hz {self.amplitudes[k, r]:.1f}dB'
+                              for k, name in enumerate(self.names[:2]))
+            lines.append(f'{start}-{end}Hz: {peaks}, AD {self.ad[r]:.1f}dB, psi {self.psi[r]:.0f}')
+        lines += [f'Warning: {warning}' for warning in self.warnings]
+        return '\n'.join(lines)
+
+
+def create_preview(data: ExportConfig, seconds: float = preview_seconds) -> Preview:
+    """
+    Analyzes the start of the selected recordings. Raises a ValueError if the files can't be analyzed at all.
+
+    :return: Peaks of the signal set with every microphone, and warnings about the configuration.
+    :param data: Configuration of the export.
+    :param seconds: Longest excerpt to analyze.
+    """
+    infos = [read_wav_info(file) for file in data.c_files + data.ref_files]
+    samplerate = infos[0].samplerate
+    frames = min(info.frames for info in infos)
+    fraction_frames = frames // data.time_fractions
+    regions = data.frequency_regions
+    highest = max(end for _, end in regions)
+    if fraction_frames == 0:
+        raise ValueError(f'recordings of {frames} samples are too short for {data.time_fractions} time fractions')
+    if 2 * highest > samplerate:
+        raise ValueError(f'regions up to {highest}Hz are above the Nyquist frequency of {samplerate}Hz recordings')
+
+    warnings = []
+    if len({info.samplerate for info in infos}) > 1:
+        warnings.append('recordings have different sample rates')
+    resolution = samplerate / fraction_frames
+    narrowest = min(end - start for start, end in regions)
+    if resolution > narrowest:
+        warnings.append(f'time fractions of {fraction_frames / samplerate:.2f}s resolve {resolution:.2f}Hz, more '
+                        f'than the narrowest region of {narrowest}Hz')
+
+    # The first time fraction, or its start
+    excerpt = min(fraction_frames, int(seconds * samplerate))
+    factor = max(1, samplerate // (oversampling * highest))
+    signal_set = data.get_signal_sets()[-1]
+    recordings = [[read_signal_excerpt(files[m - 1], excerpt) for m in signal_set]
+                  for files in (data.c_files, data.ref_files)]
+    if factor > 1:
+        recordings = [[Signal(samplerate / factor, decimate(signal.data.astype(np.float64), factor, ftype='fir'))
+                       for signal in signals] for signals in recordings]
+
+    fft_data = fft.create_fft_stack(list(combine_signal_set(*recordings)))
+    frequencies, amplitudes = fft_data.get_region_peaks(regions)
+    ad, psi = get_ad_psi(*amplitudes)
+    return Preview(samplerate // factor, excerpt / samplerate, list(signal_set),
+                   [data.c_name, data.ref_name, 'DIFF', 'DIFF+90'], regions, frequencies, amplitudes, ad, psi,
+                   warnings)
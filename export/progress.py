@@ -0,0 +1,192 @@
+"""
+Progress of export runs as typed events. Every stage of an export counts the units it finished in a StageProgress,
+which sends a ProgressEvent to the listeners of the run:
+
+```python
+aggregator = ProgressAggregator(lambda status: print(status.event.stage, status.eta))
+create_export(data, log, progress=aggregator)
+```
+
+ProgressAggregator turns the events into throughput and an estimate of the remaining time, at most a few times a
+second. LogProgress writes the events as the strings that used to be logged, e.g. 'fraction 3/14', and logs items
+like written files at most once a second per stage, so large exports don't slow down by logging every file.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    stage: str  # Name of the stage, the same as its metrics stage, e.g. 'analysis' or 'wav'
+    unit: str  # What the stage counts, e.g. 'fraction' or 'file'
+    done: int  # Units finished so far
+    total: Optional[int]  # Units of the whole stage, None if it isn't known
+    bytes: int  # Bytes read or written so far
+    elapsed: float  # Seconds since the stage started
+    item: Optional[str] = None  # Name of the last finished unit, e.g. a file name
+
+    @property
+    def finished(self) -> bool:
+        return self.total is not None and self.done >= self.total
+
+
+Listener = Callable[[ProgressEvent], None]
+
+
+class StageProgress:
+    """
+    Counts the finished units of a stage. Can be advanced from any thread, events are sent in the order of the
+    counts.
+    """
+
+    def __init__(self, emit: Listener, stage: str, unit: str, total: Optional[int] = None):
+        self.emit = emit
+        self.stage = stage
+        self.unit = unit
+        self.total = total
+        self.done = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def advance(self, count: int = 1, bytes: int = 0, item: Optional[str] = None):
+        """
+        Adds finished units and sends an event. advance(0) only sends the current state, e.g. when the stage starts.
+
+        :param count: Units finished since the last call.
+        :param bytes: Bytes read or written since the last call.
+        :param item: Name of the last finished unit.
+        """
+        with self._lock:
+            self.done += count
+            self.bytes += bytes
+            self.emit(ProgressEvent(self.stage, self.unit, self.done, self.total, self.bytes,
+                                    time.monotonic() - self.started, item))
+
+
+class Progress:
+    """
+    Progress of an export run, sends the events of its stages to every listener.
+    """
+
+    def __init__(self, *listeners: Optional[Listener]):
+        self.listeners = [listener for listener in listeners if listener is not None]
+
+    def stage(self, stage: str, unit: str, total: Optional[int] = None) -> StageProgress:
+        return StageProgress(self.emit, stage, unit, total)
+
+    def emit(self, event: ProgressEvent):
+        for listener in self.listeners:
+            listener(event)
+
+
+@dataclass(frozen=True)
+class ProgressStatus:
+    event: ProgressEvent
+    rate: float  # Units per second
+    byte_rate: float  # Bytes per second
+    eta: Optional[float]  # Seconds until the stage finishes at the current rate, None if it can't be estimated
+
+
+def get_status(event: ProgressEvent) -> ProgressStatus:
+    """
+    :return: Throughput of the stage since it started, and the time it needs for the rest of its units.
+    """
+    rate = event.done / event.elapsed if event.elapsed > 0 else 0
+    byte_rate = event.bytes / event.elapsed if event.elapsed > 0 else 0
+    eta = None
+    if event.finished:
+        eta = 0
+    elif event.total is not None and rate > 0:
+        eta = (event.total - event.done) / rate
+    return ProgressStatus(event, rate, byte_rate, eta)
+
+
+def format_status(status: ProgressStatus) -> str:
+    """
+    :return: Status as text, e.g. 'wav: 12/48 files, 4.1 files/s, 3.2 MB/s, 9s left'.
+    """
+    event = status.event
+    total = f'/{event.total}' if event.total is not None else ''
+    text = f'{event.stage}: {event.done}{total} {event.unit}s, {status.rate:.1f} {event.unit}s/s'
+    if event.bytes:
+        text += f', {status.byte_rate / 2 ** 20:.1f} MB/s'
+    if status.eta is not None and not event.finished:
+        text += f', {status.eta:.0f}s left'
+    return text
+
+
+class ProgressAggregator:
+    """
+    Listener that keeps the last status of every stage, and calls back with a status at most once per interval. The
+    first and the last event of a stage are always passed on.
+    """
+
+    def __init__(self, callback: Callable[[ProgressStatus], None], interval: float = 0.25,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param callback: Called with the status of the stage of the event, on the thread that sent it.
+        :param interval: Minimum seconds between calls of the callback, except for first and last events.
+        """
+        self.callback = callback
+        self.interval = interval
+        self.clock = clock
+        self.stages: dict[str, ProgressStatus] = {}
+        self._last = -math.inf
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ProgressEvent):
+        status = get_status(event)
+        with self._lock:
+            first = event.stage not in self.stages
+            self.stages[event.stage] = status
+            now = self.clock()
+            if not first and not event.finished and now - self._last < self.interval:
+                return
+            self._last = now
+        self.callback(status)
+
+
+# Log strings of the items of stages that used to log every item, other stages log their own messages
+item_messages = {
+    'wav': 'exported audio {item}',
+    'png': 'exported fft {item}',
+    'spectrogram': 'exported spectrogram {item}',
+}
+
+
+class LogProgress:
+    """
+    Listener that writes progress as the log strings of earlier versions. Fractions of the analysis are logged as
+    'fraction 3/14' when they start. Items of the stages in item_messages are logged at most once per interval and
+    stage, with the count of finished items.
+    """
+
+    def __init__(self, log=print, interval: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        :param log: function that takes a string and prints it somewhere.
+        """
+        self.log = log
+        self.interval = interval
+        self.clock = clock
+        self._last: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: ProgressEvent):
+        if event.stage == 'analysis':
+            if not event.finished:
+                self.log(f'fraction {event.done + 1}/{event.total}')
+            return
+        if event.item is None or event.stage not in item_messages:
+            return
+        with self._lock:
+            now = self.clock()
+            if not event.finished and now - self._last.get(event.stage, -math.inf) < self.interval:
+                return
+            self._last[event.stage] = now
+        message = item_messages[event.stage].format(item=event.item)
+        total = f'/{event.total}' if event.total is not None else ''
+        self.log(f'{message} ({event.done}{total})')
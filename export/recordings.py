@@ -0,0 +1,139 @@
+"""
+Decoded recordings and their combinations, kept between exports of the same process. RecordingCache reads the files of
+an export and creates the sums and differences of their signal sets once, and gives the same signals to later exports
+of the same files, e.g. when only the regions or the time fractions changed:
+
+```python
+recordings = RecordingCache(limit_bytes=2 * 2 ** 30)
+create_export(data, log, recordings=recordings)
+data.time_fractions = 20
+create_export(data, log, recordings=recordings)  # Starts with the analysis
+```
+
+Entries are keyed by path, modification time and size of the files, so a file that changed is read again. The least
+recently used entries are dropped when the cache holds more than limit_bytes. Entries of claimed files are kept until
+they are released, whatever their size, which lets queued exports share the recordings they all need.
+"""
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from profiling import metrics
+from signal_processing import signals
+from signal_processing.signals import SignalRecording
+
+
+class _Entry:
+    def __init__(self, paths: frozenset):
+        self.paths = paths  # Files the value was made from
+        self.lock = threading.Lock()  # Held while the value is created
+        self.value = None
+        self.bytes = 0
+
+
+def get_file_key(files: [str]) -> tuple:
+    """
+    :return: Path, modification time and size of every file.
+    """
+    return tuple((path, os.stat(path).st_mtime_ns, os.path.getsize(path)) for path in files)
+
+
+def read_recording(files: [str]) -> SignalRecording:
+    """
+    :return: Recording with the signals of the files.
+    """
+    recording = SignalRecording(files)
+    recording.read_files()
+    return recording
+
+
+class RecordingCache:
+    """
+    Least recently used recordings and combinations, up to limit_bytes. Can be used from several threads, a value is
+    created once even if several threads ask for it at the same time.
+    """
+
+    def __init__(self, limit_bytes: int = 0):
+        """
+        :param limit_bytes: Size of the values that are kept when no export claims them. 0 keeps only claimed files.
+        """
+        self.limit_bytes = limit_bytes
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, _Entry] = OrderedDict()
+        self._claims: dict[str, int] = {}
+
+    @property
+    def bytes(self) -> int:
+        with self._lock:
+            return sum(entry.bytes for entry in self._entries.values())
+
+    def claim(self, files: [str]):
+        """
+        Keeps the values made from the files until they are released, e.g. while an export that needs them is queued.
+        """
+        with self._lock:
+            for path in files:
+                self._claims[path] = self._claims.get(path, 0) + 1
+
+    def release(self, files: [str]):
+        with self._lock:
+            for path in files:
+                self._claims[path] -= 1
+                if self._claims[path] == 0:
+                    del self._claims[path]
+            self._evict()
+
+    def read(self, files: [str]) -> SignalRecording:
+        """
+        :return: Recording of the files, read if it isn't cached.
+        """
+        return self._get(('recording', get_file_key(files)), files, lambda: read_recording(files),
+                         lambda recording: sum(s.data.nbytes for s in recording.mic_signals))
+
+    def combine(self, c_recording: SignalRecording, ref_recording: SignalRecording):
+        """
+        :return: Sums and differences of the signal sets of the recordings, see signals.create_signal_combinations.
+        """
+        key = ('combinations', get_file_key(c_recording.files), get_file_key(ref_recording.files))
+        return self._get(key, c_recording.files + ref_recording.files,
+                         lambda: signals.create_signal_combinations(c_recording, ref_recording),
+                         lambda combinations: sum(s.data.nbytes for sums in combinations for s in sums))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get(self, key: tuple, files: [str], create, get_bytes):
+        with self._lock:
+            entry: Optional[_Entry] = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(frozenset(files))
+                # Values of files that changed since they were cached are not used again
+                for other_key, other in list(self._entries.items()):
+                    if other.paths == entry.paths and other_key[0] == key[0] and other_key != key:
+                        del self._entries[other_key]
+            self._entries.move_to_end(key)
+
+        with entry.lock:
+            if entry.value is None:
+                value = create()
+                with self._lock:
+                    entry.value, entry.bytes = value, get_bytes(value)
+                    self._evict()
+                return value
+        metrics.count('recording_cache_hits')
+        return entry.value
+
+    def _evict(self):
+        """
+        Drops the least recently used values that are not claimed, until the rest fits in limit_bytes. Called while
+        holding the lock.
+        """
+        size = sum(entry.bytes for entry in self._entries.values())
+        for key, entry in list(self._entries.items()):
+            if size <= self.limit_bytes:
+                return
+            if entry.value is not None and not any(path in self._claims for path in entry.paths):
+                del self._entries[key]
+                size -= entry.bytes
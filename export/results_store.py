@@ -0,0 +1,210 @@
+"""
+Stores the results of many export runs in one SQLite database, so they can be compared without opening every
+workbook. Every run adds its configuration, the boundaries of its time fractions and one row of peak results for
+each fraction, signal set and frequency region. A run is added in a single transaction, one batch of rows per
+block of the export pipeline.
+
+```python
+with ResultsStore('results.db') as store:
+    psi = store.query(['run_id', 'fraction', 'psi'], frequency=443, signal_set=(1, 2, 5), c_name='C1')
+```
+"""
+import json
+import sqlite3
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+
+from config import ExportConfig
+from export.peak_export import get_ad_psi
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics
+
+# Peak frequency and amplitude of C, REF, DIFF and DIFF+90, in the order of the signal types of a run
+signal_columns = ['c_frequency', 'c_db', 'ref_frequency', 'ref_db', 'diff_frequency', 'diff_db',
+                  'diff90_frequency', 'diff90_db']
+result_columns = ['run_id', 'fraction', 'signal_set', 'region_start', 'region_end', *signal_columns, 'ad', 'psi']
+run_columns = ['c_name', 'ref_name', 'created', 'sheet_path', 'samplerate', 'mic_count', 'time_fractions']
+
+schema = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    c_name TEXT, ref_name TEXT, created TEXT, sheet_path TEXT,
+    samplerate INTEGER, mic_count INTEGER, time_fractions INTEGER,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS fractions (
+    run_id INTEGER REFERENCES runs (id), fraction INTEGER, start_sample INTEGER, end_sample INTEGER
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER REFERENCES runs (id), fraction INTEGER, signal_set TEXT, region_start REAL, region_end REAL,
+    {', '.join(f'{c} REAL' for c in signal_columns)}, ad REAL, psi REAL
+);
+CREATE INDEX IF NOT EXISTS results_run ON results (run_id);
+CREATE INDEX IF NOT EXISTS results_region ON results (region_start, region_end);
+CREATE INDEX IF NOT EXISTS results_set ON results (signal_set);
+CREATE INDEX IF NOT EXISTS results_fraction ON results (fraction);
+CREATE INDEX IF NOT EXISTS fractions_run ON fractions (run_id);
+"""
+
+
+def get_set_key(signal_set: [int]) -> str:
+    """
+    :return: Signal set as it is stored in the database, e.g. "1 2 5".
+    """
+    return ' '.join(str(m) for m in signal_set)
+
+
+class ResultsStore:
+    """
+    Connection to a results database, created if it doesn't exist.
+    """
+
+    def __init__(self, path: str):
+        # Runs are added by the writer thread of the export pipeline, one call at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add_run(self, s1_sums, s2_sums, sd1, sd2, data: ExportConfig, log=print) -> int:
+        """
+        Analyzes the signals the same way as the fraction sheets and adds the results. Nothing is added if it fails.
+
+        :return: Id of the new run.
+        """
+        pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log)
+        sink = pipeline.add_sink(ResultsSink(self))
+        pipeline.run()
+        return sink.run_id
+
+    def get_runs(self) -> [dict]:
+        """
+        :return: Runs in the database, with their configuration.
+        """
+        cursor = self.connection.execute(f"SELECT id, {', '.join(run_columns)}, config FROM runs ORDER BY id")
+        return [{'id': row[0], **dict(zip(run_columns, row[1:-1])), 'config': json.loads(row[-1])}
+                for row in cursor]
+
+    def query(self, columns: [str], frequency: Optional[float] = None, signal_set: Optional[tuple[int, ...]] = None,
+              fraction: Optional[int] = None, run_id: Optional[int] = None, c_name: Optional[str] = None,
+              ref_name: Optional[str] = None) -> dict[str, np.ndarray]:
+        """
+        :return: Each of the selected columns of the matching results, ordered by run, fraction, set and region.
+        signal_set is a string array, missing values (psi that the sheet can't compute) are nan.
+        :param columns: Any of result_columns.
+        :param frequency: Only regions that contain this frequency.
+        :param signal_set: Only this set of microphones, e.g. (1, 2, 5).
+        :param fraction: Only this time fraction, starting from 1.
+        :param run_id: Only this run.
+        :param c_name: Only runs with this C name.
+        :param ref_name: Only runs with this REF name.
+        """
+        unknown = set(columns) - set(result_columns)
+        if unknown:
+            raise ValueError(f'unknown columns: {", ".join(sorted(unknown))}')
+
+        filters = []
+        if frequency is not None:
+            filters.append(('results.region_start <= ? AND results.region_end >= ?', [frequency, frequency]))
+        if signal_set is not None:
+            filters.append(('results.signal_set = ?', [get_set_key(signal_set)]))
+        if fraction is not None:
+            filters.append(('results.fraction = ?', [fraction]))
+        if run_id is not None:
+            filters.append(('results.run_id = ?', [run_id]))
+        if c_name is not None:
+            filters.append(('runs.c_name = ?', [c_name]))
+        if ref_name is not None:
+            filters.append(('runs.ref_name = ?', [ref_name]))
+        conditions = [condition for condition, _ in filters]
+        parameters = [parameter for _, values in filters for parameter in values]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor = self.connection.execute(
+            f"SELECT {', '.join(f'results.{c}' for c in columns)} FROM results "
+            f"JOIN runs ON runs.id = results.run_id {where} ORDER BY results.rowid", parameters)
+        values = list(zip(*cursor.fetchall())) or [[] for _ in columns]
+        return {c: np.array(v, dtype=str if c == 'signal_set' else int if c in ('run_id', 'fraction') else float)
+                for c, v in zip(columns, values)}
+
+
+class ResultsSink(Sink):
+    """
+    Adds the peaks of every block of the pipeline to a results database, in one transaction that is committed when
+    the pipeline finishes.
+    """
+    stage = 'database'
+    uses_spectra = False
+
+    def __init__(self, store: Optional[ResultsStore] = None):
+        """
+        :param store: Database to add the run to. If it is None, data.results_database is opened, and closed when
+        the pipeline finishes.
+        """
+        self.store = store
+        self.run_id: Optional[int] = None
+
+    def start(self, pipeline: ExportPipeline):
+        data = pipeline.data
+        self.log = pipeline.log
+        self.path = data.results_database
+        self.own_store = self.store is None
+        if self.own_store:
+            self.log(f'Adding results to {data.results_database}...')
+            self.store = ResultsStore(data.results_database)
+        self.regions = np.asarray(data.frequency_regions, dtype=float)
+        self.set_keys = [get_set_key(signal_set) for signal_set in pipeline.signal_sets]
+        self.rows = 0
+
+        fraction_length = pipeline.fraction_length
+        config = {**data.get_json(), 'export_audio': data.export_audio, 'export_fft': data.export_fft}
+        # The connection opens a transaction with the first insert, it is committed in finish
+        cursor = self.store.connection.execute(
+            f"INSERT INTO runs ({', '.join(run_columns)}, config) VALUES ({', '.join('?' * 8)})",
+            (data.c_name, data.ref_name, datetime.now().isoformat(timespec='seconds'), data.sheet_path(),
+             int(pipeline.samplerate), data.get_mic_count(), pipeline.fractions, json.dumps(config)))
+        self.run_id = cursor.lastrowid
+        self.store.connection.executemany('INSERT INTO fractions VALUES (?, ?, ?, ?)',
+                                          [(self.run_id, t + 1, t * fraction_length, (t + 1) * fraction_length)
+                                           for t in range(pipeline.fractions)])
+
+    def write(self, block: SpectraBlock):
+        frequencies, amplitudes = block.get_peaks()
+        ad, psi = get_ad_psi(*amplitudes)
+        # (signal types, sets, regions) to one column per signal type and value, rows are ordered by set and region
+        values = np.stack([frequencies, amplitudes], axis=1).reshape(len(signal_columns), -1)
+        set_keys = np.repeat(self.set_keys[block.sets.start:block.sets.stop], len(self.regions)).tolist()
+        region_starts = np.tile(self.regions[:, 0], len(block.sets)).tolist()
+        region_ends = np.tile(self.regions[:, 1], len(block.sets)).tolist()
+        rows = zip([self.run_id] * len(set_keys), [block.fraction + 1] * len(set_keys), set_keys, region_starts,
+                   region_ends, *values.tolist(), ad.ravel().tolist(), psi.ravel().tolist())
+        self.store.connection.executemany(
+            f"INSERT INTO results VALUES ({', '.join('?' * len(result_columns))})", rows)
+        self.rows += len(set_keys)
+
+    def finish(self):
+        self.store.connection.commit()
+        metrics.count('database_rows', self.rows)
+        if self.own_store:
+            self.store.close()
+            self.log(f'Results saved as run {self.run_id} of {self.path}')
+
+    def abort(self):
+        self.store.connection.rollback()
+        if self.own_store:
+            self.store.close()
+
+
+def create_export(s1_sums, s2_sums, sd1, sd2, data: ExportConfig, log=print):
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log)
+    pipeline.add_sink(ResultsSink())
+    pipeline.run()
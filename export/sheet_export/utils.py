@@ -1,4 +1,8 @@
 import os
+import time
+import zipfile
+from datetime import datetime
+from typing import Optional
 
 from openpyxl.chart import Reference
 from openpyxl.descriptors import Typed
@@ -7,18 +11,53 @@ from openpyxl.descriptors.serialisable import Serialisable
 from openpyxl.drawing.colors import ColorChoice
 from openpyxl.utils import get_column_letter
 from openpyxl.workbook import Workbook
+from openpyxl.writer.excel import ExcelWriter
 from openpyxl.xml.constants import DRAWING_NS
 
+from profiling import metrics
 
-def save_workbook(wb: Workbook, file_name: str):
+
+class _TimestampedZipFile(zipfile.ZipFile):
+    """
+    Zip file that gives every entry the same date_time, instead of the time it was written.
+    """
+    date_time = time.localtime()[:6]
+
+    def writestr(self, zinfo_or_arcname, data, compress_type=None, compresslevel=None):
+        if isinstance(zinfo_or_arcname, str):
+            zinfo_or_arcname = zipfile.ZipInfo(zinfo_or_arcname, self.date_time)
+            zinfo_or_arcname.compress_type = self.compression
+            zinfo_or_arcname.external_attr = 0o600 << 16
+        super().writestr(zinfo_or_arcname, data, compress_type, compresslevel)
+
+    def write(self, filename, arcname=None, compress_type=None, compresslevel=None):
+        # openpyxl writes the worksheets to temporary files first, which have their own time
+        with open(filename, 'rb') as file:
+            self.writestr(arcname or os.path.basename(filename), file.read(), compress_type, compresslevel)
+
+
+def save_workbook(wb: Workbook, file_name: str, timestamp: Optional[datetime] = None):
     """
     Saves the workbook to the given file name. Creates the directory if it doesn't exist.
+
+    :param timestamp: Modification time of the workbook and of the files in it. If it is set, saving the same
+    workbook again gives the same bytes, otherwise the current time is used.
     """
     try:
         os.makedirs(f'{os.path.dirname(file_name)}')
     except FileExistsError:
         pass
-    wb.save(file_name)
+    with metrics.stage('save'):
+        if timestamp is None:
+            wb.save(file_name)
+        else:
+            archive = _TimestampedZipFile(file_name, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+            archive.date_time = timestamp.timetuple()[:6]
+            wb.properties.modified = timestamp
+            ExcelWriter(wb, archive).save()
+    if metrics.get_registry() is not None:
+        metrics.count('workbook_saves')
+        metrics.count('bytes_saved', os.path.getsize(file_name))
 
 
 # Helper function for setting the chart data.
@@ -61,9 +100,11 @@ def get_mic_str(set_mics: [int], mic_count: int):
 
 
 # Helper function for moving some sheets to the beginning of the workbook.
-def move_sheets_in_front(out_wb: Workbook, output_path, *sheet_names):
+def move_sheets_in_front(out_wb: Workbook, output_path, *sheet_names, timestamp: Optional[datetime] = None):
     """
     Moves the sheets with the given names (not checked for strict equality) to the beginning.
+
+    :param timestamp: Modification time of the saved workbook, see save_workbook.
     """
     repeat = 0
     for sheet_name in sheet_names:
@@ -71,7 +112,7 @@ def move_sheets_in_front(out_wb: Workbook, output_path, *sheet_names):
             if wb_sheet_name.startswith(sheet_name):
                 repeat += 1
                 out_wb.move_sheet(out_wb[wb_sheet_name], offset=-i - 1 + repeat)
-    save_workbook(out_wb, output_path)
+    save_workbook(out_wb, output_path, timestamp)
 
 
 # Helper class for creating transparent colors.
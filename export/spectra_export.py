@@ -0,0 +1,122 @@
+"""
+Exports the full dB spectra behind the fft graphs and the fraction sheets, so they can be analyzed without running
+the pipeline again. Every signal type gets one .npy file of shape (fractions, signal sets, fft bins), and
+spectra.json describes the frequency axis, the order of signal sets and the boundaries of the fractions.
+
+The files are written through np.lib.format.open_memmap one fraction at a time, from the spectra the export
+pipeline computes for every other export. A fraction is a contiguous block of the file, so writing is sequential,
+and the spectra of a long recording never have to fit in memory. They can be read back the same way:
+
+```python
+spectra, sidecar = load_spectra('Export/Spectra')
+spectra['DIFF'][3, 0]  # spectrum of the 4th fraction of the first signal set
+```
+"""
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from config import ExportConfig
+from export import bundle
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics
+
+sidecar_name = 'spectra.json'
+
+
+def create_export(s1_sums, s2_sums, sd1, sd2, data: ExportConfig, log=print):
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, data, log)
+    pipeline.add_sink(SpectraSink())
+    pipeline.run()
+
+
+class SpectraSink(Sink):
+    """
+    Copies the spectra of every block of the pipeline into the memory mapped file of each signal type.
+    """
+    stage = 'spectra'
+    uses_peaks = False
+
+    def start(self, pipeline: ExportPipeline):
+        self.data = data = pipeline.data
+        self.log = pipeline.log
+        self.pipeline = pipeline
+        self.log('Exporting spectra...')
+
+        self.folder = data.spectra_path()
+        # Memory mapped files can't be written into a bundle, they are moved into it when they are complete
+        self.output = pipeline.bundle
+        self.array_folder = tempfile.mkdtemp(prefix='spectra_') if self.output is not None else self.folder
+        bundle.make_output_dirs(self.folder, self.output)
+
+        bins = pipeline.fraction_length // 2 + 1
+        self.shape = (pipeline.fractions, len(pipeline.signal_sets), bins)
+        self.files = {name: f'{name}.npy' for name in pipeline.names}
+        self.arrays = {name: np.lib.format.open_memmap(os.path.join(self.array_folder, self.files[name]), mode='w+',
+                                                       dtype=np.float32, shape=self.shape)
+                       for name in pipeline.names}
+
+    def write(self, block: SpectraBlock):
+        _, spectra = block.get_spectra()
+        for name, plot in zip(block.names, spectra):
+            self.arrays[name][block.fraction, block.sets.start:block.sets.stop] = plot
+
+    def finish(self):
+        pipeline, files, folder = self.pipeline, self.files, self.folder
+        for array in self.arrays.values():
+            array.flush()
+        del self.arrays
+        sizes = [os.path.getsize(os.path.join(self.array_folder, f)) for f in files.values()]
+        if self.output is not None:
+            for file_name in files.values():
+                self.output.add_file(os.path.join(folder, file_name), os.path.join(self.array_folder, file_name))
+
+        fractions, fraction_length = pipeline.fractions, pipeline.fraction_length
+        sidecar = {
+            'files': files,
+            'shape': list(self.shape),
+            'dtype': 'float32',
+            'axes': ['fraction', 'signal_set', 'frequency'],
+            'frequency': {'start': 0.0, 'step': pipeline.samplerate / fraction_length, 'count': self.shape[2]},
+            'samplerate': int(pipeline.samplerate),
+            'signal_sets': [list(signal_set) for signal_set in pipeline.signal_sets],
+            'fractions': [[t * fraction_length, (t + 1) * fraction_length] for t in range(fractions)],
+            'window': 'hann',
+            'scale': '20 * log10(abs(rfft(fraction * window, norm="forward")))',
+        }
+        with bundle.open_output(os.path.join(folder, sidecar_name), self.output) as file:
+            file.write(json.dumps(sidecar, indent=2).encode())
+
+        if metrics.get_registry() is not None:
+            metrics.count('files_written', len(files) + 1)
+            metrics.count('bytes_saved', sum(sizes))
+        self.log(f'Spectra saved to {folder}')
+
+    def abort(self):
+        self.arrays = None
+        # Arrays that were going into a bundle are not outputs yet
+        if self.output is not None:
+            shutil.rmtree(self.array_folder, ignore_errors=True)
+
+
+def load_spectra(folder: str) -> (dict[str, np.ndarray], dict):
+    """
+    :return: Read-only memory mapped spectra of each signal type, and the sidecar.
+    :param folder: Folder with the exported spectra.
+    """
+    with open(os.path.join(folder, sidecar_name), 'r') as file:
+        sidecar = json.load(file)
+    spectra = {name: np.load(os.path.join(folder, file_name), mmap_mode='r')
+               for name, file_name in sidecar['files'].items()}
+    return spectra, sidecar
+
+
+def get_frequency(sidecar: dict) -> np.ndarray:
+    """
+    :return: Frequency of every bin described by the sidecar.
+    """
+    frequency = sidecar['frequency']
+    return frequency['start'] + np.arange(frequency['count']) * frequency['step']
@@ -0,0 +1,129 @@
+"""
+Exports a spectrogram of every signal set and signal type over the whole recording, as an .npz file with the dB
+matrix and its axes, and a png image with a logarithmic frequency axis. A few dense files replace the outputs of
+many time fractions when the goal is to see how the spectrum evolves over time.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+from config import ExportConfig
+from export.bundle import Bundle, make_output_dirs, open_output
+from export.cancellation import CancellationToken
+from export.fft_export import get_x_lims
+from export.progress import LogProgress, Progress
+from export.native_plot import encode_png, draw_text, format_tick, get_linear_ticks, get_log_ticks
+from profiling import metrics, tracing
+from signal_processing.decimate import get_decimator
+from signal_processing.spectrogram import Spectrogram, create_spectrogram
+
+image_width = 1000
+image_height = 500
+margin_left, margin_right, margin_top, margin_bottom = 60, 20, 20, 30
+dynamic_range = 80  # dB below the maximum that are shown in the image
+
+# Viridis color map, interpolated between these colors
+_color_map = np.array([(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)], dtype=float)
+
+
+def create_export(s1_sums, s2_sums, sd1, data: ExportConfig, log=print, token: Optional[CancellationToken] = None,
+                  progress: Optional[Progress] = None, bundle: Optional[Bundle] = None):
+    """
+    :param token: Cancels the export, checked before every spectrogram.
+    :param progress: Receives the spectrograms that were written, logged with LogProgress by default.
+    :param bundle: Bundle of the run to write into, see open_output.
+    """
+    log('Exporting spectrograms...')
+
+    signal_sets = data.get_signal_sets()
+    frequency_lims = get_x_lims(data.frequency_regions)
+    written = (progress or Progress(LogProgress(log))).stage('spectrogram', 'file', 3 * len(signal_sets))
+
+    for name, sums in [(data.c_name, s1_sums), (data.ref_name, s2_sums), ('DIFF', sd1)]:
+        folder = os.path.join(data.spectrograms_path(), name)
+        make_output_dirs(folder, bundle)
+        for i in range(len(signal_sets)):
+            if token is not None:
+                token.check()
+            file_name = f"{name}_mics_{''.join([str(m) for m in signal_sets[i]])}"
+            with tracing.span('spectrogram', signal=name, set=i):
+                spectrogram = create_spectrogram(sums[i], data.spectrogram_window, data.spectrogram_hop,
+                                                 frequency_lims)
+                size = write_spectrogram(os.path.join(folder, file_name), spectrogram, bundle)
+            written.advance(bytes=size, item=file_name)
+
+
+def write_spectrogram(path: str, spectrogram: Spectrogram, bundle: Optional[Bundle] = None) -> int:
+    """
+    Writes path.npz with the dB matrix and its axes, and path.png with the image.
+
+    :param path: Path of the files without extension.
+    :param spectrogram: Spectrogram to write.
+    :param bundle: Bundle of the run to write into, see open_output.
+    :return: Size of both files in bytes.
+    """
+    with open_output(f'{path}.npz', bundle) as file:
+        np.savez(file, db=spectrogram.db, times=spectrogram.times, frequency=spectrogram.frequency,
+                 samplerate=spectrogram.samplerate, window_size=spectrogram.window_size, hop=spectrogram.hop)
+        npz_size = file.tell()
+    png = encode_png(rasterize(spectrogram))
+    with open_output(f'{path}.png', bundle) as file:
+        file.write(png)
+
+    if metrics.get_registry() is not None:
+        metrics.count('files_written', 2)
+        metrics.count('bytes_saved', npz_size + len(png))
+    return npz_size + len(png)
+
+
+def rasterize(spectrogram: Spectrogram, width: int = image_width, height: int = image_height) -> np.ndarray:
+    """
+    :return: RGB pixels of the spectrogram with time on the x-axis and logarithmic frequency on the y-axis. When
+    there are more frames or frequency bins than pixels, each pixel shows the maximum of the values it covers.
+    """
+    plot_width = width - margin_left - margin_right
+    plot_height = height - margin_top - margin_bottom
+    frequency, db = spectrogram.frequency, spectrogram.db
+    frequency_lims = (max(frequency[0], 1e-3), frequency[-1])
+
+    # Frequency to pixel rows, see signal_processing.decimate
+    decimator = get_decimator(frequency, frequency_lims, plot_height)
+    _, rows = decimator.reduce(db)
+    row_frequency = np.geomspace(*frequency_lims, plot_height)
+    nearest = np.clip(np.searchsorted(decimator.frequency, row_frequency), 0, len(decimator) - 1)
+    rows = rows[:, nearest]
+
+    # Time to pixel columns
+    if len(rows) > plot_width:
+        starts = np.linspace(0, len(rows), plot_width, endpoint=False).astype(np.int64)
+        columns = np.maximum.reduceat(rows, starts, axis=0)
+    else:
+        columns = rows[(np.arange(plot_width) * len(rows) / plot_width).astype(np.int64)]
+
+    # Highest frequency at the top
+    values = columns.T[::-1]
+    finite = values[np.isfinite(values)]
+    top = finite.max() if finite.size else 0
+    scaled = np.clip((np.nan_to_num(values, neginf=top - dynamic_range) - top + dynamic_range) / dynamic_range, 0, 1)
+    position = scaled * (len(_color_map) - 1)
+    lower = np.minimum(position.astype(np.int64), len(_color_map) - 2)
+    fraction = (position - lower)[..., None]
+    colors = _color_map[lower] * (1 - fraction) + _color_map[lower + 1] * fraction
+
+    pixels = np.full((height, width, 3), 255, dtype=np.uint8)
+    pixels[margin_top:margin_top + plot_height, margin_left:margin_left + plot_width] = colors.astype(np.uint8)
+
+    log_min, log_max = np.log10(frequency_lims[0]), np.log10(frequency_lims[1])
+    for tick in get_log_ticks(*frequency_lims):
+        y = margin_top + plot_height - 1 - round((np.log10(tick) - log_min) / (log_max - log_min) * (plot_height - 1))
+        pixels[y, margin_left - 4:margin_left] = 0
+        draw_text(pixels, format_tick(tick), margin_left - 6, y - 3, 'right')
+    duration = spectrogram.times[-1] if len(spectrogram.times) else 0
+    if duration > 0:
+        for tick in get_linear_ticks(0, duration):
+            x = margin_left + round(tick / duration * (plot_width - 1))
+            pixels[margin_top + plot_height:margin_top + plot_height + 4, x] = 0
+            draw_text(pixels, format_tick(tick), x, margin_top + plot_height + 6, 'center')
+
+    return pixels
@@ -0,0 +1,87 @@
+"""
+This module tests writing the artifacts of an export into a single zip file.
+"""
+import io
+import json
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import bundle, fft_render
+from export.export import create_export
+from export.fft_render import FftFigure, PngRenderer
+
+
+def test_export_into_bundle(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], export_audio=True, export_fft=True,
+                                 plot_backend='svg', export_spectrogram=True, spectrogram_window=4096,
+                                 spectrogram_hop=1024, export_spectra=True, bundle_artifacts=True,
+                                 bundle_compression='deflated', _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    # Only the workbook and the bundle are written as files
+    assert sorted(os.listdir(tmp_path / 'export')) == sorted([os.path.basename(export_config.sheet_path()),
+                                                              os.path.basename(export_config.bundle_path())])
+    with zipfile.ZipFile(export_config.bundle_path()) as archive:
+        names = archive.namelist()
+        assert names[-1] == bundle.manifest_name
+        manifest = json.loads(archive.read(bundle.manifest_name))
+        assert manifest['complete']
+        assert [entry['name'] for entry in manifest['entries']] == names[:-1]
+        assert all(info.compress_type == zipfile.ZIP_DEFLATED for info in archive.infolist())
+
+        assert len([name for name in names if name.startswith('Fractions/WAV/')]) == 3 * 3 * 2
+        assert len([name for name in names if name.startswith('Fractions/FFT/')]) == 3 * 3 * 2
+        assert 'Spectrograms/DIFF/DIFF_mics_12.npz' in names
+        assert 'Spectra/DIFF.npy' in names and 'Spectra/spectra.json' in names
+
+        samplerate, data = wavfile.read(io.BytesIO(archive.read('Fractions/WAV/C1/C1_mics_1_fraction_2_of_2.wav')))
+        assert samplerate == 48000 and len(data) == 24000
+        assert archive.read('Fractions/FFT/DIFF/DIFF_mics_12_fraction_1_of_2.svg').startswith(b'<svg')
+        spectra = np.load(io.BytesIO(archive.read('Spectra/DIFF.npy')))
+        assert spectra.shape == (2, 3, 12001)
+
+
+def test_writer_error(tmp_path):
+    output = bundle.Bundle(str(tmp_path / 'bundle.zip'), str(tmp_path))
+    output.add_file(str(tmp_path / 'missing.npy'), str(tmp_path / 'missing.npy'))
+    with pytest.raises(FileNotFoundError):
+        output.close()
+
+
+def test_export_error_is_raised(tmp_path):
+    export_config = ExportConfig(c_files=[], ref_files=[], json_load_path=None, bundle_artifacts=True,
+                                 _destination_folder=str(tmp_path / 'export'))
+    with pytest.raises(ValueError):
+        with bundle.bundle_export(export_config, lambda x: None) as output:
+            # Closing the bundle fails too
+            output.add_file(str(tmp_path / 'missing.npy'), str(tmp_path / 'missing.npy'))
+            raise ValueError('export failed')
+
+
+def write_bytes(figure: FftFigure, file):
+    file.write(b'png')
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_rendered_into_bundle(tmp_path, monkeypatch, workers):
+    monkeypatch.setattr(FftFigure, 'write', write_bytes)
+    # Forked workers inherit the fake
+    monkeypatch.setattr(fft_render, 'start_method', 'fork')
+    output = bundle.Bundle(str(tmp_path / 'bundle.zip'), str(tmp_path))
+    with PngRenderer((50, 1000), workers=workers, bundle=output) as renderer:
+        for i in range(4):
+            renderer.submit(str(tmp_path / 'FFT' / f'{i}.png'), np.geomspace(50, 1000, 10), np.zeros(10))
+    output.close()
+
+    assert not os.path.exists(tmp_path / 'FFT')
+    with zipfile.ZipFile(tmp_path / 'bundle.zip') as archive:
+        assert sorted(archive.namelist()) == ['FFT/0.png', 'FFT/1.png', 'FFT/2.png', 'FFT/3.png', 'manifest.json']
+        assert archive.read('FFT/3.png') == b'png'
@@ -0,0 +1,81 @@
+"""
+This module tests cancelling export runs with a token or a deadline.
+"""
+import json
+import os
+import threading
+
+import pytest
+from openpyxl.reader.excel import load_workbook
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.cancellation import CancellationToken, ExportCancelled
+from export.export import create_export
+from export.sheet_export import sheet_export
+from export.sheet_export.utils import save_workbook
+
+
+def test_token():
+    token = CancellationToken()
+    token.check()
+    token.cancel('closed')
+    token.cancel('again')
+    assert token.cancelled
+    with pytest.raises(ExportCancelled, match='closed'):
+        token.check()
+
+
+def test_deadline():
+    assert not CancellationToken(timeout=60).cancelled
+    token = CancellationToken(timeout=0)
+    assert token.cancelled
+    assert token.reason == 'deadline exceeded'
+
+
+@pytest.fixture
+def export_config(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    return ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=4, json_load_path=None,
+                        frequency_regions=[(70, 80), (215, 225)], export_audio=True, collect_metrics=True,
+                        _destination_folder=str(tmp_path / 'export'))
+
+
+def test_cancel_export(export_config, monkeypatch):
+    token = CancellationToken()
+    saved = []
+
+    def save(workbook, path, timestamp):
+        save_workbook(workbook, path, timestamp)
+        saved.append(workbook.sheetnames)
+        token.cancel('closed')
+
+    monkeypatch.setattr(sheet_export, 'save_workbook', save)
+    with pytest.raises(ExportCancelled, match='closed'):
+        create_export(export_config, lambda x: None, token)
+
+    with open(export_config.incomplete_path()) as file:
+        marker = json.load(file)
+    assert marker['status'] == 'cancelled'
+    assert marker['reason'] == 'closed'
+    with open(export_config.report_path()) as file:
+        assert json.load(file)['status'] == 'cancelled'
+    # The sheet was cancelled after its first fraction, the fraction queued behind it may have been written too
+    assert saved[0] == ['fraction 1 of 4']
+    assert saved[-1] in (['fraction 1 of 4'], ['fraction 1 of 4', 'fraction 2 of 4'])
+    assert load_workbook(export_config.sheet_path()).sheetnames == saved[-1]
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith(('wav', 'sink'))]
+
+
+def test_export_deadline(export_config):
+    export_config.deadline_seconds = 0
+    with pytest.raises(ExportCancelled, match='deadline exceeded'):
+        create_export(export_config, lambda x: None)
+
+
+def test_complete_export_removes_marker(export_config):
+    os.makedirs(os.path.dirname(export_config.incomplete_path()))
+    with open(export_config.incomplete_path(), 'w') as file:
+        file.write('{}')
+    create_export(export_config, lambda x: None)
+    assert not os.path.exists(export_config.incomplete_path())
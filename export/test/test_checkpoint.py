@@ -0,0 +1,94 @@
+"""
+This module tests checkpoints of exports and resuming interrupted exports.
+"""
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import export, pipeline
+from export.checkpoint import journal_name, load_checkpoint
+from export.export import create_export
+
+
+def at(time: datetime):
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return time
+
+    return FixedDatetime
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    return create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+
+
+def get_config(inputs, destination, **kwargs) -> ExportConfig:
+    c_files, ref_files = inputs
+    return ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=4, json_load_path=None,
+                        frequency_regions=[(70, 80), (215, 225)], collect_metrics=True,
+                        _destination_folder=destination, **kwargs)
+
+
+def interrupt(export_config: ExportConfig, finished: int, monkeypatch):
+    """
+    Runs an export that keeps its checkpoint, and drops the journal after the first finished fractions.
+    """
+    with monkeypatch.context() as m:
+        m.setattr(export, 'remove_checkpoint', lambda data: None)
+        create_export(export_config, lambda x: None)
+    journal = os.path.join(export_config.checkpoint_path(), journal_name)
+    with open(journal) as file:
+        lines = file.read().splitlines()
+    with open(journal, 'w') as file:
+        # The last line was cut while it was written
+        file.write('\n'.join(lines[:finished + 1]) + '\n{"fract')
+    os.remove(export_config.sheet_path())
+
+
+def test_resume_is_identical(inputs, tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline, 'datetime', at(datetime(2023, 5, 1, 12, 30)))
+    uninterrupted = get_config(inputs, str(tmp_path / 'uninterrupted'))
+    create_export(uninterrupted, lambda x: None)
+    assert not os.path.exists(uninterrupted.checkpoint_path())
+
+    interrupted = get_config(inputs, str(tmp_path / 'interrupted'))
+    interrupt(interrupted, 2, monkeypatch)
+    assert sorted(load_checkpoint(interrupted).fractions) == [0, 1]
+
+    # The workbook keeps the time of the first run
+    monkeypatch.setattr(pipeline, 'datetime', at(datetime(2023, 5, 2, 8, 0)))
+    interrupted.resume = True
+    logs = []
+    create_export(interrupted, logs.append)
+
+    assert 'Resuming export, 2 of 4 fractions restored' in logs
+    with open(uninterrupted.sheet_path(), 'rb') as expected, open(interrupted.sheet_path(), 'rb') as resumed:
+        assert expected.read() == resumed.read()
+    with open(interrupted.report_path()) as file:
+        report = json.load(file)
+    # Only the 2 missing fractions were analyzed
+    assert report['counters']['ffts'] == 3 * 2 * 4
+    assert 'checkpoint' in report['stages']
+    assert not os.path.exists(interrupted.checkpoint_path())
+
+
+def test_resume_without_checkpoint(inputs, tmp_path):
+    export_config = get_config(inputs, str(tmp_path / 'export'), resume=True)
+    create_export(export_config, lambda x: None)
+    with open(export_config.report_path()) as file:
+        assert json.load(file)['counters']['ffts'] == 3 * 4 * 4
+
+
+def test_resume_other_inputs(inputs, tmp_path, monkeypatch):
+    export_config = get_config(inputs, str(tmp_path / 'export'))
+    interrupt(export_config, 1, monkeypatch)
+    export_config.resume = True
+    export_config.frequency_regions = [(70, 80)]
+    with pytest.raises(ValueError, match='can not be resumed'):
+        create_export(export_config, lambda x: None)
@@ -0,0 +1,92 @@
+"""
+This module tests parallel rendering of fft graphs. Kaleido needs a browser to write images, so the tests replace
+FftFigure.write with a function that writes the y-axis range. Pool tests fork the workers, so that they inherit it.
+"""
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import fft_export, fft_render
+from export.fft_render import FftFigure, PngRenderer
+from signal_processing.signals import Signal, SignalRecording, create_signal_combinations
+
+fork_only = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                               reason='workers must inherit the fake')
+
+
+def write_range(figure: FftFigure, path: str):
+    if path.endswith('fail.png'):
+        raise RuntimeError('cannot render')
+    with open(path, 'w') as file:
+        file.write(' '.join(str(value) for value in figure.figure.layout.yaxis.range))
+
+
+@pytest.fixture(autouse=True)
+def fake_write(monkeypatch):
+    monkeypatch.setattr(FftFigure, 'write', write_range)
+    monkeypatch.setattr(fft_render, 'start_method', 'fork')
+
+
+def test_figure_update():
+    figure = FftFigure((50, 1000))
+    figure.update(np.array([100, 200]), np.array([-10.0, 20.0]))
+    figure.update(np.array([100, 200, 300]), np.array([-20.0, 0, 10.0]))
+    assert len(figure.figure.data) == 1
+    assert list(figure.figure.data[0].y) == [-20, 0, 10]
+    assert list(figure.figure.layout.yaxis.range) == [-26, 16]
+
+
+def test_render_in_process(tmp_path):
+    written = []
+    with PngRenderer((50, 1000), workers=1, on_written=lambda path, size: written.append(path)) as renderer:
+        for i in range(3):
+            renderer.submit(str(tmp_path / f'{i}.png'), np.array([100, 200]), np.array([0.0, i]))
+    assert renderer.stats()['renders'] == 3
+    assert len(written) == 3
+    assert (tmp_path / '2.png').read_text() == '-6.0 8.0'
+
+
+@fork_only
+def test_render_in_pool(tmp_path):
+    with PngRenderer((50, 1000), workers=2, queue_size=2) as renderer:
+        for i in range(10):
+            renderer.submit(str(tmp_path / f'{i}.png'), np.array([100, 200]), np.array([0.0, i]))
+            assert len(renderer._pending) <= 2
+    stats = renderer.stats()
+    assert stats['renders'] == 10
+    assert stats['renders_per_second'] > 0
+    assert (tmp_path / '9.png').read_text() == '-6.0 15.0'
+
+
+@fork_only
+def test_render_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with PngRenderer((50, 1000), workers=2) as renderer:
+            renderer.submit(str(tmp_path / 'fail.png'), np.array([100, 200]), np.array([0.0, 1.0]))
+            renderer.close()
+
+
+def test_export_fft(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], png_workers=1,
+                                 _destination_folder=str(tmp_path / 'export'))
+    c_signal, ref_signal = SignalRecording(c_files), SignalRecording(ref_files)
+    c_signal.read_files()
+    ref_signal.read_files()
+    s1_sums, s2_sums, sd1, _ = create_signal_combinations(c_signal, ref_signal)
+
+    stats = fft_export.create_export(s1_sums, s2_sums, sd1, export_config, lambda x: None)
+    assert stats['renders'] == 3 * 3 * 2
+    for folder in ['C1', 'REF', 'DIFF']:
+        assert len(os.listdir(os.path.join(export_config.fractions_path(), 'FFT', folder))) == 6
+
+
+def test_export_fft_fraction(tmp_path):
+    signal = Signal(48000, np.sin(np.arange(4800) * 2 * np.pi * 100 / 48000))
+    fft_export.export_fft_fraction(str(tmp_path), 'C1', 'C1.png', signal, (50, 1000), lambda x: None)
+    assert os.path.exists(tmp_path / 'FFT' / 'C1' / 'C1.png')
@@ -0,0 +1,55 @@
+"""
+This module tests the single file html report of fft graphs.
+"""
+import base64
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import fft_report
+from export.export import create_export
+
+
+def read_report_data(path: str) -> dict:
+    with open(path, encoding='utf-8') as file:
+        html = file.read()
+    match = re.search(r'const report = (\{.*?\});\n', html, re.DOTALL)
+    return json.loads(match.group(1).replace('<\\/', '</'))
+
+
+def test_encode_db():
+    encoded = fft_report.encode_db(np.array([-40.04, -3.26, -np.inf]))
+    values = np.frombuffer(base64.b64decode(encoded), dtype='<i2')
+    assert list(values) == [-400, -33, -400]
+
+
+@pytest.fixture
+def exported(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], export_fft=True, plot_backend='html',
+                                 c_name='C</script>', _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+    return export_config
+
+
+def test_report(exported):
+    report = read_report_data(exported.fft_report_path())
+    assert report['fractions'] == 2
+    assert report['combinations'] == ['mics 1', 'mics 2', 'mics 1 2']
+    assert report['signals'] == ['C</script>', 'REF', 'DIFF']
+    x = np.frombuffer(base64.b64decode(report['x']), dtype='<f4')
+    assert len(x) <= 2 * fft_report.report_bins
+    assert len(report['traces']) == 2
+    assert all(len(sets) == 3 and all(len(signals) == 3 for signals in sets) for sets in report['traces'])
+    y = np.frombuffer(base64.b64decode(report['traces'][0][0][0]), dtype='<i2')
+    assert len(y) == len(x)
+
+
+def test_report_replaces_images(exported):
+    assert not os.path.exists(os.path.join(exported.fractions_path(), 'FFT'))
@@ -0,0 +1,154 @@
+"""
+This module tests the export job queue.
+"""
+import os
+import threading
+import zipfile
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import recordings
+from export.cancellation import ExportCancelled
+from export.jobs import JobQueue
+
+
+def get_config(tmp_path, c_files=None, ref_files=None) -> ExportConfig:
+    return ExportConfig(c_files=c_files or ['c.wav'], ref_files=ref_files or ['ref.wav'], time_fractions=2,
+                        json_load_path=None, frequency_regions=[(70, 80), (215, 225)],
+                        _destination_folder=str(tmp_path / 'export'))
+
+
+class BlockingExport:
+    """
+    Export that runs until it is released, and remembers how many ran at the same time.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+        self.started = []
+
+    def __call__(self, data, log, token, progress, recordings):
+        with self.lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.started.append(data)
+        try:
+            while not self.release.wait(0.01):
+                token.check()
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def test_concurrency_limit(tmp_path):
+    export = BlockingExport()
+    changes = []
+    queue = JobQueue(concurrency=2, log=lambda x: None, on_change=lambda job: changes.append((job.number, job.status)),
+                     export=export)
+    submitted = [queue.submit(get_config(tmp_path)) for _ in range(5)]
+    assert [job.status for job in submitted] == ['running', 'running', 'queued', 'queued', 'queued']
+
+    export.release.set()
+    assert queue.wait(10)
+    assert export.most_running == 2
+    assert [job.status for job in submitted] == ['complete'] * 5
+    assert sorted(id(data) for data in export.started) == sorted(id(job.data) for job in submitted)
+    assert all(job.seconds >= 0 and job.waited >= 0 for job in submitted)
+    assert [status for number, status in changes if number == 3] == ['queued', 'running', 'complete']
+    # Every job writes into its own folder
+    assert len({job.data.sheet_path() for job in submitted}) == 5
+    assert submitted[1].data._destination_folder == str(tmp_path / 'export_2')
+
+
+def test_cancel(tmp_path):
+    export = BlockingExport()
+    queue = JobQueue(concurrency=1, log=lambda x: None, export=export)
+    running, queued = queue.submit(get_config(tmp_path)), queue.submit(get_config(tmp_path))
+    queue.cancel(queued)
+    assert queued.status == 'cancelled' and queued.seconds is None
+    queue.cancel(running)
+    assert queue.wait(10)
+    assert running.status == 'cancelled'
+    assert export.started == [running.data]
+
+
+def test_failed_job_does_not_stop_queue(tmp_path):
+    def export(data, log, token, progress, recordings):
+        if data.c_name == 'broken':
+            raise OSError('file not found')
+        if data.c_name == 'cancelled':
+            raise ExportCancelled('closed')
+
+    lines = []
+    queue = JobQueue(log=lines.append, export=export)
+    broken = get_config(tmp_path)
+    broken.c_name = 'broken'
+    cancelled = get_config(tmp_path)
+    cancelled.c_name = 'cancelled'
+    submitted = [queue.submit(broken), queue.submit(cancelled), queue.submit(get_config(tmp_path))]
+    assert queue.wait(10)
+    assert [job.status for job in submitted] == ['failed', 'cancelled', 'complete']
+    assert submitted[0].error == 'OSError: file not found'
+    assert lines == ['#1 broken/REF: export failed, OSError: file not found']
+
+
+def test_jobs_share_recordings(tmp_path, monkeypatch):
+    c_files, ref_files = create_recordings(str(tmp_path / 'take_1'), 2, duration=0.5)
+    other_c_files, _ = create_recordings(str(tmp_path / 'take_2'), 2, duration=0.5, seed=1)
+    reads = []
+    read_recording = recordings.read_recording
+    monkeypatch.setattr(recordings, 'read_recording', lambda files: reads.append(files) or read_recording(files))
+
+    queue = JobQueue(concurrency=2, log=lambda x: None)
+    submitted = [queue.submit(get_config(tmp_path, files, ref_files)) for files in (c_files, other_c_files)]
+    assert queue.wait(60)
+    assert [job.status for job in submitted] == ['complete', 'complete']
+    # REF is read once for both jobs
+    assert sorted(reads) == sorted([c_files, other_c_files, ref_files])
+    assert queue.recordings.read(ref_files) is not None
+
+
+def test_profiled_jobs_run_alone(tmp_path):
+    export = BlockingExport()
+    queue = JobQueue(concurrency=3, log=lambda x: None, export=export)
+    profiled = get_config(tmp_path)
+    profiled.collect_metrics = True
+    submitted = [queue.submit(get_config(tmp_path)), queue.submit(profiled), queue.submit(get_config(tmp_path))]
+    # The job after the profiled one keeps its place in the queue
+    assert [job.status for job in submitted] == ['running', 'queued', 'queued']
+
+    export.release.set()
+    assert queue.wait(10)
+    assert export.most_running == 1
+    assert export.started == [job.data for job in submitted]
+
+
+def test_concurrent_jobs_write_their_own_outputs(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    bundled = get_config(tmp_path / 'bundled', c_files, ref_files)
+    bundled.export_audio = bundled.bundle_artifacts = True
+    files = get_config(tmp_path / 'files', c_files, ref_files)
+    files.export_audio = files.export_fft = True
+    files.plot_backend = 'svg'
+
+    queue = JobQueue(concurrency=2, log=lambda x: None)
+    submitted = [queue.submit(bundled), queue.submit(files)]
+    assert [job.status for job in submitted] == ['running', 'running']
+    assert queue.wait(60)
+    assert [job.status for job in submitted] == ['complete', 'complete']
+
+    assert sorted(os.listdir(bundled._destination_folder)) == sorted(
+        [os.path.basename(bundled.sheet_path()), os.path.basename(bundled.bundle_path())])
+    with zipfile.ZipFile(bundled.bundle_path()) as archive:
+        names = archive.namelist()
+    # 3 signal sets, 2 fractions and C, REF and DIFF
+    assert len([name for name in names if name.startswith('Fractions/WAV/')]) == 3 * 2 * 3
+    assert not [name for name in names if name.startswith('Fractions/FFT/')]
+
+    written = [os.path.join(folder, name) for folder, _, names in os.walk(files.fractions_path()) for name in names]
+    assert len([path for path in written if path.endswith('.wav')]) == 3 * 2 * 3
+    assert len([path for path in written if path.endswith('.svg')]) == 3 * 2 * 3
+    assert not os.path.exists(files.bundle_path())
@@ -0,0 +1,88 @@
+"""
+This module tests the svg and png plot backend.
+"""
+import os
+import struct
+import zlib
+from xml.etree import ElementTree
+
+import numpy as np
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import fft_export
+from export.native_plot import create_svg, encode_png, get_linear_ticks, get_log_ticks, get_y_range, rasterize, \
+    format_tick, NativeRenderer, plot_color, line_color
+from signal_processing.signals import SignalRecording, create_signal_combinations
+
+x_lims = (57.6, 1056)
+
+
+def get_graph():
+    x = np.logspace(np.log10(x_lims[0]), np.log10(x_lims[1]), 2000)
+    y = -40 + 30 * np.exp(-((x - 220) / 2) ** 2)
+    return x, y
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    width, height = struct.unpack('>II', data[16:24])
+    idat_length, = struct.unpack('>I', data[33:37])
+    raw = np.frombuffer(zlib.decompress(data[41:41 + idat_length]), dtype=np.uint8)
+    return raw.reshape(height, width * 3 + 1)[:, 1:].reshape(height, width, 3)
+
+
+def test_ticks():
+    assert get_log_ticks(57.6, 1056) == [100, 200, 500, 1000]
+    assert get_log_ticks(1, 20) == [1, 2, 5, 10, 20]
+    assert get_linear_ticks(-46, -4) == [-40, -30, -20, -10]
+    assert [format_tick(t) for t in [100, 1000, 2500, -40]] == ['100', '1k', '2.5k', '-40']
+
+
+def test_y_range():
+    assert get_y_range(np.array([-40, -10])) == (-46, -4)
+
+
+def test_svg():
+    svg = create_svg(*get_graph(), x_lims)
+    root = ElementTree.fromstring(svg)
+    namespace = '{http://www.w3.org/2000/svg}'
+    assert root.get('width') == '800'
+    assert len(root.findall(f'{namespace}polyline')) == 1
+    labels = [text.text for text in root.findall(f'{namespace}text')]
+    assert {'100', '200', '500', '1k', 'FFT Data', 'Frequency (Hz)', 'Magnitude (dB)'} <= set(labels)
+
+
+def test_png():
+    x, y = get_graph()
+    pixels = decode_png(encode_png(rasterize(x, y, x_lims)))
+    assert pixels.shape == (600, 800, 3)
+    assert (pixels[300, 400] == plot_color).all() or (pixels[300, 400] == line_color).all()
+    # The peak at 220 Hz reaches the top padding, 6 dB below the top of the plot area
+    line = np.all(pixels == line_color, axis=2)
+    rows = np.nonzero(line.any(axis=1))[0]
+    assert rows.min() == round(100 + 6 / 42 * 420)
+
+
+def test_renderer_stats(tmp_path):
+    x, y = get_graph()
+    with NativeRenderer(x_lims) as renderer:
+        for i in range(20):
+            renderer.submit(str(tmp_path / f'{i}.png'), x, y)
+            renderer.submit(str(tmp_path / f'{i}.svg'), x, y)
+    assert renderer.stats()['renders'] == 40
+
+
+def test_export_svg(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 1, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], plot_backend='svg',
+                                 _destination_folder=str(tmp_path / 'export'))
+    c_signal, ref_signal = SignalRecording(c_files), SignalRecording(ref_files)
+    c_signal.read_files()
+    ref_signal.read_files()
+    s1_sums, s2_sums, sd1, _ = create_signal_combinations(c_signal, ref_signal)
+
+    fft_export.create_export(s1_sums, s2_sums, sd1, export_config, lambda x: None)
+    files = os.listdir(os.path.join(export_config.fractions_path(), 'FFT', 'DIFF'))
+    assert sorted(files) == ['DIFF_mics_1_fraction_1_of_2.svg', 'DIFF_mics_1_fraction_2_of_2.svg']
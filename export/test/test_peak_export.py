@@ -0,0 +1,84 @@
+"""
+This module tests the peak table export against the values of the fraction sheets.
+"""
+import csv
+
+import numpy as np
+import pytest
+from openpyxl.reader.excel import load_workbook
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from export.peak_export import columns, get_ad_psi, load_peak_columns
+
+regions = [(72, 74), (219, 221), (442, 444)]
+
+
+def export_peaks(tmp_path, peaks_format: str) -> ExportConfig:
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=regions, export_peaks=True, peaks_format=peaks_format,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+    return export_config
+
+
+def get_sheet_values(export_config: ExportConfig, t: int, row: int) -> [float]:
+    """
+    :return: Frequency and amplitude of C, REF, DIFF and DIFF+90 in a row of a fraction sheet.
+    """
+    sheet = load_workbook(export_config.sheet_path())[f'fraction {t + 1} of {export_config.time_fractions}']
+    return [sheet.cell(row, column).value for column in range(4, 8)] + \
+        [sheet.cell(row, column).value for column in range(9, 13)]
+
+
+def test_csv_matches_sheet(tmp_path):
+    export_config = export_peaks(tmp_path, 'csv')
+    with open(export_config.peaks_path(), newline='') as file:
+        rows = list(csv.DictReader(file))
+    assert list(rows[0]) == columns
+    assert len(rows) == 2 * 3 * len(regions) * 4
+
+    # Second fraction, set of mics 1 and 2, second region
+    selected = [row for row in rows if row['fraction'] == '2' and row['mics'] == '1 2' and row['region_start'] == '219']
+    assert [row['signal'] for row in selected] == ['C1', 'REF', 'DIFF', 'DIFF+90']
+    expected = get_sheet_values(export_config, 1, 3 + 2 * len(regions) + 1)
+    for i, row in enumerate(selected):
+        assert float(row['frequency']) == pytest.approx(expected[2 * i])
+        assert float(row['db']) == pytest.approx(expected[2 * i + 1])
+    amplitudes = [float(row['db']) for row in selected]
+    ad, psi = get_ad_psi(*np.array(amplitudes))
+    assert float(selected[0]['ad']) == pytest.approx(amplitudes[0] - amplitudes[1])
+    assert float(selected[0]['ad']) == pytest.approx(ad)
+    if np.isnan(psi):
+        assert selected[0]['psi'] == 'nan'
+    else:
+        assert float(selected[0]['psi']) == pytest.approx(psi)
+
+
+def test_npy_matches_csv(tmp_path):
+    export_config = export_peaks(tmp_path / 'npy', 'npy')
+    table, schema = load_peak_columns(export_config.peaks_path())
+    assert schema['rows'] == 2 * 3 * len(regions) * 4
+    assert schema['signal'] == ['C1', 'REF', 'DIFF', 'DIFF+90']
+    assert set(table) == set(columns) - {'mics'}
+
+    csv_config = export_peaks(tmp_path / 'csv', 'csv')
+    with open(csv_config.peaks_path(), newline='') as file:
+        rows = list(csv.DictReader(file))
+    np.testing.assert_array_equal(table['fraction'], [int(row['fraction']) for row in rows])
+    assert [schema['signal'][i] for i in table['signal']] == [row['signal'] for row in rows]
+    np.testing.assert_allclose(table['db'], [float(row['db']) for row in rows])
+    np.testing.assert_allclose(table['psi'], [float(row['psi']) for row in rows])
+
+
+def test_ad_psi():
+    # Equal C and REF with a difference of the same amplitude are 60 degrees apart
+    ad, psi = get_ad_psi(np.array([0.0]), np.array([0.0]), np.array([0.0]), np.array([0.0]))
+    assert ad[0] == 0
+    assert psi[0] == pytest.approx(60)
+    _, psi = get_ad_psi(np.array([0.0]), np.array([0.0]), np.array([0.0]), np.array([4.0]))
+    assert psi[0] == pytest.approx(-60)
+    _, psi = get_ad_psi(np.array([0.0]), np.array([0.0]), np.array([20.0]), np.array([0.0]))
+    assert np.isnan(psi[0])
@@ -0,0 +1,152 @@
+"""
+This module tests the single pass export pipeline and its sinks.
+"""
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import pipeline
+from export.export import create_export
+from export.pipeline import ExportPipeline, Sink
+from export.spectra_export import load_spectra
+from signal_processing import fft
+from signal_processing.signals import SignalRecording, create_signal_combinations
+
+
+class RecordingSink(Sink):
+    stage = 'recording'
+
+    def __init__(self, fail_at: int = None):
+        self.calls = []
+        self.sets = []
+        self.fail_at = fail_at
+
+    def start(self, pipeline):
+        self.calls.append('start')
+
+    def start_fraction(self, t):
+        self.calls.append(f'start_fraction {t}')
+
+    def write(self, block):
+        self.calls.append(f'write {block.fraction}')
+        self.sets += list(block.sets)
+        if block.fraction == self.fail_at:
+            raise RuntimeError('sink failed')
+
+    def end_fraction(self, t):
+        self.calls.append(f'end_fraction {t}')
+
+    def finish(self):
+        self.calls.append('finish')
+
+    def abort(self):
+        self.calls.append('abort')
+
+
+@pytest.fixture
+def signals(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)],
+                                 _destination_folder=str(tmp_path / 'export'))
+    c_signal, ref_signal = SignalRecording(c_files), SignalRecording(ref_files)
+    c_signal.read_files()
+    ref_signal.read_files()
+    return create_signal_combinations(c_signal, ref_signal), export_config
+
+
+def test_sink_calls(signals, monkeypatch):
+    (s1_sums, s2_sums, sd1, sd2), export_config = signals
+    # A block of a single signal set
+    monkeypatch.setattr(pipeline, 'stack_bytes', 1)
+    export_pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, export_config, lambda x: None)
+    sink = export_pipeline.add_sink(RecordingSink())
+    export_pipeline.run()
+
+    fraction = ['write {t}'] * 3
+    assert sink.calls == ['start', 'start_fraction 0', *[c.format(t=0) for c in fraction], 'end_fraction 0',
+                          'start_fraction 1', *[c.format(t=1) for c in fraction], 'end_fraction 1', 'finish']
+    assert sink.sets == [0, 1, 2, 0, 1, 2]
+
+
+def test_sink_error_aborts(signals):
+    (s1_sums, s2_sums, sd1, sd2), export_config = signals
+    export_pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, export_config, lambda x: None)
+    failing = export_pipeline.add_sink(RecordingSink(fail_at=0))
+    with pytest.raises(RuntimeError, match='sink failed'):
+        export_pipeline.run()
+    assert failing.calls[-1] == 'abort'
+    assert 'finish' not in failing.calls
+
+
+def test_start_error_aborts_started(signals):
+    (s1_sums, s2_sums, sd1, sd2), export_config = signals
+    export_pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, export_config, lambda x: None)
+    started = export_pipeline.add_sink(RecordingSink())
+    failing = export_pipeline.add_sink(RecordingSink())
+    failing.start = lambda pipeline: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        export_pipeline.run()
+    assert started.calls == ['start', 'abort']
+    assert failing.calls == []
+
+
+def test_analysis_overlaps_writing(signals):
+    (s1_sums, s2_sums, sd1, sd2), export_config = signals
+    export_pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, export_config, lambda x: None)
+    analyzed = threading.Event()
+    get_blocks = export_pipeline.get_blocks
+
+    def get_analyzed_blocks(t):
+        for block in get_blocks(t):
+            yield block
+            if t == 1:
+                analyzed.set()
+
+    export_pipeline.get_blocks = get_analyzed_blocks
+    sink = export_pipeline.add_sink(RecordingSink())
+    overlapped = []
+    sink.end_fraction = lambda t: overlapped.append(analyzed.wait(5)) if t == 0 else None
+    export_pipeline.run()
+    # The second fraction was analyzed while the first one was still being written
+    assert overlapped == [True]
+
+
+def test_block_spectra(signals):
+    (s1_sums, s2_sums, sd1, sd2), export_config = signals
+    export_pipeline = ExportPipeline(s1_sums, s2_sums, sd1, sd2, export_config, lambda x: None)
+    block = next(export_pipeline.get_blocks(1))
+    frequency, spectra = block.get_spectra()
+    assert block.get_spectra()[1] is spectra
+
+    expected = fft.create_fft(sd1[2], 2, 1)
+    np.testing.assert_allclose(frequency, expected.frequency)
+    np.testing.assert_allclose(spectra[2][2], expected.plot)
+    frequencies, amplitudes = block.get_peaks()
+    assert amplitudes.shape == (4, 3, 2)
+    s, e = expected.get_frequency_region(219, 221)
+    assert [frequencies[2, 2, 1], amplitudes[2, 2, 1]] == expected.get_region(s, e).get_max_amplitude()
+
+
+def test_every_export_analyzes_once(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], collect_metrics=True, export_audio=True,
+                                 export_fft=True, plot_backend='svg', export_spectra=True, export_peaks=True,
+                                 results_database=str(tmp_path / 'results.db'),
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    with open(export_config.report_path()) as file:
+        report = json.load(file)
+    # 3 signal sets, 2 fractions and 4 signal types, the same as the sheets alone
+    assert report['counters']['ffts'] == 3 * 2 * 4
+    for name in ['sheet', 'peak_table', 'database', 'wav', 'png', 'spectra']:
+        assert name in report['stages']
+
+    spectra, _ = load_spectra(export_config.spectra_path())
+    assert spectra['DIFF+90'].shape[:2] == (2, 3)
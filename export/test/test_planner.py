@@ -0,0 +1,66 @@
+"""
+This module tests the dry-run planner against the counters of real exports.
+"""
+import json
+
+import pytest
+
+from benchmark.samples import create_recordings, get_regions
+from config import ExportConfig
+from export.export import create_export
+from export.planner import calibrate, count_work, default_rates, load_calibration, plan_export
+
+
+@pytest.fixture
+def export_config(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    return ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, export_audio=True,
+                        frequency_regions=[(72, 74), (219, 221)], json_load_path=None, collect_metrics=True,
+                        _destination_folder=str(tmp_path / 'export'))
+
+
+def test_plan_export(export_config):
+    plan = plan_export(export_config, default_rates, 'defaults')
+    assert plan.mic_count == 2
+    assert plan.set_count == 3
+    assert plan.frames == 24000
+    assert plan.fft_size == 12000
+    assert plan.fft_count == 4 * 3 * 2
+    assert plan.wav_count == 3 * 3 * 2
+    assert plan.png_count == 0
+    assert 'png' not in plan.runtime
+    assert plan.total_runtime > 0
+    assert 'Peak memory' in plan.format()
+
+
+def test_plan_matches_export(export_config):
+    plan = plan_export(export_config, default_rates, 'defaults')
+    create_export(export_config, lambda x: None)
+    with open(export_config.report_path()) as file:
+        counters = json.load(file)['counters']
+
+    assert plan.fft_count == counters['ffts']
+    assert plan.wav_count == counters['files_written']
+    assert plan.sheet_count == counters['sheets_written']
+    # Cells are estimated from template row widths, which is close but not exact
+    assert counters['cells_written'] * 0.8 < plan.cell_count < counters['cells_written'] * 1.25
+
+
+def test_calibrate():
+    regions = get_regions(4)
+    work = count_work(2, 48000, 4, len(regions))
+    results = [{'mic_count': 2, 'duration': 1, 'samplerate': 48000, 'time_fractions': 4, 'region_count': 4,
+                'best': {'read': work['read'] * 2e-9, 'wav': work['wav'] * 1e-9}}]
+    rates = calibrate(results)
+    assert rates['read'] == pytest.approx(2e-9)
+    assert rates['wav'] == pytest.approx(1e-9)
+
+
+def test_load_calibration(tmp_path):
+    path = tmp_path / 'results.json'
+    path.write_text(json.dumps({'results': [{'mic_count': 1, 'duration': 1, 'samplerate': 48000,
+                                             'time_fractions': 4, 'region_count': 4, 'best': {'read': 1e-3}}]}))
+    rates, calibration = load_calibration(str(path))
+    assert rates['read'] == pytest.approx(1e-3 / 96000)
+    assert rates['png'] == default_rates['png']
+    assert 'results.json' in calibration
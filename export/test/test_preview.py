@@ -0,0 +1,53 @@
+"""
+This module tests the quick look preview of an export.
+"""
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.peak_export import get_ad_psi
+from export.preview import create_preview
+from signal_processing import fft
+from signal_processing.signals import SignalRecording, create_signal_combinations
+
+
+@pytest.fixture
+def export_config(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 4, duration=12)
+    return ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=3, json_load_path=None)
+
+
+def test_preview_matches_first_fraction(export_config):
+    preview = create_preview(export_config)
+
+    c_signal, ref_signal = SignalRecording(export_config.c_files), SignalRecording(export_config.ref_files)
+    c_signal.read_files()
+    ref_signal.read_files()
+    # The set with every microphone is the last one
+    signals = [sums[-1] for sums in create_signal_combinations(c_signal, ref_signal)]
+    fft_data = fft.create_fft_stack([signal.get_interval_fraction(3, 0) for signal in signals])
+    frequencies, amplitudes = fft_data.get_region_peaks(export_config.frequency_regions)
+    ad, _ = get_ad_psi(*amplitudes)
+
+    assert preview.signal_set == [1, 2, 3, 4]
+    assert preview.seconds == 4
+    assert preview.samplerate < 48000
+    # Bins of 0.25Hz, at a slightly different sample rate
+    np.testing.assert_allclose(preview.frequencies, frequencies, atol=0.25)
+    np.testing.assert_allclose(preview.ad, ad, atol=0.5)
+    assert preview.warnings == []
+    assert len(preview.format().splitlines()) == 1 + len(export_config.frequency_regions)
+
+
+def test_preview_warnings(export_config):
+    export_config.time_fractions = 24
+    export_config.frequency_regions = [(72, 74), (219, 220)]
+    preview = create_preview(export_config)
+    assert preview.seconds == 0.5
+    assert preview.warnings == ['time fractions of 0.50s resolve 2.00Hz, more than the narrowest region of 1Hz']
+    assert preview.format().endswith(f'Warning: {preview.warnings[0]}')
+
+    export_config.time_fractions = 48000 * 12 + 1
+    with pytest.raises(ValueError, match='too short'):
+        create_preview(export_config)
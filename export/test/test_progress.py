@@ -0,0 +1,100 @@
+"""
+This module tests progress events of exports, their aggregation and the log strings made from them.
+"""
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from export.progress import LogProgress, Progress, ProgressAggregator, ProgressEvent, format_status, get_status
+
+
+class Clock:
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+def test_stage_progress():
+    events = []
+    stage = Progress(events.append, None).stage('wav', 'file', 3)
+    stage.advance(0)
+    stage.advance(bytes=100, item='a.wav')
+    stage.advance(2, bytes=50)
+    assert [(e.done, e.bytes, e.item) for e in events] == [(0, 0, None), (1, 100, 'a.wav'), (3, 150, None)]
+    assert [e.finished for e in events] == [False, False, True]
+    assert all(e.stage == 'wav' and e.unit == 'file' and e.total == 3 for e in events)
+
+
+def test_status():
+    status = get_status(ProgressEvent('wav', 'file', 10, 40, 2 ** 21, 5.0))
+    assert status.rate == 2
+    assert status.byte_rate == 2 ** 21 / 5
+    assert status.eta == 15
+    assert format_status(status) == 'wav: 10/40 files, 2.0 files/s, 0.4 MB/s, 15s left'
+    assert get_status(ProgressEvent('read', 'file', 0, None, 0, 0.0)).eta is None
+    assert get_status(ProgressEvent('read', 'file', 4, 4, 0, 1.0)).eta == 0
+
+
+def test_aggregator_throttles():
+    clock = Clock()
+    statuses = []
+    aggregator = ProgressAggregator(statuses.append, interval=1, clock=clock)
+
+    def event(stage, done):
+        return ProgressEvent(stage, 'fraction', done, 4, 0, clock.time + 1)
+
+    aggregator(event('analysis', 0))
+    aggregator(event('analysis', 1))
+    # The first event of a stage is always passed on
+    aggregator(event('sheet', 1))
+    clock.time = 1.5
+    aggregator(event('analysis', 2))
+    aggregator(event('analysis', 3))
+    aggregator(event('analysis', 4))
+
+    assert [(s.event.stage, s.event.done) for s in statuses] == [('analysis', 0), ('sheet', 1), ('analysis', 2),
+                                                                  ('analysis', 4)]
+    assert aggregator.stages['analysis'].event.done == 4
+    assert aggregator.stages['sheet'].eta == pytest.approx(3)
+
+
+def test_log_progress():
+    clock = Clock()
+    lines = []
+    log_progress = LogProgress(lines.append, interval=1, clock=clock)
+    for done in range(3):
+        log_progress(ProgressEvent('analysis', 'fraction', done, 2, 0, 0.0))
+    for done in range(1, 4):
+        log_progress(ProgressEvent('wav', 'file', done, 3, 0, 0.0, f'{done}.wav'))
+    log_progress(ProgressEvent('sheet', 'fraction', 1, 2, 0, 0.0))
+    assert lines == ['fraction 1/2', 'fraction 2/2', 'exported audio 1.wav (1/3)', 'exported audio 3.wav (3/3)']
+
+
+def test_export_progress(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=4, json_load_path=None,
+                                 frequency_regions=[(70, 80), (215, 225)], export_audio=True, export_fft=True,
+                                 plot_backend='svg', export_spectrogram=True,
+                                 _destination_folder=str(tmp_path / 'export'))
+    events = []
+    lines = []
+    create_export(export_config, lines.append, progress=events.append)
+
+    last = {event.stage: event for event in events}
+    assert set(last) == {'read', 'analysis', 'checkpoint', 'sheet', 'metasheet', 'wav', 'png', 'spectrogram'}
+    assert all(event.finished for event in last.values())
+    # 3 signal sets, 4 fractions and C, REF and DIFF
+    assert (last['wav'].unit, last['wav'].done) == ('file', 3 * 4 * 3)
+    assert (last['png'].unit, last['png'].done) == ('graph', 3 * 4 * 3)
+    assert last['metasheet'].done == 5
+    assert last['wav'].bytes > 0 and last['read'].bytes > 0 and last['spectrogram'].bytes > 0
+    assert [event.done for event in events if event.stage == 'analysis'] == [0, 1, 2, 3, 4]
+
+    # Files are logged once a second at most, and the last file of each stage
+    assert [line for line in lines if line.startswith('fraction')] == [f'fraction {t}/4' for t in range(1, 5)]
+    audio_lines = [line for line in lines if line.startswith('exported audio')]
+    assert audio_lines[-1].endswith(f'({3 * 4 * 3}/{3 * 4 * 3})')
+    assert len(audio_lines) < 3 * 4 * 3
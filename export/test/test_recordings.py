@@ -0,0 +1,91 @@
+"""
+This module tests the cache of decoded recordings and their combinations.
+"""
+import os
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import recordings
+from export.export import create_export
+from export.recordings import RecordingCache
+from signal_processing import signals
+
+
+class Recording:
+    def __init__(self, files, size):
+        self.files = files
+        self.mic_signals = [signals.Signal(48000, np.zeros(size, np.uint8))] if size else []
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    reads = []
+    monkeypatch.setattr(recordings, 'read_recording', lambda files: reads.append(files) or Recording(files, 100))
+    monkeypatch.setattr(recordings, 'get_file_key', lambda files: tuple(files))
+    return reads
+
+
+def test_released_recordings_are_read_again(reads):
+    cache = RecordingCache()
+    cache.claim(['ref.wav'])
+    cache.claim(['ref.wav'])
+    first = cache.read(['ref.wav'])
+    assert cache.read(['ref.wav']) is first
+    cache.release(['ref.wav'])
+    assert cache.read(['ref.wav']) is first
+    cache.release(['ref.wav'])
+    assert cache.read(['ref.wav']) is not first
+    assert reads == [['ref.wav']] * 2
+    with pytest.raises(KeyError):
+        cache.release(['ref.wav'])
+
+
+def test_least_recently_used_are_evicted(reads):
+    cache = RecordingCache(limit_bytes=250)
+    for name in ('a.wav', 'b.wav', 'a.wav', 'c.wav'):
+        cache.read([name])
+    assert cache.bytes == 200
+    # b was used least recently
+    cache.read(['a.wav'])
+    cache.read(['b.wav'])
+    assert reads == [['a.wav'], ['b.wav'], ['c.wav'], ['b.wav']]
+
+    cache.claim(['b.wav'])
+    cache.read(['d.wav'])
+    cache.read(['e.wav'])
+    # b is kept while it is claimed, even though it was used least recently
+    cache.read(['b.wav'])
+    assert reads[-2:] == [['d.wav'], ['e.wav']]
+    cache.release(['b.wav'])
+    assert cache.bytes <= 250
+
+
+def test_changed_files_are_read_again(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path), 1, regions=[(70, 80), (215, 225)], duration=0.5)
+    cache = RecordingCache(limit_bytes=2 ** 30)
+    first = cache.read(c_files)
+    assert cache.read(c_files) is first
+    os.utime(c_files[0], ns=(0, 0))
+    assert cache.read(c_files) is not first
+    # The recording of the old file is dropped
+    assert cache.bytes == sum(s.data.nbytes for s in first.mic_signals)
+
+
+def test_second_export_starts_with_analysis(tmp_path, monkeypatch):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, regions=[(70, 80), (215, 225)], duration=0.5)
+    combinations = []
+    create_signal_combinations = signals.create_signal_combinations
+    monkeypatch.setattr(signals, 'create_signal_combinations',
+                        lambda *args: combinations.append(args) or create_signal_combinations(*args))
+
+    cache = RecordingCache(limit_bytes=2 ** 30)
+    for fractions in (2, 3):
+        data = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=fractions, json_load_path=None,
+                            frequency_regions=[(70, 80), (215, 225)],
+                            _destination_folder=str(tmp_path / f'export_{fractions}'))
+        create_export(data, lambda x: None, recordings=cache)
+        assert os.path.exists(data.sheet_path())
+    assert len(combinations) == 1
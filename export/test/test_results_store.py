@@ -0,0 +1,52 @@
+"""
+This module tests the SQLite results store.
+"""
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from export.peak_export import get_ad_psi
+from export.results_store import ResultsStore
+
+regions = [(72, 74), (219, 221), (442, 444)]
+
+
+def export_run(tmp_path, c_name: str) -> ExportConfig:
+    c_files, ref_files = create_recordings(str(tmp_path / c_name), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=regions, c_name=c_name,
+                                 results_database=str(tmp_path / 'results.db'),
+                                 _destination_folder=str(tmp_path / 'export' / c_name))
+    create_export(export_config, lambda x: None)
+    return export_config
+
+
+def test_results_across_runs(tmp_path):
+    export_run(tmp_path, 'C1')
+    export_run(tmp_path, 'C2')
+
+    with ResultsStore(str(tmp_path / 'results.db')) as store:
+        runs = store.get_runs()
+        assert [run['c_name'] for run in runs] == ['C1', 'C2']
+        assert runs[0]['time_fractions'] == 2 and runs[0]['config']['regions'] == [list(r) for r in regions]
+        assert store.connection.execute('SELECT start_sample, end_sample FROM fractions WHERE run_id = ?',
+                                        (runs[0]['id'],)).fetchall() == [(0, 24000), (24000, 48000)]
+
+        everything = store.query(['run_id'])
+        assert len(everything['run_id']) == 2 * 2 * 3 * len(regions)
+
+        result = store.query(['run_id', 'fraction', 'signal_set', 'c_db', 'ref_db', 'diff_db', 'diff90_db', 'ad',
+                              'psi'], frequency=443, signal_set=(1, 2))
+        np.testing.assert_array_equal(result['run_id'], [1, 1, 2, 2])
+        np.testing.assert_array_equal(result['fraction'], [1, 2, 1, 2])
+        assert result['signal_set'].tolist() == ['1 2'] * 4
+        ad, psi = get_ad_psi(result['c_db'], result['ref_db'], result['diff_db'], result['diff90_db'])
+        np.testing.assert_allclose(result['ad'], ad)
+        np.testing.assert_allclose(result['psi'], psi)
+
+        assert len(store.query(['psi'], c_name='C2', fraction=2)['psi']) == 3 * len(regions)
+        assert len(store.query(['psi'], c_name='C3')['psi']) == 0
+        with pytest.raises(ValueError):
+            store.query(['runs.id'])
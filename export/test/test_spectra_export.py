@@ -0,0 +1,38 @@
+"""
+This module tests the raw spectra export.
+"""
+import numpy as np
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from export.spectra_export import get_frequency, load_spectra
+from signal_processing import fft, signals
+
+
+def test_export_spectra(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=3, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], export_spectra=True,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    spectra, sidecar = load_spectra(export_config.spectra_path())
+    assert list(spectra) == ['C1', 'REF', 'DIFF', 'DIFF+90']
+    assert sidecar['signal_sets'] == [[1], [2], [1, 2]]
+    assert sidecar['fractions'] == [[0, 16000], [16000, 32000], [32000, 48000]]
+    for array in spectra.values():
+        assert isinstance(array, np.memmap)
+        assert array.shape == (3, 3, 8001) and array.dtype == np.float32
+
+    c1_signal = signals.SignalRecording(c_files)
+    c1_signal.read_files()
+    c2_signal = signals.SignalRecording(ref_files)
+    c2_signal.read_files()
+    s1_sums, s2_sums, sd1, sd2 = signals.create_signal_combinations(c1_signal, c2_signal)
+
+    expected = fft.create_fft(sd1[2].get_interval_fraction(3, 1))
+    assert np.allclose(get_frequency(sidecar), expected.frequency)
+    assert np.allclose(spectra['DIFF'][1, 2], expected.plot, atol=1e-3)
+    expected = fft.create_fft(sd2[0].get_interval_fraction(3, 2))
+    assert np.allclose(spectra['DIFF+90'][2, 0], expected.plot, atol=1e-3)
@@ -0,0 +1,34 @@
+"""
+This module tests the spectrogram export.
+"""
+import os
+
+import numpy as np
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from export.spectrogram_export import image_height, image_width
+
+
+def test_export_spectrogram(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, json_load_path=None,
+                                 frequency_regions=[(72, 74), (219, 221)], export_spectrogram=True,
+                                 spectrogram_window=4096, spectrogram_hop=1024,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    folder = os.path.join(export_config.spectrograms_path(), 'DIFF')
+    assert sorted(os.listdir(folder)) == ['DIFF_mics_1.npz', 'DIFF_mics_1.png', 'DIFF_mics_12.npz',
+                                          'DIFF_mics_12.png', 'DIFF_mics_2.npz', 'DIFF_mics_2.png']
+    with np.load(os.path.join(folder, 'DIFF_mics_12.npz')) as data:
+        assert data['db'].shape == (len(data['times']), len(data['frequency']))
+        assert len(data['times']) == (48000 - 4096) // 1024 + 1
+        assert data['frequency'][0] >= 72 * 0.8 and data['frequency'][-1] <= 221 * 1.2
+        assert int(data['window_size']) == 4096
+
+    with open(os.path.join(folder, 'DIFF_mics_12.png'), 'rb') as file:
+        png = file.read()
+    assert png[:8] == b'\x89PNG\r\n\x1a\n'
+    assert png[16:24] == image_width.to_bytes(4, 'big') + image_height.to_bytes(4, 'big')
@@ -0,0 +1,96 @@
+"""
+This module tests the layouts of the wav export.
+"""
+import json
+import os
+import warnings
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export import wav_export
+from signal_processing import signals
+from signal_processing.headers import read_wav_info
+
+
+def export_wav(tmp_path, wav_layout: str):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=1)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=3, json_load_path=None,
+                                 wav_layout=wav_layout, _destination_folder=str(tmp_path / 'export'))
+    c1_signal = signals.SignalRecording(c_files)
+    c1_signal.read_files()
+    c2_signal = signals.SignalRecording(ref_files)
+    c2_signal.read_files()
+    s1_sums, s2_sums, sd1, _ = signals.create_signal_combinations(c1_signal, c2_signal)
+    wav_export.create_export(s1_sums, s2_sums, sd1, export_config, lambda x: None)
+    return export_config, s1_sums, sd1
+
+
+def read_wav(path: str) -> np.ndarray:
+    # scipy warns about the cue chunks it skips
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', wavfile.WavFileWarning)
+        return wavfile.read(path)[1]
+
+
+def test_files(tmp_path):
+    export_config, s1_sums, _ = export_wav(tmp_path, 'files')
+    folder = os.path.join(export_config.fractions_path(), 'WAV', 'C1')
+    assert len(os.listdir(folder)) == 3 * 3
+    data = read_wav(os.path.join(folder, 'C1_mics_12_fraction_2_of_3.wav'))
+    np.testing.assert_array_equal(data, s1_sums[2].get_interval_fraction(3, 1).data)
+
+
+def test_audio_fraction_size(tmp_path):
+    signal = signals.Signal(48000, np.zeros(1000, np.int16))
+    size = wav_export.export_audio_fraction(str(tmp_path), 'C1', 'C1.wav', signal, lambda x: None)
+    assert size == os.path.getsize(tmp_path / 'WAV' / 'C1' / 'C1.wav') > signal.data.nbytes
+
+
+def test_multichannel(tmp_path):
+    export_config, s1_sums, sd1 = export_wav(tmp_path, 'multichannel')
+    audio_path = os.path.join(export_config.fractions_path(), 'WAV')
+    assert sorted(os.listdir(os.path.join(audio_path, 'DIFF'))) == \
+        [f'DIFF_fraction_{t}_of_3.wav' for t in range(1, 4)]
+
+    data = read_wav(os.path.join(audio_path, 'DIFF', 'DIFF_fraction_3_of_3.wav'))
+    assert data.shape == (16000, 3)
+    for i in range(3):
+        np.testing.assert_array_equal(data[:, i], sd1[i].get_interval_fraction(3, 2).data)
+
+    with open(os.path.join(audio_path, 'index.json')) as file:
+        index = json.load(file)
+    assert index['channels'] == ['mics_1', 'mics_2', 'mics_12']
+    assert len(index['files']) == 3 * 3
+
+
+def test_continuous(tmp_path):
+    export_config, s1_sums, _ = export_wav(tmp_path, 'continuous')
+    audio_path = os.path.join(export_config.fractions_path(), 'WAV')
+    path = os.path.join(audio_path, 'C1', 'C1_mics_2.wav')
+    np.testing.assert_array_equal(read_wav(path), s1_sums[1].data[:48000])
+    assert read_wav_info(path).frames == 48000
+
+    with open(os.path.join(audio_path, 'index.json')) as file:
+        index = json.load(file)
+    assert [fraction['start'] for fraction in index['fractions']] == [0, 16000, 32000]
+    entry = next(entry for entry in index['files'] if entry['path'] == 'C1/C1_mics_2.wav')
+
+    # The second fraction can be read straight from the file with the offsets in the index
+    dtype = s1_sums[1].data.dtype
+    with open(path, 'rb') as file:
+        file.seek(entry['data_offset'] + 16000 * entry['block_align'])
+        fraction = np.frombuffer(file.read(16000 * dtype.itemsize), dtype=dtype)
+    np.testing.assert_array_equal(fraction, s1_sums[1].get_interval_fraction(3, 1).data)
+
+    with open(path, 'rb') as file:
+        content = file.read()
+    assert b'cue ' in content and b'fraction 2 of 3\0' in content
+
+
+def test_unsupported_type(tmp_path):
+    with pytest.raises(ValueError):
+        wav_export.write_wav(str(tmp_path / 'complex.wav'), [signals.Signal(48000, np.zeros(10, dtype=complex))])
@@ -1,49 +1,252 @@
+"""
+Exports the audio of every time fraction, signal set and signal type. data.wav_layout picks the files:
+
+- files: one file per fraction, signal set and signal type.
+- multichannel: one file per fraction and signal type, with a channel for every signal set.
+- continuous: one file per signal set and signal type that spans all fractions, with a cue point at the start of
+  each fraction. WAV/index.json has the sample and byte offsets of the fractions.
+
+Files are submitted by WavSink as the export pipeline walks the fractions, and written concurrently by a pool of
+threads, which keeps network shares busy. Written files are counted in the progress of the wav stage. The audio of a
+fraction is a view of the signal. Files with a single channel are written straight from it, multichannel files are
+interleaved in blocks, so the audio is never copied as a whole.
+"""
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import numpy as np
 
 from config import ExportConfig
+from export.bundle import Bundle, make_output_dirs, open_output
+from export.pipeline import ExportPipeline, Sink, SpectraBlock
+from profiling import metrics, tracing
 from signal_processing import signals
+from signal_processing.headers import create_cue_chunks, create_wav_header
 from signal_processing.signals import Signal
 
+writer_threads = 8
+block_frames = 2 ** 16  # Frames that are interleaved and written together in multichannel files
+
 
 def create_export(s1_sums, s2_sums, sd1, data: ExportConfig, log=print):
-    log('Exporting wav files...')
+    pipeline = ExportPipeline(s1_sums, s2_sums, sd1, None, data, log)
+    pipeline.add_sink(WavSink())
+    pipeline.run()
+
+
+def get_mics_str(signal_set: [int]) -> str:
+    return 'mics_' + ''.join([str(m) for m in signal_set])
+
+
+class WavSink(Sink):
+    """
+    Submits the files of every block of the pipeline to a pool of writer threads. The audio of C, REF and DIFF is
+    exported, DIFF+90 is not.
+    """
+    stage = 'wav'
+    unit = 'file'
+    uses_spectra = False
+    uses_peaks = False
+
+    def start(self, pipeline: ExportPipeline):
+        self.data = data = pipeline.data
+        self.log = pipeline.log
+        self.names = pipeline.names[:3]
+        self.signal_sets = pipeline.signal_sets
+        self.fraction_length = pipeline.fraction_length
+        self.bundle = pipeline.bundle
+        self.log('Exporting wav files...')
+        types, sets, fractions = len(self.names), len(self.signal_sets), data.time_fractions
+        self.progress.total = {'files': types * sets * fractions, 'multichannel': types * fractions,
+                               'continuous': types * sets}[data.wav_layout]
+
+        self.audio_path = os.path.join(data.fractions_path(), 'WAV')
+        for name in self.names:
+            make_output_dirs(os.path.join(self.audio_path, name), self.bundle)
+
+        self.futures = {}
+        self.files = []
+        self.executor = ThreadPoolExecutor(writer_threads, thread_name_prefix='wav')
+        if data.wav_layout == 'continuous':
+            self.submit_continuous(pipeline.signal_types[:3])
+
+    def start_fraction(self, t: int):
+        # Channels of the multichannel file of each signal type
+        self.channels = [[] for _ in self.names]
+
+    def write(self, block: SpectraBlock):
+        if self.data.wav_layout == 'files':
+            self.submit_files(block)
+        elif self.data.wav_layout == 'multichannel':
+            for channels, fraction_signals in zip(self.channels, block.signals):
+                channels += fraction_signals
+
+    def end_fraction(self, t: int):
+        if self.data.wav_layout == 'multichannel':
+            self.submit_multichannel(t)
+        # Errors of finished files stop the export without waiting for the rest
+        for future in [future for future in self.futures if future.done()]:
+            self.futures.pop(future)
+            future.result()
+
+    def finish(self):
+        if self.data.wav_layout == 'multichannel':
+            mics = [get_mics_str(signal_set) for signal_set in self.signal_sets]
+            write_index(self.audio_path, self.data, self.files, self.fraction_length, channels=mics,
+                        bundle=self.bundle)
+        elif self.data.wav_layout == 'continuous':
+            write_index(self.audio_path, self.data, self.files, self.fraction_length, bundle=self.bundle)
+        try:
+            for future in as_completed(self.futures):
+                future.result()
+        except BaseException:
+            self.abort()
+            raise
+        self.executor.shutdown()
+
+    def abort(self):
+        for future in self.futures:
+            future.cancel()
+        self.executor.shutdown()
 
-    signal_sets = data.get_signal_sets()
+    def submit(self, file_name: str, function, *args, **kwargs):
+        """
+        Submits the function that writes a file to the pool, and advances the progress when it is written.
+        """
+        future = self.executor.submit(function, *args, **kwargs)
+        self.futures[future] = file_name
+        future.add_done_callback(lambda f: self.written(f, file_name))
+
+    def written(self, future, file_name: str):
+        if not future.cancelled() and future.exception() is None:
+            self.progress.advance(bytes=future.result(), item=file_name)
+
+    def submit_files(self, block: SpectraBlock):
+        """
+        Submits a file for every signal set of the block and signal type.
+        """
+        fractions = self.data.time_fractions
+        time_str = f'fraction_{block.fraction + 1}_of_{fractions}'
+        for j, i in enumerate(block.sets):
+            for name, fraction_signals in zip(self.names, block.signals):
+                file_name = f'{name}_{get_mics_str(self.signal_sets[i])}_{time_str}.wav'
+                self.submit(file_name, export_audio_fraction, self.data.fractions_path(), name, file_name,
+                            fraction_signals[j], lambda x: None, self.bundle)
+
+    def submit_multichannel(self, t: int):
+        """
+        Submits a file for every signal type of fraction t, with the signal sets as channels.
+        """
+        for name, channels in zip(self.names, self.channels):
+            file_name = f'{name}_fraction_{t + 1}_of_{self.data.time_fractions}.wav'
+            self.submit(file_name, write_wav, os.path.join(self.audio_path, name, file_name), channels,
+                        bundle=self.bundle)
+            self.files.append(get_index_entry(f'{name}/{file_name}', channels))
+
+    def submit_continuous(self, signal_types):
+        """
+        Submits a file for every signal set and signal type that spans all fractions.
+
+        :param signal_types: Signals of every signal set, for each signal type.
+        """
+        fractions = self.data.time_fractions
+        offsets = [t * self.fraction_length for t in range(fractions)]
+        labels = [f'fraction {t + 1} of {fractions}' for t in range(fractions)]
+        for name, sums in zip(self.names, signal_types):
+            for i in range(len(self.signal_sets)):
+                file_name = f'{name}_{get_mics_str(self.signal_sets[i])}.wav'
+                # Fractions are consecutive, so together they are the start of the signal
+                signal = Signal(sums[i].samplerate, sums[i].data[:fractions * self.fraction_length])
+                self.submit(file_name, write_wav, os.path.join(self.audio_path, name, file_name), [signal], offsets,
+                            labels, self.bundle)
+                self.files.append(get_index_entry(f'{name}/{file_name}', [signal]))
+
+
+def get_index_entry(path: str, channels: [Signal]) -> dict:
+    """
+    :return: Path of a file and where its audio data is. The byte offset of a frame is data_offset + frame *
+    block_align.
+    """
+    dtype = channels[0].data.dtype
+    return {'path': path, 'data_offset': len(create_wav_header(1, dtype, len(channels), 0)),
+            'block_align': dtype.itemsize * len(channels)}
+
+
+def write_index(audio_path: str, data: ExportConfig, files: [dict], fraction_length: int, channels: [str] = None,
+                bundle: Optional[Bundle] = None):
+    """
+    Writes index.json with the boundaries of the fractions in samples, and the files from get_index_entry.
+    """
     fractions = data.time_fractions
+    index = {
+        'layout': data.wav_layout,
+        'fractions': [{'fraction': t + 1, 'start': t * fraction_length, 'end': (t + 1) * fraction_length}
+                      for t in range(fractions)],
+        'files': files,
+    }
+    if channels:
+        index['channels'] = channels
+    with open_output(os.path.join(audio_path, 'index.json'), bundle) as file:
+        file.write(json.dumps(index, indent=2).encode())
 
-    for t in range(fractions):
-        log(f'fraction {t + 1}/{fractions}')
-        for i in range(len(signal_sets)):
-            # Sums and differences are created in the same order, this is why we can index them this way
-            c1_signal: Signal = s1_sums[i].get_interval_fraction(fractions, t)
-            c2_signal: Signal = s2_sums[i].get_interval_fraction(fractions, t)
-            diffs_signal: Signal = sd1[i].get_interval_fraction(fractions, t)
 
-            mics_str = 'mics_' + ''.join([str(m) for m in signal_sets[i]])
-            time_str = f'fraction_{t + 1}_of_{fractions}'
+def write_wav(path: str, channels: [Signal], offsets: [int] = None, labels: [str] = None,
+              bundle: Optional[Bundle] = None) -> int:
+    """
+    Writes signals of the same length and type as the channels of a .wav file, with optional cue points.
+
+    :param path: Path of the file.
+    :param channels: Signal of each channel.
+    :param offsets: Positions of the cue points in samples.
+    :param labels: Name of each cue point.
+    :param bundle: Bundle of the run to write into, see open_output.
+    :return: Size of the file in bytes.
+    """
+    with tracing.span('wav', file=os.path.basename(path)):
+        samplerate, dtype, frames = channels[0].samplerate, channels[0].data.dtype, channels[0].length
+        cues = create_cue_chunks(offsets, labels) if offsets else b''
+        with open_output(path, bundle) as file:
+            file.write(create_wav_header(samplerate, dtype, len(channels), frames, len(cues)))
+            if len(channels) == 1:
+                file.write(memoryview(np.ascontiguousarray(channels[0].data)).cast('B'))
+            else:
+                block = np.empty((min(block_frames, frames), len(channels)), dtype=dtype)
+                for start in range(0, frames, block_frames):
+                    end = min(start + block_frames, frames)
+                    for c, channel in enumerate(channels):
+                        block[:end - start, c] = channel.data[start:end]
+                    file.write(memoryview(block[:end - start]).cast('B'))
+            if frames * len(channels) * dtype.itemsize % 2:
+                file.write(b'\0')
+            file.write(cues)
+            size = file.tell()
 
-            export_audio_fraction(data.fractions_path(), data.c_name,
-                                  f'{data.c_name}_{mics_str}_{time_str}.wav', c1_signal)
-            export_audio_fraction(data.fractions_path(), data.ref_name,
-                                  f'{data.ref_name}_{mics_str}_{time_str}.wav', c2_signal)
-            export_audio_fraction(data.fractions_path(), 'DIFF', f'DIFF_{mics_str}_{time_str}.wav',
-                                  diffs_signal)
+    metrics.count('files_written')
+    metrics.count('bytes_saved', size)
+    return size
 
 
-def export_audio_fraction(audio_path, folder_name, file_name, signal, log=print):
+def export_audio_fraction(audio_path, folder_name, file_name, signal, log=print,
+                          bundle: Optional[Bundle] = None) -> int:
     """
-    Exports the audio file to the given path. Creates the directory if it doesn't exist.
+    Exports the audio file to the given path. Creates the directory if it doesn't exist, see open_output.
 
     :param audio_path: path to the audio folder.
     :param folder_name: name of the folder to export to.
     :param file_name: name of the file to export to.
     :param signal: signal to export.
     :param log: function that takes a string and prints it somewhere.
+    :param bundle: Bundle of the run to write into.
+    :return: Size of the wav file in bytes.
     """
-    try:
-        os.makedirs(f'{audio_path}/WAV/{folder_name}')
-    except FileExistsError:
-        pass
-
     log(f'exporting audio {file_name}')
-    signals.write_signal(f'{audio_path}/WAV/{folder_name}/{file_name}', signal)
+    with tracing.span('wav', file=file_name):
+        with open_output(f'{audio_path}/WAV/{folder_name}/{file_name}', bundle) as file:
+            signals.write_signal(file, signal)
+            # scipy leaves the position after the header it updates last
+            size = file.seek(0, os.SEEK_END)
+    metrics.count('files_written')
+    metrics.count('bytes_saved', size)
+    return size
@@ -0,0 +1,7 @@
+"""
+This module is responsible for instrumenting the export pipeline. Everything in it is disabled by default and costs
+a single check per call until it is enabled.
+- `metrics` records wall and cpu time per stage and counters, and writes a json run report
+- `tracing` records nested spans and writes a Chrome/Perfetto trace-event timeline
+- `memory` records tracemalloc peaks and RSS per stage, and enforces a memory budget
+"""
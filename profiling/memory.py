@@ -0,0 +1,295 @@
+"""
+Per-stage memory profiling. When enabled, every `profiling.metrics.stage` records
+- the tracemalloc peak while the stage was running
+- the process RSS and its high-water mark when the stage finished
+- for top-level stages, the largest live allocations grouped by origin (sums, hilbert, spectra, workbook, ...),
+  once per stage name
+
+It can also enforce a memory budget. Stages that are about to allocate a lot can call `check_budget` with an
+estimate, so that the run fails before the memory is actually allocated.
+
+Tracemalloc slows down code that creates many Python objects (e.g. openpyxl) several times, so it is only started
+when profiling is requested, and keeps only a few frames per allocation. Budget checks alone only need the RSS.
+"""
+from __future__ import annotations
+
+import heapq
+import inspect
+import os
+import sys
+import threading
+import tracemalloc
+from typing import Optional
+
+import numpy as np
+
+_profiler: Optional[MemoryProfiler] = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Number of frames stored with each allocation, needed to find where an allocation comes from. Every extra frame
+# makes tracing noticeably slower.
+traceback_frames = 4
+
+
+class MemoryBudgetExceeded(MemoryError):
+    """
+    Raised when the process uses, or is about to use, more memory than the configured budget.
+    """
+
+
+def get_rss() -> (Optional[int], Optional[int]):
+    """
+    :return: Current resident set size and its high-water mark in bytes. Values are None if they can't be read on
+    this platform.
+    """
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # peak_wset only exists on Windows
+        return info.rss, getattr(info, 'peak_wset', None)
+
+    current = None
+    if os.path.isfile('/proc/self/statm'):
+        with open('/proc/self/statm') as file:
+            current = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    peak = None
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS reports bytes
+        peak = peak if sys.platform == 'darwin' else peak * 1024
+
+    return current, peak
+
+
+def _get_origins() -> [(str, str, int, int)]:
+    """
+    :return: List of (origin, file name, first line, last line). An allocation belongs to the first origin that
+    matches one of its frames, starting from the most recent frame.
+    """
+    from signal_processing import fft, signals
+
+    origins = []
+    for origin, function in [('sums', signals.signal_sum), ('diffs', signals.signal_diff),
+                             ('read', signals.read_signal), ('spectra', fft.create_fft)]:
+        lines, first = inspect.getsourcelines(function)
+        origins.append((origin, inspect.getsourcefile(function), first, first + len(lines)))
+
+    return origins
+
+
+# Origins that are recognized by a part of the file path. In this pipeline scipy.fft is only used by hilbert and
+# numpy.fft only by create_fft, which lets few frames be enough.
+_path_origins = [
+    ('hilbert', os.path.join('scipy', 'signal', '')),
+    ('hilbert', os.path.join('scipy', 'fft', '')),
+    ('spectra', os.path.join('numpy', 'fft', '')),
+    ('read', os.path.join('scipy', 'io', '')),
+    ('workbook', os.path.join('openpyxl', '')),
+]
+
+
+class MemoryProfiler:
+    """
+    Collects memory usage at stage boundaries. Stages can be nested, the peak of a stage includes all the stages
+    inside it. Stages of other threads, e.g. the sink writers, are never top-level, only the outermost stages of the
+    thread that started the first stage and the stages directly inside them are.
+    """
+
+    def __init__(self, budget: Optional[int] = None, trace_allocations: bool = True, top: int = 10):
+        """
+        :param budget: Maximum memory of the process in bytes, or None for no limit.
+        :param trace_allocations: Whether to start tracemalloc. Without it only RSS is recorded.
+        :param top: Number of largest allocations to record in each snapshot.
+        """
+        self.budget = budget
+        self.top = top
+        self.stages: dict[str, dict[str, int]] = {}
+        self.snapshots: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Peaks of the stages that are currently running, innermost last
+        self._open: [[str, int]] = []
+        # Names of the stages running in each thread, and the thread that started the outermost stage
+        self._local = threading.local()
+        self._root_thread: Optional[int] = None
+        self._started_tracemalloc = False
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(traceback_frames)
+            self._started_tracemalloc = True
+        self._origins = _get_origins() if tracemalloc.is_tracing() else []
+
+    def stop(self):
+        """
+        Stops tracemalloc if this profiler started it.
+        """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _update_peaks(self):
+        """
+        Moves the tracemalloc peak since the last boundary into all the running stages.
+        """
+        if not tracemalloc.is_tracing():
+            return
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for stage in self._open:
+            stage[1] = max(stage[1], peak)
+
+    def _thread_stages(self) -> [str]:
+        if not hasattr(self._local, 'stages'):
+            self._local.stages = []
+        return self._local.stages
+
+    def stage_entered(self, name: str):
+        self._thread_stages().append(name)
+        with self._lock:
+            self._update_peaks()
+            if not self._open:
+                self._root_thread = threading.get_ident()
+            self._open.append([name, 0])
+        self.check_budget(0, name)
+
+    def stage_exited(self, name: str):
+        thread_stages = self._thread_stages()
+        if name in thread_stages:
+            del thread_stages[len(thread_stages) - 1 - thread_stages[::-1].index(name)]
+        with self._lock:
+            self._update_peaks()
+            # Threads can finish stages in any order, so find the innermost stage with this name
+            traced_peak = 0
+            for i in reversed(range(len(self._open))):
+                if self._open[i][0] == name:
+                    _, traced_peak = self._open.pop(i)
+                    break
+            # A snapshot takes long, so stages that run many times, e.g. analysis of each block, take only one
+            top_level = threading.get_ident() == self._root_thread and len(thread_stages) <= 1 and \
+                name not in self.snapshots
+
+        rss, rss_peak = get_rss()
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'traced_peak': 0, 'rss': 0, 'rss_peak': 0})
+            stage['calls'] += 1
+            stage['traced_peak'] = max(stage['traced_peak'], traced_peak)
+            stage['rss'] = max(stage['rss'], rss or 0)
+            stage['rss_peak'] = max(stage['rss_peak'], rss_peak or 0)
+
+        if top_level and tracemalloc.is_tracing():
+            self.snapshots[name] = self.take_snapshot()
+        self.check_budget(0, name)
+
+    def check_budget(self, additional: int, stage: str):
+        """
+        Raises MemoryBudgetExceeded if current memory plus the additional bytes is more than the budget.
+
+        :param additional: Number of bytes the caller is about to allocate.
+        :param stage: Name of the stage, used in the error message.
+        """
+        if self.budget is None:
+            return
+        current, _ = get_rss()
+        if current is None:
+            current, _ = tracemalloc.get_traced_memory()
+        if current + additional > self.budget:
+            raise MemoryBudgetExceeded(
+                f'{stage} needs about {_to_mb(current + additional)}MB, but the memory budget is '
+                f'{_to_mb(self.budget)}MB')
+
+    def take_snapshot(self) -> dict:
+        """
+        :return: Live allocations grouped by origin, and the largest NumPy allocations.
+        """
+        snapshot = tracemalloc.take_snapshot()
+        origins = {}
+        for statistic in snapshot.statistics('traceback'):
+            origin = self._get_origin(statistic.traceback)
+            totals = origins.setdefault(origin, {'bytes': 0, 'count': 0})
+            totals['bytes'] += statistic.size
+            totals['count'] += statistic.count
+
+        # NumPy tracks its data buffers in a separate domain, so every trace there is a single array
+        numpy_domain = np.lib.tracemalloc_domain
+        largest = heapq.nlargest(self.top, snapshot.traces,
+                                 key=lambda trace: trace.size if trace.domain == numpy_domain else -1)
+        largest = [trace for trace in largest if trace.domain == numpy_domain]
+        largest = [{'origin': self._get_origin(trace.traceback), 'bytes': trace.size,
+                    'file': trace.traceback[-1].filename, 'line': trace.traceback[-1].lineno} for trace in largest]
+
+        return {'origins': dict(sorted(origins.items(), key=lambda x: -x[1]['bytes'])), 'largest': largest}
+
+    def _get_origin(self, traceback: tracemalloc.Traceback) -> str:
+        # Frames are ordered from the oldest call
+        for frame in reversed(traceback):
+            for origin, file_name, first, last in self._origins:
+                if frame.filename == file_name and first <= frame.lineno < last:
+                    return origin
+            for origin, path_part in _path_origins:
+                if path_part in frame.filename:
+                    return origin
+        return 'other'
+
+    def report(self) -> dict:
+        """
+        :return: Json serializable dictionary with all the collected data.
+        """
+        return {
+            'budget': self.budget,
+            'stages': self.stages,
+            'snapshots': self.snapshots,
+        }
+
+
+def _to_mb(value: int) -> int:
+    return round(value / 2 ** 20)
+
+
+def enable(budget: Optional[int] = None, trace_allocations: bool = True) -> MemoryProfiler:
+    """
+    Creates a new profiler and makes it active. Stages are only seen if metrics are enabled too.
+
+    :return: The new profiler.
+    :param budget: Maximum memory of the process in bytes, or None for no limit.
+    :param trace_allocations: Whether to trace allocations with tracemalloc, or only watch RSS.
+    """
+    global _profiler
+    _profiler = MemoryProfiler(budget, trace_allocations)
+    return _profiler
+
+
+def disable() -> Optional[MemoryProfiler]:
+    """
+    Deactivates the profiler and stops tracemalloc if the profiler started it.
+
+    :return: The profiler that was active, or None.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def get_profiler() -> Optional[MemoryProfiler]:
+    """
+    :return: The active profiler, or None if memory profiling is disabled.
+    """
+    return _profiler
+
+
+def check_budget(additional: int, stage: str):
+    """
+    Raises MemoryBudgetExceeded if the active profiler has a budget, and allocating the additional bytes would
+    exceed it. Does nothing if memory profiling is disabled.
+    """
+    profiler = _profiler
+    if profiler is not None:
+        profiler.check_budget(additional, stage)
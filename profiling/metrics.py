@@ -0,0 +1,166 @@
+"""
+Stage-level metrics registry. Pipeline code marks stages and counts work, for example:
+
+```python
+with metrics.stage('combinations'):
+    ...
+metrics.count('ffts')
+```
+
+Both calls do nothing unless a registry is enabled with `enable()`. There is one registry per process,
+and it is safe to use from several threads. Stages are also recorded as spans when `profiling.tracing` is enabled,
+and their memory usage is recorded when `profiling.memory` is enabled.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from profiling import memory, tracing
+
+_registry: Optional[MetricsRegistry] = None
+
+
+class MetricsRegistry:
+    """
+    Stores timings of each stage and values of counters. Stage timings are inclusive, so a stage that runs inside
+    another one is counted in both of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = datetime.now()
+        self._start_time = time.perf_counter()
+        self.stages: dict[str, dict[str, float]] = {}
+        self.counters: dict[str, float] = {}
+        # Extra report sections, other modules can add their own data here
+        self.sections: dict[str, object] = {}
+
+    def add_stage(self, name: str, wall: float, cpu: float):
+        """
+        Adds one run of a stage.
+
+        :param name: Name of the stage.
+        :param wall: Elapsed wall time in seconds.
+        :param cpu: Elapsed cpu time of the thread that ran the stage in seconds.
+        """
+        with self._lock:
+            stage = self.stages.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+            stage['calls'] += 1
+            stage['wall'] += wall
+            stage['cpu'] += cpu
+
+    def count(self, name: str, value: float = 1):
+        """
+        Increases the counter with the given name.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self) -> dict:
+        """
+        :return: Json serializable dictionary with all the collected data.
+        """
+        with self._lock:
+            return {
+                'started': self.started.isoformat(timespec='seconds'),
+                'wall': time.perf_counter() - self._start_time,
+                'stages': {name: dict(stage) for name, stage in self.stages.items()},
+                'counters': dict(self.counters),
+                **self.sections,
+            }
+
+    def write_report(self, path: str):
+        """
+        Writes the report as json. Creates the directory if it doesn't exist.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2, default=str)
+
+
+class _Stage:
+    """
+    Context manager that measures a stage and adds it to the registry on exit.
+    """
+    __slots__ = ('name', 'registry', 'span', 'wall', 'cpu')
+
+    def __init__(self, name: str, registry: MetricsRegistry):
+        self.name = name
+        self.registry = registry
+        self.span = tracing.span(name)
+
+    def __enter__(self):
+        self.span.__enter__()
+        profiler = memory.get_profiler()
+        if profiler is not None:
+            profiler.stage_entered(self.name)
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.registry.add_stage(self.name, time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+        profiler = memory.get_profiler()
+        try:
+            if profiler is not None:
+                profiler.stage_exited(self.name)
+        finally:
+            self.span.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+
+def enable() -> MetricsRegistry:
+    """
+    Creates a new registry and makes it active.
+
+    :return: The new registry.
+    """
+    global _registry
+    _registry = MetricsRegistry()
+    return _registry
+
+
+def disable() -> Optional[MetricsRegistry]:
+    """
+    Deactivates the registry.
+
+    :return: The registry that was active, or None.
+    """
+    global _registry
+    registry, _registry = _registry, None
+    return registry
+
+
+def get_registry() -> Optional[MetricsRegistry]:
+    """
+    :return: The active registry, or None if metrics are disabled.
+    """
+    return _registry
+
+
+def stage(name: str):
+    """
+    :return: Context manager that measures wall and cpu time of the code inside it. When metrics are disabled,
+    this is only a tracing span, which does nothing when tracing is disabled too.
+    :param name: Name of the stage, e.g. "read", "combinations", "save".
+    """
+    registry = _registry
+    if registry is None:
+        return tracing.span(name)
+    return _Stage(name, registry)
+
+
+def count(name: str, value: float = 1):
+    """
+    Increases the counter with the given name, e.g. "ffts", "cells_written", "bytes_saved".
+    """
+    registry = _registry
+    if registry is not None:
+        registry.count(name, value)
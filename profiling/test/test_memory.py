@@ -0,0 +1,117 @@
+"""
+This module tests per-stage memory profiling and the memory budget.
+"""
+import json
+import threading
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from profiling import memory, metrics
+from signal_processing import signals
+
+
+@pytest.fixture
+def profiler():
+    metrics.enable()
+    profiler = memory.enable()
+    yield profiler
+    memory.disable()
+    metrics.disable()
+
+
+def test_tracemalloc_is_stopped():
+    memory.enable()
+    assert tracemalloc.is_tracing()
+    memory.disable()
+    assert not tracemalloc.is_tracing()
+
+
+def test_get_rss():
+    current, peak = memory.get_rss()
+    assert current is None or current > 0
+    assert peak is None or peak > 0
+
+
+def test_stage_peak(profiler):
+    with metrics.stage('outer'):
+        with metrics.stage('inner'):
+            data = np.ones(2 ** 20)
+            del data
+        with metrics.stage('after'):
+            pass
+    assert profiler.stages['inner']['traced_peak'] >= 8 * 2 ** 20
+    assert profiler.stages['outer']['traced_peak'] >= 8 * 2 ** 20
+    assert profiler.stages['after']['traced_peak'] < 8 * 2 ** 20
+
+
+def test_snapshot_origins(profiler):
+    mic_signals = [signals.Signal(48000, np.ones(2 ** 18)) for _ in range(2)]
+    with metrics.stage('combinations'):
+        summed = signals.signal_sum(*mic_signals)
+    largest = profiler.snapshots['combinations']['largest']
+    assert {'origin': 'sums', 'bytes': summed.data.nbytes} in \
+           [{'origin': x['origin'], 'bytes': x['bytes']} for x in largest]
+
+
+def test_snapshots_of_top_level_stages(profiler, monkeypatch):
+    taken = []
+    take_snapshot = profiler.take_snapshot
+    monkeypatch.setattr(profiler, 'take_snapshot', lambda: taken.append(1) or take_snapshot())
+
+    def write():
+        with metrics.stage('sink'):
+            pass
+
+    with metrics.stage('export'):
+        for _ in range(3):
+            with metrics.stage('analysis'):
+                pass
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join()
+    assert profiler.stages['sink']['calls'] == 1
+    assert sorted(profiler.snapshots) == ['analysis', 'export']
+    assert len(taken) == 2
+
+
+def test_check_budget():
+    memory.enable(budget=2 ** 40, trace_allocations=False)
+    try:
+        memory.check_budget(0, 'read')
+        with pytest.raises(memory.MemoryBudgetExceeded):
+            memory.check_budget(2 ** 41, 'combinations')
+    finally:
+        memory.disable()
+
+
+@pytest.mark.slow
+def test_export_memory_report(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 1, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=1, profile_memory=True,
+                                 frequency_regions=[(72, 74)], json_load_path=None,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    with open(export_config.report_path()) as file:
+        report = json.load(file)
+    assert report['memory']['stages']['combinations']['traced_peak'] > 0
+    origins = report['memory']['snapshots']['combinations']['origins']
+    assert 'sums' in origins
+    assert 'hilbert' in origins
+    assert not tracemalloc.is_tracing()
+
+
+def test_export_memory_budget(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, memory_budget_mb=1,
+                                 frequency_regions=[(72, 74), (219, 221)], json_load_path=None,
+                                 _destination_folder=str(tmp_path / 'export'))
+    with pytest.raises(memory.MemoryBudgetExceeded):
+        create_export(export_config, lambda x: None)
+    assert memory.get_profiler() is None
+    assert metrics.get_registry() is None
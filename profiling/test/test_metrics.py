@@ -0,0 +1,72 @@
+"""
+This module tests the metrics registry, and that an export with metrics enabled writes the run report.
+"""
+import json
+import os
+
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from profiling import metrics
+
+
+@pytest.fixture
+def registry():
+    registry = metrics.enable()
+    yield registry
+    metrics.disable()
+
+
+def test_disabled_metrics_do_nothing():
+    assert metrics.get_registry() is None
+    with metrics.stage('read'):
+        metrics.count('ffts')
+    assert metrics.get_registry() is None
+
+
+def test_stage(registry):
+    for _ in range(3):
+        with metrics.stage('read'):
+            pass
+    report = registry.report()
+    assert report['stages']['read']['calls'] == 3
+    assert report['stages']['read']['wall'] >= 0
+
+
+def test_stage_records_on_error(registry):
+    with pytest.raises(ValueError):
+        with metrics.stage('read'):
+            raise ValueError()
+    assert registry.stages['read']['calls'] == 1
+
+
+def test_count(registry):
+    metrics.count('ffts')
+    metrics.count('ffts', 2)
+    metrics.count('bytes_saved', 100)
+    assert registry.report()['counters'] == {'ffts': 3, 'bytes_saved': 100}
+
+
+def test_export_writes_report(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, collect_metrics=True,
+                                 frequency_regions=[(72, 74), (219, 221)], json_load_path=None,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    assert metrics.get_registry() is None
+    assert os.path.isfile(export_config.report_path())
+    with open(export_config.report_path()) as file:
+        report = json.load(file)
+
+    assert report['status'] == 'complete'
+    assert report['config']['time_fractions'] == 2
+    for name in ['export', 'read', 'combinations', 'sheet', 'save']:
+        assert name in report['stages']
+    # 3 signal sets, 2 fractions and 4 signal types
+    assert report['counters']['ffts'] == 3 * 2 * 4
+    assert report['counters']['files_read'] == 4
+    assert report['counters']['bytes_saved'] > 0
+    assert report['counters']['cells_written'] > 0
@@ -0,0 +1,82 @@
+"""
+This module tests the trace-event tracer, and that an export with tracing enabled writes a timeline.
+"""
+import json
+from threading import Thread
+
+import pytest
+
+from benchmark.samples import create_recordings
+from config import ExportConfig
+from export.export import create_export
+from profiling import metrics, tracing
+
+
+@pytest.fixture
+def tracer():
+    tracer = tracing.enable()
+    yield tracer
+    tracing.disable()
+
+
+def test_disabled_span_does_nothing():
+    assert tracing.get_tracer() is None
+    with tracing.span('fraction', fraction=1):
+        pass
+    assert tracing.get_tracer() is None
+
+
+def test_nested_spans(tracer):
+    with tracing.span('fraction', fraction=1):
+        with tracing.span('set', set=2):
+            pass
+    inner, outer = tracer.events
+    assert outer['name'] == 'fraction'
+    assert outer['args'] == {'fraction': 1}
+    assert inner['args'] == {'set': 2}
+    assert outer['ts'] <= inner['ts']
+    assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+
+def test_spans_from_threads(tracer):
+    def work():
+        with tracing.span('work'):
+            pass
+
+    threads = [Thread(target=work, name=f'worker {i}') for i in range(2)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    trace = tracer.trace()
+    thread_names = {e['args']['name'] for e in trace['traceEvents'] if e['name'] == 'thread_name'}
+    assert thread_names == {'worker 0', 'worker 1'}
+
+
+def test_metrics_stage_is_traced(tracer):
+    with metrics.stage('read'):
+        pass
+    assert tracer.events[0]['name'] == 'read'
+
+
+def test_extend(tracer):
+    worker_tracer = tracing.Tracer()
+    worker_tracer.add_event('render', 0, 1000, {'file': 'a.png'})
+    tracer.extend(worker_tracer.events)
+    assert tracer.events[0]['dur'] == 1
+
+
+def test_export_writes_trace(tmp_path):
+    c_files, ref_files = create_recordings(str(tmp_path / 'input'), 2, duration=0.5)
+    export_config = ExportConfig(c_files=c_files, ref_files=ref_files, time_fractions=2, trace=True,
+                                 frequency_regions=[(72, 74), (219, 221)], json_load_path=None,
+                                 _destination_folder=str(tmp_path / 'export'))
+    create_export(export_config, lambda x: None)
+
+    assert tracing.get_tracer() is None
+    with open(export_config.trace_path()) as file:
+        events = json.load(file)['traceEvents']
+
+    names = {event['name'] for event in events}
+    assert {'export', 'read', 'combinations', 'fraction', 'analyze', 'set', 'metasheet', 'save'} <= names
+    sheets = {event['args']['sheet'] for event in events if event['name'] == 'metasheet'}
+    assert sheets == {'Af', 'At', 'Apos(x)', 'fpos(x)', 'ft'}
@@ -0,0 +1,168 @@
+"""
+Opt-in tracer that records nested spans of the export pipeline and writes them in the Chrome trace-event format.
+The resulting json can be opened locally in https://ui.perfetto.dev or chrome://tracing. For example:
+
+```python
+with tracing.span('fraction', fraction=3):
+    ...
+```
+
+Spans do nothing unless a tracer is enabled with `enable()`. Every stage from `profiling.metrics.stage` is also
+recorded as a span. Events carry process and thread ids, so spans from worker threads show up on their own tracks.
+Worker processes can enable their own tracer and send `Tracer.events` back to the parent, which merges them with
+`Tracer.extend`.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+_tracer: Optional[Tracer] = None
+
+
+class Tracer:
+    """
+    Stores complete ("X") trace events. Timestamps come from the monotonic performance counter, so events from
+    different processes on the same machine line up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.events: [dict] = []
+        self._thread_names: dict[(int, int), str] = {}
+
+    def add_event(self, name: str, start_ns: int, end_ns: int, args: dict):
+        """
+        Adds a complete event.
+
+        :param name: Name of the span.
+        :param start_ns: Start of the span from time.perf_counter_ns().
+        :param end_ns: End of the span from time.perf_counter_ns().
+        :param args: Arguments shown when the span is selected, e.g. fraction index or sheet name.
+        """
+        thread = threading.current_thread()
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': start_ns / 1000,
+            'dur': (end_ns - start_ns) / 1000,
+            'pid': os.getpid(),
+            'tid': thread.ident,
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            self._thread_names.setdefault((event['pid'], event['tid']), thread.name)
+
+    def extend(self, events: [dict]):
+        """
+        Merges events recorded by another tracer, usually one that ran in a worker process.
+        """
+        with self._lock:
+            self.events.extend(events)
+
+    def trace(self) -> dict:
+        """
+        :return: Json serializable trace with metadata events that name the processes and threads.
+        """
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self._thread_names)
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for (pid, tid), name in thread_names.items()]
+        metadata += [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f'export {pid}'}}
+                     for pid in {event['pid'] for event in events}]
+        return {'traceEvents': metadata + sorted(events, key=lambda e: e['ts']), 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str):
+        """
+        Writes the trace as json. Creates the directory if it doesn't exist.
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(self.trace(), file, default=str)
+
+
+class _Span:
+    """
+    Context manager that adds a complete event to the tracer on exit.
+    """
+    __slots__ = ('name', 'args', 'tracer', 'start')
+
+    def __init__(self, name: str, args: dict, tracer: Tracer):
+        self.name = name
+        self.args = args
+        self.tracer = tracer
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.add_event(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class _NullSpan:
+    """
+    Context manager that does nothing. A single instance is shared, so disabled spans don't allocate anything.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_null_span = _NullSpan()
+
+
+def enable() -> Tracer:
+    """
+    Creates a new tracer and makes it active.
+
+    :return: The new tracer.
+    """
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def disable() -> Optional[Tracer]:
+    """
+    Deactivates the tracer.
+
+    :return: The tracer that was active, or None.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """
+    :return: The active tracer, or None if tracing is disabled.
+    """
+    return _tracer
+
+
+def span(name: str, **args):
+    """
+    :return: Context manager that records the code inside it as a span.
+    :param name: Name of the span, e.g. "fraction" or "sheet".
+    :param args: Values shown with the span, e.g. fraction=3, set=12, sheet='ft'.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _null_span
+    return _Span(name, args, tracer)
@@ -0,0 +1,87 @@
+"""
+Peak preserving decimation of spectra for plots. The frequency range of a graph is divided into bins of equal width
+on a logarithmic scale, and every bin keeps the lowest and highest magnitude of the fft bins that fall into it.
+Unlike sampling at log-spaced frequencies, a narrow peak is never dropped, because it is always the maximum of its
+bin. At low frequencies, where log bins are narrower than the fft resolution, every fft bin is kept as it is.
+
+The bin index map depends only on the frequency axis, so it is computed once and reused for every spectrum with
+the same axis. A whole stack of spectra, e.g. (fractions x sets x fft bins), is reduced in one call.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Number of decimators kept by get_decimator. An export usually has a single frequency axis.
+cache_size = 8
+_cache: OrderedDict = OrderedDict()
+_cache_lock = threading.Lock()  # Exports running at the same time share the cache
+
+
+class LogDecimator:
+    """
+    Reduces spectra to min/max envelopes of logarithmic frequency bins.
+    """
+
+    def __init__(self, frequency: np.ndarray, x_lims: (float, float), bins: int):
+        """
+        :param frequency: Frequency axis of the spectra, sorted ascending (e.g. from np.fft.rfftfreq).
+        :param x_lims: Frequency range of the graph. Frequencies outside of it are dropped.
+        :param bins: Number of logarithmic bins. Bins without any fft bin are skipped.
+        """
+        self.first = int(np.searchsorted(frequency, x_lims[0], side='left'))
+        self.last = int(np.searchsorted(frequency, x_lims[1], side='right'))
+        if self.last <= self.first:
+            raise ValueError(f'no frequencies between {x_lims[0]} and {x_lims[1]} Hz')
+
+        edges = np.geomspace(x_lims[0], x_lims[1], bins + 1)
+        in_range = frequency[self.first:self.last]
+        index = np.minimum(np.searchsorted(edges, in_range, side='right') - 1, bins - 1)
+
+        # fft bins are sorted, so every log bin is a contiguous run of them
+        self.starts = np.flatnonzero(np.diff(index, prepend=-1))
+        counts = np.diff(np.append(self.starts, len(in_range)))
+        self.frequency = np.add.reduceat(in_range, self.starts) / counts
+
+    def __len__(self):
+        """
+        :return: Number of non-empty bins, the length of the last axis of reduced spectra.
+        """
+        return len(self.starts)
+
+    def reduce(self, spectra: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        :return: Lowest and highest values of each bin, arrays of shape (..., len(self)).
+        :param spectra: Array of shape (..., fft bins), the last axis matches the frequency axis.
+        """
+        segment = spectra[..., self.first:self.last]
+        return np.minimum.reduceat(segment, self.starts, axis=-1), np.maximum.reduceat(segment, self.starts, axis=-1)
+
+    def envelope(self, spectra: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        :return: Frequencies and values that draw the envelope as a single polyline. Every bin has two points, its
+        lowest and its highest value. The values have shape (..., 2 * len(self)).
+        :param spectra: Array of shape (..., fft bins), the last axis matches the frequency axis.
+        """
+        low, high = self.reduce(spectra)
+        return np.repeat(self.frequency, 2), np.stack([low, high], axis=-1).reshape(*low.shape[:-1], -1)
+
+
+def get_decimator(frequency: np.ndarray, x_lims: (float, float), bins: int) -> LogDecimator:
+    """
+    :return: Decimator for the frequency axis, reused if one was already created for the same axis.
+    :param frequency: Frequency axis of the spectra, sorted ascending.
+    :param x_lims: Frequency range of the graph.
+    :param bins: Number of logarithmic bins.
+    """
+    # An fft frequency axis is defined by its length and spacing
+    key = (len(frequency), float(frequency[-1]), float(x_lims[0]), float(x_lims[1]), bins)
+    with _cache_lock:
+        decimator = _cache.get(key)
+        if decimator is None:
+            decimator = _cache[key] = LogDecimator(frequency, x_lims, bins)
+            if len(_cache) > cache_size:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+        return decimator
@@ -2,6 +2,7 @@ from __future__ import annotations
 import numpy as np
 from numpy import ndarray
 
+from profiling import metrics
 from signal_processing.signals import Signal
 
 
@@ -59,6 +60,21 @@ class FourierData:
         max_amplitude = self.plot[max_index]
         return [max_frequency, max_amplitude]
 
+    def get_region_peaks(self, regions: [(int, int)]) -> (ndarray, ndarray):
+        """
+        :return: Frequency and amplitude where amplitude is max in each frequency region, arrays of shape
+        (..., len(regions)). The values are the same as get_max_amplitude of each region, but plot can also be a stack
+        of ffts from create_fft_stack.
+        :param regions: Start and end frequency of each region.
+        """
+        frequencies, amplitudes = [], []
+        for start, end in regions:
+            s, e = self.get_frequency_region(start, end)
+            index = s + np.argmax(self.plot[..., s:e], axis=-1)
+            frequencies.append(self.frequency[index])
+            amplitudes.append(np.take_along_axis(self.plot, np.expand_dims(index, -1), axis=-1)[..., 0])
+        return np.stack(frequencies, axis=-1), np.stack(amplitudes, axis=-1)
+
 
 def create_fft(signal: Signal, N=1, index=0) -> FourierData:
     """
@@ -90,5 +106,26 @@ def create_fft(signal: Signal, N=1, index=0) -> FourierData:
     FFT = np.abs(FFT)
     x = np.fft.rfftfreq(len(data), 1 / signal_interval.samplerate)
     FFT = np.multiply(20, np.log10(FFT))
+    metrics.count('ffts')
+    metrics.count('fft_samples', signal_interval.length)
+
+    return FourierData(x, FFT)
+
+
+def create_fft_stack(signals: [Signal]) -> FourierData:
+    """
+    Creates ffts of several signals of the same length and sample rate in one call. The values are the same as
+    create_fft of each signal.
+
+    :return: FourierData with a shared frequency axis, and plot of shape (len(signals), fft bins).
+    :param signals: Signals to create ffts for.
+    """
+    length = signals[0].length
+    data = np.stack([signal.data for signal in signals]) * np.hanning(length)
+    FFT = np.abs(np.fft.rfft(data, norm="forward", axis=-1))
+    x = np.fft.rfftfreq(length, 1 / signals[0].samplerate)
+    FFT = np.multiply(20, np.log10(FFT))
+    metrics.count('ffts', len(signals))
+    metrics.count('fft_samples', length * len(signals))
 
     return FourierData(x, FFT)
@@ -0,0 +1,252 @@
+"""
+Reads only the RIFF headers of .wav files, without reading the audio data. This is enough to know sample rate,
+sample format, channel count and length of a recording, and it takes a fraction of a millisecond per file.
+check_wav_files uses them to find recordings that can't be analyzed together before any audio is read:
+
+```python
+check = check_wav_files(c_files, ref_files)
+print(check.format())
+```
+
+Relevant Urls:
+[WAVE PCM soundfile format](http://soundfile.sapp.org/doc/WaveFormat/)
+[Multiple channel audio data and WAVE files (Microsoft)](https://learn.microsoft.com/en-us/windows-hardware/drivers/audio/extensible-wave-format-descriptors)
+"""
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+header_workers = 8  # Files whose headers are read at the same time, mostly waiting for the disk
+trim_limit_seconds = 1.0  # Recordings that differ more in length are probably not of the same take
+
+
+@dataclass
+class WavInfo:
+    """
+    Information from the header of a .wav file.
+    """
+    filename: str
+    samplerate: int
+    channels: int
+    bits_per_sample: int
+    format_tag: int
+    frames: int
+    file_size: int
+
+    @property
+    def itemsize(self) -> int:
+        """
+        :return: Size of one sample of one channel in bytes, the same as itemsize of the array scipy would read.
+        """
+        return self.bits_per_sample // 8
+
+    @property
+    def is_float(self) -> bool:
+        return self.format_tag == WAVE_FORMAT_IEEE_FLOAT
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: Length of the recording in seconds.
+        """
+        return self.frames / self.samplerate
+
+
+def read_wav_info(filename: str) -> WavInfo:
+    """
+    Parses the RIFF chunks of a .wav file until it finds the "fmt " and "data" chunks. Raises a ValueError if the
+    file is not a valid .wav file.
+
+    :return: WavInfo with the values from the header.
+    :param filename: Path to the audio file.
+    """
+    file_size = os.path.getsize(filename)
+    with open(filename, 'rb') as file:
+        header = file.read(12)
+        if len(header) < 12:
+            raise ValueError(f'{filename} is too short to be a RIFF WAVE file')
+        riff, _, wave = struct.unpack('<4sI4s', header)
+        if riff not in (b'RIFF', b'RIFX') or wave != b'WAVE':
+            raise ValueError(f'{filename} is not a RIFF WAVE file')
+        endian = '<' if riff == b'RIFF' else '>'
+
+        fmt = None
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                raise ValueError(f'{filename} has no data chunk')
+            chunk_id, chunk_size = struct.unpack(endian + '4sI', header)
+
+            if chunk_id == b'fmt ':
+                fmt = file.read(chunk_size)
+                if len(fmt) < 16:
+                    raise ValueError(f'{filename} has a truncated fmt chunk')
+                # Chunks are aligned to two bytes
+                file.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise ValueError(f'{filename} has data chunk before fmt chunk')
+                format_tag, channels, samplerate, _, block_align, bits_per_sample = \
+                    struct.unpack(endian + 'HHIIHH', fmt[:16])
+                if channels == 0 or samplerate == 0 or block_align == 0:
+                    raise ValueError(f'{filename} has {channels} channels, a sample rate of {samplerate}Hz and '
+                                     f'{block_align} bytes per frame')
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # The real format is in the first two bytes of the sub-format GUID
+                    format_tag, = struct.unpack(endian + 'H', fmt[24:26])
+                # Some writers put a wrong size in the data chunk of long files, so never trust more than there is
+                data_size = min(chunk_size, file_size - file.tell())
+                return WavInfo(filename, samplerate, channels, bits_per_sample, format_tag,
+                               data_size // block_align, file_size)
+            else:
+                file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+@dataclass
+class WavCheck:
+    """
+    Result of check_wav_files. Recordings with errors can't be analyzed, warnings tell what the analysis changes.
+    """
+    infos: [Optional[WavInfo]]  # Headers of the C files, then the REF files, None if a header can't be read
+    frames: int  # Length every recording is trimmed to
+    errors: [str] = field(default_factory=list)
+    warnings: [str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def format(self) -> str:
+        """
+        :return: Human readable errors and warnings, one per line.
+        """
+        return '\n'.join([f'Error: {error}' for error in self.errors] +
+                         [f'Warning: {warning}' for warning in self.warnings])
+
+
+def _read_wav_info_or_error(filename: str):
+    try:
+        return read_wav_info(filename)
+    except (OSError, ValueError) as e:
+        return f'{filename} can not be read: {e}'
+
+
+def check_wav_files(c_files: [str], ref_files: [str], workers: int = header_workers) -> WavCheck:
+    """
+    Reads the headers of the recordings in parallel and checks that they can be analyzed together. Every microphone
+    must be a mono file with the same sample rate and sample format. Recordings of different lengths are trimmed to
+    the shortest one, which is a warning up to trim_limit_seconds and an error above it.
+
+    :return: WavCheck with the headers, and the errors and warnings in milliseconds.
+    :param c_files: Files of the C recording, one per microphone.
+    :param ref_files: Files of the REF recording, in the same order.
+    :param workers: Most headers that are read at the same time.
+    """
+    files = list(c_files) + list(ref_files)
+    with ThreadPoolExecutor(max(1, min(workers, len(files)))) as executor:
+        results = list(executor.map(_read_wav_info_or_error, files))
+    infos = [result if isinstance(result, WavInfo) else None for result in results]
+    errors = [result for result in results if isinstance(result, str)]
+    warnings = []
+
+    if len(c_files) != len(ref_files):
+        errors.append(f'{len(c_files)} C files and {len(ref_files)} REF files, every microphone needs both')
+    valid = [info for info in infos if info is not None]
+    for info in valid:
+        name = os.path.basename(info.filename)
+        if info.channels != 1:
+            errors.append(f'{name} has {info.channels} channels, every microphone must be a mono file')
+        if info.format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT) or info.bits_per_sample % 8:
+            errors.append(f'{name} has an unsupported sample format {info.format_tag:#06x} of '
+                          f'{info.bits_per_sample} bits')
+        if info.frames == 0:
+            errors.append(f'{name} has no audio')
+    if not valid:
+        return WavCheck(infos, 0, errors, warnings)
+
+    samplerates = {info.samplerate for info in valid}
+    if len(samplerates) > 1:
+        errors.append('recordings have different sample rates: ' +
+                      _describe(valid, lambda info: f'{info.samplerate}Hz'))
+    formats = {(info.is_float, info.bits_per_sample) for info in valid}
+    if len(formats) > 1:
+        errors.append('recordings have different sample formats: ' + _describe(
+            valid, lambda info: f'{info.bits_per_sample} bit {"float" if info.is_float else "int"}'))
+
+    frames = min(info.frames for info in valid)
+    samplerate = valid[0].samplerate
+    for info in valid:
+        extra = (info.frames - frames) / samplerate
+        if extra == 0:
+            continue
+        message = f'{os.path.basename(info.filename)} is {extra * 1000:.1f}ms longer than the shortest recording'
+        if extra > trim_limit_seconds:
+            errors.append(message)
+        else:
+            warnings.append(f'{message}, its last {info.frames - frames} samples are not analyzed')
+    return WavCheck(infos, frames, errors, warnings)
+
+
+def _describe(infos: [WavInfo], describe) -> str:
+    """
+    :return: Each distinct description, with the names of the files it applies to.
+    """
+    names = {}
+    for info in infos:
+        names.setdefault(describe(info), []).append(os.path.basename(info.filename))
+    return '; '.join(f'{description} ({", ".join(files)})' for description, files in names.items())
+
+
+def create_wav_header(samplerate: int, dtype: np.dtype, channels: int, frames: int, trailing_bytes: int = 0) -> bytes:
+    """
+    Creates the headers of a .wav file in the same format as scipy.io.wavfile.write, so the audio data can be
+    written after it in pieces, straight from the arrays.
+
+    :return: RIFF header, "fmt " chunk, "fact" chunk for float data and the header of the "data" chunk.
+    :param samplerate: Sample rate of the audio.
+    :param dtype: Type of the samples, float or integer.
+    :param channels: Number of interleaved channels.
+    :param frames: Number of samples in each channel.
+    :param trailing_bytes: Size of the chunks that are written after the audio data, e.g. from create_cue_chunks.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        format_tag = WAVE_FORMAT_IEEE_FLOAT
+    elif dtype.kind == 'i' or dtype == np.uint8:
+        format_tag = WAVE_FORMAT_PCM
+    else:
+        raise ValueError(f'{dtype} samples can not be written into a .wav file')
+
+    block_align = channels * dtype.itemsize
+    data_size = frames * block_align
+    fmt = struct.pack('<4sIHHIIHH', b'fmt ', 16, format_tag, channels, samplerate, samplerate * block_align,
+                      block_align, dtype.itemsize * 8)
+    fact = struct.pack('<4sII', b'fact', 4, frames) if format_tag == WAVE_FORMAT_IEEE_FLOAT else b''
+    riff_size = 4 + len(fmt) + len(fact) + 8 + data_size + data_size % 2 + trailing_bytes
+    return struct.pack('<4sI4s', b'RIFF', riff_size, b'WAVE') + fmt + fact + struct.pack('<4sI', b'data', data_size)
+
+
+def create_cue_chunks(offsets: [int], labels: [str]) -> bytes:
+    """
+    :return: "cue " chunk with a cue point at each offset, and a "LIST" chunk with their labels, which audio editors
+    show as markers. They are written after the audio data.
+    :param offsets: Positions of the cue points in samples.
+    :param labels: Name of each cue point.
+    """
+    points = b''.join(struct.pack('<II4sIII', i + 1, offset, b'data', 0, 0, offset)
+                      for i, offset in enumerate(offsets))
+    cue = struct.pack('<4sII', b'cue ', 4 + len(points), len(offsets)) + points
+
+    notes = b''
+    for i, label in enumerate(labels):
+        text = label.encode('utf-8') + b'\0'
+        notes += struct.pack('<4sII', b'labl', 4 + len(text), i + 1) + text + b'\0' * (len(text) % 2)
+    return cue + struct.pack('<4sI4s', b'LIST', 4 + len(notes), b'adtl') + notes
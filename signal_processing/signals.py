@@ -10,6 +10,7 @@ import numpy as np
 from scipy.signal import hilbert
 from scipy.io import wavfile
 from config import microphone_combinations as sets
+from profiling import memory, metrics
 from typing import Union, List
 
 
@@ -77,6 +78,8 @@ class SignalRecording:
         Reads all the signals and saves them in a single list of signals.
         """
         self.mic_signals = [read_signal(file) for file in self.files]
+        metrics.count('files_read', len(self.mic_signals))
+        metrics.count('samples_read', sum(s.length for s in self.mic_signals))
 
 
 def signal_sum(*signals: Signal) -> Signal:
@@ -102,11 +105,25 @@ def read_signal(filename: str) -> Signal:
     return Signal(*wavfile.read(filename))
 
 
-def write_signal(filename: str, signal: Signal):
+def read_signal_excerpt(filename: str, frames: int) -> Signal:
+    """
+    :return: Signal with the first frames of the audio file. Only those frames are read, unless scipy can't memory
+    map the sample format of the file.
+    :param filename: Path to the audio file.
+    :param frames: Number of frames to read.
+    """
+    try:
+        samplerate, data = wavfile.read(filename, mmap=True)
+    except ValueError:
+        samplerate, data = wavfile.read(filename)
+    return Signal(samplerate, np.array(data[:frames]))
+
+
+def write_signal(filename, signal: Signal):
     """
     Writes a signal object into a .wav audio file.
 
-    :param filename: Path to the audio file.
+    :param filename: Path to the audio file, or a file object opened for binary writing.
     :param signal: Signal to write.
     """
     wavfile.write(filename, data=signal.data, rate=signal.samplerate)
@@ -119,28 +136,56 @@ def create_signal_combinations(signal_s1: SignalRecording, signal_s2: SignalReco
     - Step 1 involves summing all the s1 and s2 signal combinations.
     - Step 2 involves subtracting summed s2 from summed s1.
     - Step 3 involves subtracting the hilbert-transformed s2 from s1.
+    Recordings of different lengths are trimmed to the shortest one, see headers.check_wav_files.
     """
     s1_sums: [Signal] = []
     s2_sums: [Signal] = []
     diffs: [Signal] = []
     diffs_hilbert: [Signal] = []
     signal_sets = get_signal_sets(len(signal_s2.mic_signals))
-    for signal_set in signal_sets:
-        s1_signals = [signal_s1.mic_signals[i - 1] for i in signal_set]
-        s1_sum = signal_sum(*s1_signals)
+    length = min(s.length for s in signal_s1.mic_signals + signal_s2.mic_signals)
+    s1_signals = [s if s.length == length else s._get_fraction(0, length) for s in signal_s1.mic_signals]
+    s2_signals = [s if s.length == length else s._get_fraction(0, length) for s in signal_s2.mic_signals]
+    memory.check_budget(estimate_combinations_bytes(length, s1_signals[0].data.itemsize, len(signal_sets)),
+                        'combinations')
+    with metrics.stage('combinations'):
+        for signal_set in signal_sets:
+            s1_sum, s2_sum, diff, diff_hilbert = combine_signal_set(
+                [s1_signals[i - 1] for i in signal_set], [s2_signals[i - 1] for i in signal_set])
+            s1_sums.append(s1_sum)
+            s2_sums.append(s2_sum)
+            diffs_hilbert.append(diff_hilbert)
+            diffs.append(diff)
+        metrics.count('combinations', len(signal_sets))
+        metrics.count('hilbert_transforms', 2 * len(signal_sets))
+    return s1_sums, s2_sums, diffs, diffs_hilbert
 
-        s2_signals = [signal_s2.mic_signals[i - 1] for i in signal_set]
-        s2_sum = signal_sum(*s2_signals)
 
-        s1_sums.append(s1_sum)
-        s2_sums.append(s2_sum)
+def combine_signal_set(s1_signals: [Signal], s2_signals: [Signal]) -> (Signal, Signal, Signal, Signal):
+    """
+    Steps 1, 2 and 3 from the notes for the microphones of a single signal set.
 
-        s1a = Signal(s1_sum.samplerate, np.imag(hilbert(s1_sum.data)))
-        s2b = Signal(s2_sum.samplerate, np.real(hilbert(s2_sum.data)))
-        diffs_hilbert.append(signal_diff(s1a, s2b))
+    :return: Sum of s1, sum of s2, their difference and the difference of the hilbert-transformed s1 and s2.
+    :param s1_signals: s1 signals of the microphones in the set.
+    :param s2_signals: s2 signals of the same microphones.
+    """
+    s1_sum = signal_sum(*s1_signals)
+    s2_sum = signal_sum(*s2_signals)
+    s1a = Signal(s1_sum.samplerate, np.imag(hilbert(s1_sum.data)))
+    s2b = Signal(s2_sum.samplerate, np.real(hilbert(s2_sum.data)))
+    return s1_sum, s2_sum, signal_diff(s1_sum, s2_sum), signal_diff(s1a, s2b)
 
-        diffs.append(signal_diff(s1_sum, s2_sum))
-    return s1_sums, s2_sums, diffs, diffs_hilbert
+
+def estimate_combinations_bytes(length: int, itemsize: int, set_count: int) -> int:
+    """
+    :return: Approximate number of bytes that create_signal_combinations allocates. Sums and the difference keep
+    the data type of the recordings, while the hilbert difference is float64. While a set is processed, two
+    complex128 hilbert transforms are alive too.
+    :param length: Number of samples in each recording.
+    :param itemsize: Size of one sample in bytes, e.g. 4 for float32 recordings.
+    :param set_count: Number of microphone combinations.
+    """
+    return set_count * length * (3 * itemsize + 8) + 2 * length * 16
 
 
 def get_signal_sets(set_size: int) -> [[int]]:
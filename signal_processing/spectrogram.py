@@ -0,0 +1,58 @@
+"""
+Short-time Fourier transform of a whole recording, to see how the spectrum evolves over time without splitting the
+recording into time fractions.
+
+Frames are a strided view of the signal (np.lib.stride_tricks.sliding_window_view), so overlapping frames don't copy
+the signal. Only a chunk of windowed frames exists at a time, and only the frequency bins inside the requested range
+are kept, so the result of a long recording is a small dB matrix.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from profiling import metrics
+from signal_processing.signals import Signal
+
+# Frames that are windowed and transformed together
+chunk_frames = 128
+
+
+@dataclass
+class Spectrogram:
+    """
+    Magnitudes in dB of shape (len(times), len(frequency)).
+    """
+    times: np.ndarray  # Center of each frame in seconds
+    frequency: np.ndarray
+    db: np.ndarray
+    samplerate: int
+    window_size: int
+    hop: int
+
+
+def create_spectrogram(signal: Signal, window_size: int, hop: int, frequency_lims: (float, float)) -> Spectrogram:
+    """
+    :return: Spectrogram of the signal, cropped to the frequency range. Magnitudes are scaled the same way as
+    fft.create_fft, so the values of a single frame match an fft of the same samples.
+    :param signal: Signal to transform.
+    :param window_size: Length of each frame in samples. Frequency resolution is samplerate / window_size.
+    :param hop: Distance between the starts of consecutive frames in samples.
+    :param frequency_lims: Lowest and highest frequency to keep.
+    """
+    if signal.length < window_size:
+        raise ValueError(f'signal has {signal.length} samples, shorter than the window of {window_size}')
+
+    frames = sliding_window_view(signal.data, window_size)[::hop]
+    frequency = np.fft.rfftfreq(window_size, 1 / signal.samplerate)
+    first, last = np.searchsorted(frequency, frequency_lims[0]), np.searchsorted(frequency, frequency_lims[1], 'right')
+    window = np.hanning(window_size)
+
+    db = np.empty((len(frames), last - first), dtype=np.float32)
+    for start in range(0, len(frames), chunk_frames):
+        spectrum = np.fft.rfft(frames[start:start + chunk_frames] * window, norm='forward', axis=-1)
+        db[start:start + chunk_frames] = 20 * np.log10(np.abs(spectrum[:, first:last]))
+
+    metrics.count('stft_frames', len(frames))
+    times = (np.arange(len(frames)) * hop + window_size / 2) / signal.samplerate
+    return Spectrogram(times, frequency[first:last], db, signal.samplerate, window_size, hop)
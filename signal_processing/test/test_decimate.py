@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from signal_processing import fft
+from signal_processing.decimate import LogDecimator, get_decimator
+from signal_processing.signals import Signal
+
+frequency = np.fft.rfftfreq(48000, 1 / 48000)
+x_lims = (57.6, 1056)
+
+
+def test_peak_is_preserved():
+	spectra = np.full((2, 3, frequency.size), -80.0)
+	spectra[1, 2, 1000] = -3  # Single fft bin peak at 1000 Hz
+	decimator = LogDecimator(frequency, x_lims, 100)
+	low, high = decimator.reduce(spectra)
+	assert low.shape == high.shape == (2, 3, len(decimator))
+	assert high[1, 2].max() == -3
+	assert decimator.frequency[np.argmax(high[1, 2])] == pytest.approx(1000, rel=0.02)
+	assert high[0].max() == -80
+
+
+def test_stack_matches_single():
+	spectra = np.random.default_rng(0).normal(size=(4, frequency.size))
+	decimator = LogDecimator(frequency, x_lims, 200)
+	low, high = decimator.reduce(spectra)
+	for i in range(4):
+		single_low, single_high = decimator.reduce(spectra[i])
+		np.testing.assert_array_equal(low[i], single_low)
+		np.testing.assert_array_equal(high[i], single_high)
+
+
+def test_low_frequencies_are_kept():
+	# Log bins below ~200 Hz are narrower than 1 Hz, so every fft bin there is a bin of its own
+	decimator = LogDecimator(frequency, x_lims, 1000)
+	low_bins = decimator.frequency[decimator.frequency < 100]
+	np.testing.assert_array_equal(low_bins, frequency[(frequency >= 57.6) & (frequency < 100)])
+
+
+def test_envelope():
+	spectra = np.arange(frequency.size, dtype=float)
+	decimator = LogDecimator(frequency, x_lims, 50)
+	x, y = decimator.envelope(spectra)
+	assert x.shape == y.shape == (2 * len(decimator),)
+	assert np.all(y[0::2] <= y[1::2])
+	assert x[0] >= x_lims[0] and x[-1] <= x_lims[1]
+
+
+def test_empty_range():
+	with pytest.raises(ValueError):
+		LogDecimator(frequency, (30000, 40000), 10)
+
+
+def test_get_decimator_is_cached():
+	assert get_decimator(frequency, x_lims, 100) is get_decimator(frequency.copy(), x_lims, 100)
+	assert get_decimator(frequency, x_lims, 100) is not get_decimator(frequency, x_lims, 101)
+
+
+def test_fft_stack_matches_fft():
+	rng = np.random.default_rng(1)
+	signals = [Signal(48000, rng.normal(size=4800).astype(np.float32)) for _ in range(3)]
+	stack = fft.create_fft_stack(signals)
+	for signal, plot in zip(signals, stack.plot):
+		single = fft.create_fft(signal)
+		np.testing.assert_array_equal(stack.frequency, single.frequency)
+		np.testing.assert_allclose(plot, single.plot, atol=1e-9)
@@ -0,0 +1,21 @@
+import numpy as np
+
+from signal_processing import fft
+from signal_processing.signals import Signal
+
+regions = [(72, 74), (219, 221), (442, 444), (878, 880)]
+
+
+def test_region_peaks_match_max_amplitude():
+	rng = np.random.default_rng(0)
+	signals = [Signal(48000, rng.normal(size=48000)) for _ in range(3)]
+	stack = fft.create_fft_stack(signals)
+	frequencies, amplitudes = stack.get_region_peaks(regions)
+	assert frequencies.shape == amplitudes.shape == (3, len(regions))
+	for i, signal in enumerate(signals):
+		full_fft = fft.create_fft(signal)
+		single_frequencies, single_amplitudes = full_fft.get_region_peaks(regions)
+		for j, (start, end) in enumerate(regions):
+			frequency, amplitude = full_fft.get_region(*full_fft.get_frequency_region(start, end)).get_max_amplitude()
+			assert frequencies[i, j] == single_frequencies[j] == frequency
+			assert np.isclose(amplitudes[i, j], amplitude) and single_amplitudes[j] == amplitude
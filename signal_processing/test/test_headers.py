@@ -0,0 +1,114 @@
+import glob
+
+import numpy as np
+import pytest
+from scipy.io import wavfile
+
+from signal_processing.headers import check_wav_files, create_cue_chunks, create_wav_header, read_wav_info, \
+	WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM
+
+
+def test_read_wav_info_matches_scipy():
+	for filename in glob.glob('signal_processing/test/samples/input/*.wav'):
+		info = read_wav_info(filename)
+		samplerate, data = wavfile.read(filename)
+		assert info.samplerate == samplerate
+		assert info.frames == len(data)
+		assert info.itemsize == data.dtype.itemsize
+		assert info.is_float
+
+
+@pytest.mark.parametrize('dtype, format_tag', [(np.int16, WAVE_FORMAT_PCM), (np.float32, WAVE_FORMAT_IEEE_FLOAT)])
+def test_read_wav_info_formats(tmp_path, dtype, format_tag):
+	filename = str(tmp_path / 'sample.wav')
+	wavfile.write(filename, 8000, np.zeros((1000, 2), dtype=dtype))
+	info = read_wav_info(filename)
+	assert (info.samplerate, info.channels, info.frames, info.format_tag) == (8000, 2, 1000, format_tag)
+	assert info.duration == 0.125
+
+
+def test_read_wav_info_invalid(tmp_path):
+	filename = tmp_path / 'sample.wav'
+	filename.write_bytes(b'not a wav file')
+	with pytest.raises(ValueError):
+		read_wav_info(str(filename))
+
+
+@pytest.mark.parametrize('content', [b'RIFF', b'RIFF\x24\0\0\0WAVEfmt \x10\0\0\0\x01\0\x01\0'])
+def test_read_wav_info_truncated(tmp_path, content):
+	filename = tmp_path / 'sample.wav'
+	filename.write_bytes(content)
+	with pytest.raises(ValueError):
+		read_wav_info(str(filename))
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.int32, np.float32, np.float64])
+def test_create_wav_header(tmp_path, dtype):
+	filename = str(tmp_path / 'sample.wav')
+	data = (np.random.default_rng(0).normal(size=(1001, 3)) * 1000).astype(dtype)
+	cues = create_cue_chunks([0, 500], ['start', 'middle'])
+	with open(filename, 'wb') as file:
+		file.write(create_wav_header(8000, data.dtype, 3, 1001, len(cues)) + data.tobytes())
+		file.write(b'\0' * (data.nbytes % 2) + cues)
+	with pytest.warns(wavfile.WavFileWarning):
+		samplerate, read = wavfile.read(filename)
+	assert samplerate == 8000
+	np.testing.assert_array_equal(read, data)
+	assert read_wav_info(filename).frames == 1001
+
+
+def write_mics(folder, name, lengths, samplerate=8000, dtype=np.float32, channels=1) -> [str]:
+	files = []
+	for mic, length in enumerate(lengths, 1):
+		filename = str(folder / f'{name} MIC{mic}.wav')
+		wavfile.write(filename, samplerate, np.zeros((length, channels) if channels > 1 else length, dtype=dtype))
+		files.append(filename)
+	return files
+
+
+def test_check_wav_files(tmp_path):
+	c_files = write_mics(tmp_path, 'C', [8000, 8000])
+	ref_files = write_mics(tmp_path, 'REF', [8000, 8004])
+	check = check_wav_files(c_files, ref_files)
+	assert check.ok
+	assert check.frames == 8000
+	assert [info.frames for info in check.infos] == [8000, 8000, 8000, 8004]
+	assert check.warnings == ['REF MIC2.wav is 0.5ms longer than the shortest recording, its last 4 samples are not '
+							  'analyzed']
+
+
+def test_check_wav_files_errors(tmp_path):
+	c_files = write_mics(tmp_path, 'C', [8000, 8000], samplerate=16000)
+	ref_files = write_mics(tmp_path, 'REF', [8000, 8000], dtype=np.int16) + [str(tmp_path / 'missing.wav')]
+	check = check_wav_files(c_files, ref_files)
+	assert not check.ok
+	assert check.infos[-1] is None
+	assert check.errors[0].startswith(f'{ref_files[-1]} can not be read')
+	assert check.errors[1:] == [
+		'2 C files and 3 REF files, every microphone needs both',
+		'recordings have different sample rates: 16000Hz (C MIC1.wav, C MIC2.wav); 8000Hz (REF MIC1.wav, REF MIC2.wav)',
+		'recordings have different sample formats: 32 bit float (C MIC1.wav, C MIC2.wav); 16 bit int (REF MIC1.wav, '
+		'REF MIC2.wav)',
+	]
+	assert check.format().splitlines()[1] == 'Error: 2 C files and 3 REF files, every microphone needs both'
+
+	c_files = write_mics(tmp_path, 'stereo', [8000], channels=2)
+	ref_files = write_mics(tmp_path, 'long', [24000])
+	assert check_wav_files(c_files, ref_files).errors == [
+		'stereo MIC1.wav has 2 channels, every microphone must be a mono file',
+		'long MIC1.wav is 2000.0ms longer than the shortest recording',
+	]
+
+
+# Offsets of the channel count, sample rate and block align in the header
+@pytest.mark.parametrize('offset, size', [(22, 2), (24, 4), (32, 2)])
+def test_read_wav_info_zero_fields(tmp_path, offset, size):
+	header = bytearray(create_wav_header(8000, np.int16, 1, 10))
+	header[offset:offset + size] = bytes(size)
+	filename = str(tmp_path / 'sample.wav')
+	with open(filename, 'wb') as file:
+		file.write(header + bytes(20))
+	with pytest.raises(ValueError):
+		read_wav_info(filename)
+	check = check_wav_files([filename], [filename])
+	assert not check.ok and check.errors[0].startswith(f'{filename} can not be read')
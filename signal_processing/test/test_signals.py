@@ -38,3 +38,12 @@ def test_signal_set_differences():
 	s_sum236 = signals.signal_sum(signal_s.mic_signals[1], signal_s.mic_signals[2], signal_s.mic_signals[5])
 	diff236 = signals.signal_diff(s_sum236, ref_sum236)
 	assert diffs[23] == diff236
+
+
+def test_combinations_are_trimmed():
+	c_signal, ref_signal = SignalRecording(['c1', 'c2']), SignalRecording(['ref1', 'ref2'])
+	c_signal.mic_signals = [signals.Signal(8000, np.ones(100)), signals.Signal(8000, np.ones(102))]
+	ref_signal.mic_signals = [signals.Signal(8000, np.ones(101)), signals.Signal(8000, np.ones(100))]
+	s1_sums, s2_sums, sd1, sd2 = create_signal_combinations(c_signal, ref_signal)
+	assert {signal.length for sums in (s1_sums, s2_sums, sd1, sd2) for signal in sums} == {100}
+	np.testing.assert_array_equal(sd1[-1].data, np.zeros(100))
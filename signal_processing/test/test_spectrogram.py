@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from signal_processing import fft
+from signal_processing.signals import Signal
+from signal_processing.spectrogram import create_spectrogram
+
+
+def chirp_signal(samplerate=8000, seconds=4):
+	# Tone that moves from 200 Hz to 600 Hz halfway through
+	t = np.arange(samplerate * seconds) / samplerate
+	frequency = np.where(t < seconds / 2, 200, 600)
+	return Signal(samplerate, np.sin(2 * np.pi * frequency * t).astype(np.float32))
+
+
+def test_spectrogram_follows_tone():
+	spectrogram = create_spectrogram(chirp_signal(), 1024, 256, (100, 1000))
+	assert spectrogram.db.shape == (len(spectrogram.times), len(spectrogram.frequency))
+	assert spectrogram.frequency[0] >= 100 and spectrogram.frequency[-1] <= 1000
+	peaks = spectrogram.frequency[np.argmax(spectrogram.db, axis=1)]
+	assert peaks[0] == pytest.approx(200, abs=8)
+	assert peaks[-1] == pytest.approx(600, abs=8)
+
+
+def test_frames_match_fft():
+	signal = chirp_signal()
+	spectrogram = create_spectrogram(signal, 1024, 512, (0, 4000))
+	frame = Signal(signal.samplerate, signal.data[512 * 3:512 * 3 + 1024])
+	np.testing.assert_allclose(spectrogram.db[3], fft.create_fft(frame).plot, atol=1e-3)
+	assert spectrogram.times[3] == pytest.approx((512 * 3 + 512) / signal.samplerate)
+
+
+def test_short_signal():
+	with pytest.raises(ValueError):
+		create_spectrogram(Signal(8000, np.zeros(100)), 1024, 256, (100, 1000))